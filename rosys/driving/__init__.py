@@ -1,3 +1,4 @@
+from .control_loop import ControlLoop, ControlLoopStats
 from .drivable import Drivable
 from .driver import Driver, DrivingAbortedException
 from .driver_object import DriverObject as driver_object
@@ -5,15 +6,19 @@ from .joystick_ import Joystick as joystick
 from .keyboard_control_ import KeyboardControl as keyboard_control
 from .odometer import Odometer, VelocityProvider
 from .path_segment import PathSegment
+from .pose_history import PoseHistory
 from .robot_object_ import RobotObject as robot_object
 from .steerer import Steerer
 
 __all__ = [
+    'ControlLoop',
+    'ControlLoopStats',
     'Drivable',
     'Driver',
     'DrivingAbortedException',
     'Odometer',
     'PathSegment',
+    'PoseHistory',
     'Steerer',
     'VelocityProvider',
     'driver_object',
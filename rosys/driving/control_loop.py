@@ -0,0 +1,57 @@
+import time
+from dataclasses import dataclass
+
+from .. import rosys
+
+
+@dataclass(slots=True, kw_only=True)
+class ControlLoopStats:
+    """Timing statistics of a control loop."""
+    num_iterations: int = 0
+    compute_time: float = 0.0
+    """processing time of the last iteration (seconds, wall clock)"""
+    mean_compute_time: float = 0.0
+    """mean processing time of all iterations (seconds, wall clock)"""
+    max_compute_time: float = 0.0
+    """maximum processing time of all iterations (seconds, wall clock)"""
+    jitter: float = 0.0
+    """mean absolute deviation of the loop periods from the interval (seconds)"""
+    missed_deadlines: int = 0
+    """number of iterations which ended after the next one should have started"""
+
+
+class ControlLoop:
+    """A loop running at a fixed interval and collecting timing statistics.
+
+    In contrast to sleeping for the interval after each iteration,
+    the loop waits until the next deadline so that the processing time does not stretch the period.
+    If an iteration misses its deadline, the loop continues immediately and schedules the following deadlines from there.
+    """
+
+    def __init__(self, interval: float, stats: ControlLoopStats | None = None) -> None:
+        self.interval = interval
+        self.stats = stats if stats is not None else ControlLoopStats()
+        self._start = rosys.time()
+        self._compute_start = time.perf_counter()
+
+    async def wait(self) -> None:
+        """Wait for the next iteration and record the timing of the current one."""
+        compute_time = time.perf_counter() - self._compute_start
+        now = rosys.time()
+        deadline = self._start + self.interval
+        missed = now > deadline
+
+        stats = self.stats
+        stats.num_iterations += 1
+        stats.compute_time = compute_time
+        stats.mean_compute_time += (compute_time - stats.mean_compute_time) / stats.num_iterations
+        stats.max_compute_time = max(stats.max_compute_time, compute_time)
+        if missed:
+            stats.missed_deadlines += 1
+
+        await rosys.sleep(max(deadline - now, 0.0))
+
+        start = rosys.time()
+        stats.jitter += (abs(start - self._start - self.interval) - stats.jitter) / stats.num_iterations
+        self._start = start
+        self._compute_start = time.perf_counter()
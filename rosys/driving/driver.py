@@ -1,3 +1,4 @@
+import math
 from dataclasses import dataclass, field
 from typing import Protocol
 
@@ -7,6 +8,7 @@ from .. import rosys
 from ..analysis import track
 from ..geometry import Point, Pose, Spline
 from ..helpers import ModificationContext, eliminate_2pi, eliminate_pi, ramp
+from .control_loop import ControlLoop, ControlLoopStats
 from .drivable import Drivable
 from .odometer import Odometer
 from .path_segment import PathSegment
@@ -23,6 +25,10 @@ class DriveParameters(ModificationContext):
     carrot_offset: float = 0.6
     carrot_distance: float = 0.1
     hook_bending_factor: float = 0
+    control_interval: float = 0.1
+    """time between two drive commands (seconds)"""
+    steering_interval: float = 0.05
+    """time between two drive commands of a steerer using these parameters (seconds)"""
 
 
 @dataclass(slots=True, kw_only=True)
@@ -50,6 +56,7 @@ class Driver:
     It requires a wheels module (or any drivable hardware representation) to execute individual drive commands.
     It also requires an odometer to get a current prediction of the robot's pose.
     Its `parameters` allow controlling the specific drive behavior.
+    Timing statistics of the control loops are collected in `loop_stats`.
     """
 
     def __init__(self, wheels: Drivable, odometer: Odometer | PoseProvider) -> None:
@@ -57,6 +64,7 @@ class Driver:
         self.odometer = odometer
         self.parameters = DriveParameters()
         self.state: DriveState | None = None
+        self.loop_stats = ControlLoopStats()
         self._abort = False
 
     @property
@@ -129,6 +137,7 @@ class Driver:
         :param stop_at_end: Whether to stop the robot at the end of the circular path (default: ``False``).
         :raises: DrivingAbortedException: If the driving process is aborted.
         """
+        loop = ControlLoop(self.parameters.control_interval, self.loop_stats)
         while True:
             if self._abort:
                 self._abort = False
@@ -145,7 +154,7 @@ class Driver:
                 sign *= -1
             angular = linear / self.parameters.minimum_turning_radius * sign
             await self.wheels.drive(*self._throttle(linear, angular))
-            await rosys.sleep(0.1)
+            await loop.wait()
         if stop_at_end:
             await self.wheels.stop()
 
@@ -166,49 +175,57 @@ class Driver:
         if spline.start.distance(spline.end) < 0.01:
             return  # NOTE: skip tiny splines
 
-        hook_offset = Point(x=self.parameters.hook_offset, y=0) * (-1 if flip_hook else 1)
+        hook_offset = self.parameters.hook_offset * (-1 if flip_hook else 1)
         carrot_offset = Point(x=self.parameters.carrot_offset, y=0)
         carrot = Carrot(spline=spline, offset=carrot_offset)
+        end_pose = spline.pose(1.0)
+        t: float | None = None
 
+        loop = ControlLoop(self.parameters.control_interval, self.loop_stats)
         while True:
             if self._abort:
                 self._abort = False
                 raise DrivingAbortedException()
+            prediction = self.prediction
             velocity = self.odometer.current_velocity if isinstance(self.odometer, Odometer) else None
             dYaw = self.parameters.hook_bending_factor * velocity.angular if velocity else 0
-            hook = self.prediction.transform_pose(Pose(yaw=dYaw)).transform(hook_offset)
+            hook = Point(x=prediction.x + hook_offset * math.cos(prediction.yaw + dYaw),
+                         y=prediction.y + hook_offset * math.sin(prediction.yaw + dYaw))
             if self.parameters.can_drive_backwards:
                 can_move = carrot.move(hook, distance=self.parameters.carrot_distance)
             else:
-                can_move = carrot.move_by_foot(self.prediction)
+                can_move = carrot.move_by_foot(prediction)
             if not can_move:
                 break
 
-            turn_angle = eliminate_pi(hook.direction(carrot.offset_point) - self.prediction.yaw)
-            curvature = np.tan(turn_angle) / hook_offset.x
+            carrot_pose = carrot.pose
+            carrot_dx = carrot_pose.x + carrot_offset.x * math.cos(carrot_pose.yaw) - hook.x
+            carrot_dy = carrot_pose.y + carrot_offset.x * math.sin(carrot_pose.yaw) - hook.y
+            turn_angle = eliminate_pi(math.atan2(carrot_dy, carrot_dx) - prediction.yaw)
+            curvature = math.tan(turn_angle) / hook_offset
             if curvature != 0 and abs(1 / curvature) < self.parameters.minimum_turning_radius:
                 curvature = (-1 if curvature < 0 else 1) / self.parameters.minimum_turning_radius
 
-            drive_backward = hook.projected_distance(carrot.offset_point, self.prediction.yaw) < 0
+            drive_backward = carrot_dx * math.cos(prediction.yaw) + carrot_dy * math.sin(prediction.yaw) < 0
             if drive_backward and not self.parameters.can_drive_backwards:
                 drive_backward = False
                 curvature = (-1 if curvature > 0 else 1) / max(self.parameters.minimum_turning_radius, 0.001)
             linear: float = -1 if drive_backward else 1
-            t = spline.closest_point(hook.x, hook.y)
+            t = spline.closest_point(hook.x, hook.y, t_start=t)
             if t >= 1.0 and throttle_at_end:
-                target_distance = self.prediction.projected_distance(spline.pose(1.0))
+                target_distance = prediction.projected_distance(end_pose)
                 linear *= ramp(target_distance, self.parameters.hook_offset, 0.0, 1.0, 0.01, clip=True)
             angular = linear * curvature
 
             self.state = DriveState(
-                carrot_pose=carrot.pose,
+                carrot_pose=carrot_pose,
                 curvature=curvature,
                 backward=drive_backward,
                 turn_angle=turn_angle,
             )
 
             await self.wheels.drive(*self._throttle(linear, angular))
-            await rosys.sleep(0.1)
+            await loop.wait()
 
         self.state = None
         if stop_at_end:
@@ -245,15 +262,17 @@ class Driver:
         return ramp(age, age_ramp[0], age_ramp[1], 1.0, 0.0, clip=True)
 
 
+CARROT_STEPS = 16
+"""Number of carrot steps evaluated at once when moving the carrot (doubled for every further batch)."""
+
+
 @dataclass(slots=True, kw_only=True)
 class Carrot:
     spline: Spline
     offset: Point = field(default_factory=lambda: Point(x=0, y=0))
     t: float = 0
-    _estimated_spline_length: float = field(init=False)
-
-    def __post_init__(self) -> None:
-        self._estimated_spline_length = self.spline.estimated_length()  # NOTE: compute once to avoid repeated computation
+    _step: float = field(default=0.0, init=False, repr=False)
+    _table: np.ndarray = field(default_factory=lambda: np.zeros((3, 0)), init=False, repr=False)
 
     @property
     def pose(self) -> Pose:
@@ -270,13 +289,46 @@ class Carrot:
         return self.pose.transform(self.offset)
 
     def move(self, hook: Point, distance: float) -> bool:
-        dt = 0.1 * distance / self._estimated_spline_length
-        while hook.distance(self.offset_point) < distance:
-            self.t += dt
-            if self.t >= 1.0:
-                return False
-        return True
+        """Move the carrot in steps of a tenth of the distance until its offset point is far enough from the hook.
+
+        The steps are equidistant along the spline.
+        Their parameters and offset points are computed once per step size and searched in growing batches.
+
+        :return: whether the carrot is still on the spline
+        """
+        if hook.distance(self.offset_point) >= distance:
+            return True
+        table = self._offset_table(0.1 * distance)
+        start = int(np.searchsorted(table[0], self.t, side='right'))
+        size = CARROT_STEPS
+        while start < table.shape[1]:
+            far = np.flatnonzero(np.hypot(table[1, start:start+size] - hook.x,
+                                          table[2, start:start+size] - hook.y) >= distance)
+            if len(far):
+                self.t = float(table[0, start + far[0]])
+                return True
+            start += size
+            size *= 2
+        self.t = 1.0
+        return False
+
+    def _offset_table(self, step: float) -> np.ndarray:
+        """Get the parameters (first row) and offset points (second and third row) at equidistant arc lengths.
+
+        The last entry lies before the end of the spline.
+        """
+        if step != self._step:
+            t = self.spline.parameter_at(np.arange(0, self.spline.arc_length(1.0), step))
+            t = t[t < 1.0]
+            gx = self.spline.gx(t)
+            gy = self.spline.gy(t)
+            norm = np.hypot(gx, gy)
+            x = self.spline.x(t) + (gx * self.offset.x - gy * self.offset.y) / norm
+            y = self.spline.y(t) + (gy * self.offset.x + gx * self.offset.y) / norm
+            self._step = step
+            self._table = np.vstack((t, x, y))
+        return self._table
 
     def move_by_foot(self, pose: Pose) -> bool:
-        self.t = self.spline.closest_point(pose.x, pose.y, t_min=self.t, t_max=1.0)
+        self.t = self.spline.closest_point(pose.x, pose.y, t_min=self.t, t_max=1.0, t_start=self.t)
         return self.t < 1.0
@@ -1,10 +1,17 @@
 import logging
+import math
 from copy import deepcopy
 from typing import Protocol
 
+import numpy as np
+
 from .. import rosys
 from ..event import Event
-from ..geometry import Pose, Pose3d, PoseStep, Rotation, Velocity
+from ..geometry import Pose, Pose3d, Rotation, Velocity
+from .pose_history import PoseHistory
+
+VECTORIZATION_THRESHOLD = 50
+"""Minimum number of velocities to integrate with NumPy instead of one by one."""
 
 
 class VelocityProvider(Protocol):
@@ -17,7 +24,8 @@ class Odometer:
     It can also handle "detections", i.e. absolute pose information with timestamps.
     Given the history of previously received velocities, it can update its prediction of the current pose.
 
-    The `get_pose` method provides robot poses from the within the last 10 seconds.
+    The `get_pose` method provides robot poses from the within the last 10 seconds,
+    `get_poses` does the same for many points in time at once.
     """
 
     def __init__(self, wheels: VelocityProvider) -> None:
@@ -35,34 +43,73 @@ class Odometer:
         self.detection: Pose | None = None
         self.current_velocity: Velocity | None = None
         self.last_movement: float = 0
-        self.history: list[Pose] = []
+        self.history = PoseHistory()
         self.odometry_frame: Pose = Pose()
 
         rosys.on_repeat(self.prune_history, 1.0)
 
     def handle_velocities(self, velocities: list[Velocity]) -> None:
-        robot_moved: bool = False
-        for velocity in velocities:
-            if not self.history:
-                self.history.append(Pose(time=velocity.time))
-                continue
-
-            dt = velocity.time - self.history[-1].time
-            step = PoseStep(linear=dt*velocity.linear, angular=dt*velocity.angular, time=velocity.time)
-            self.history.append(self.history[-1] + step)
-
-            if step.linear or step.angular:
-                robot_moved = True
+        samples = velocities
+        if samples and not self.history:
+            self.history.append(samples[0].time, 0, 0, 0)
+            samples = samples[1:]
+        if len(samples) >= VECTORIZATION_THRESHOLD:
+            robot_moved = self._integrate_batch(samples)
+        else:
+            robot_moved = self._integrate(samples)
 
         if self.history:
             self.prediction = self.odometry_frame.transform_pose(self.history[-1])
         if velocities:
             self.current_velocity = velocities[-1]
         if robot_moved:
-            self.last_movement = step.time
+            self.last_movement = velocities[-1].time
             self._handle_movement()
             self.WHEELS_TURNED.emit()
 
+    def _integrate(self, velocities: list[Velocity]) -> bool:
+        """Append the poses reached with the given velocities to the history.
+
+        Assuming constant velocities between two samples, the robot moves along circular arcs.
+        Their chords point halfway between the start and end yaw and are shortened by sinc(turn / 2).
+
+        :return: whether the robot moved
+        """
+        robot_moved = False
+        if not velocities:
+            return robot_moved
+        time, x, y, yaw = self.history.rows[-1].tolist()
+        for velocity in velocities:
+            dt = velocity.time - time
+            distance = dt * velocity.linear
+            half_turn = dt * velocity.angular / 2
+            chord = distance * math.sin(half_turn) / half_turn if half_turn else distance
+            x += chord * math.cos(yaw + half_turn)
+            y += chord * math.sin(yaw + half_turn)
+            yaw += 2 * half_turn
+            time = velocity.time
+            self.history.append(time, x, y, yaw)
+            if distance or half_turn:
+                robot_moved = True
+        return robot_moved
+
+    def _integrate_batch(self, velocities: list[Velocity]) -> bool:
+        """Like `_integrate`, but vectorized with cumulative sums over the batch."""
+        times, linear, angular = np.array([(v.time, v.linear, v.angular) for v in velocities]).T
+        time, x, y, yaw = self.history.rows[-1]
+        dt = np.diff(times, prepend=time)
+        distances = dt * linear
+        turns = dt * angular
+        yaws = yaw + np.cumsum(turns)
+        chords = distances * np.sinc(turns / (2 * np.pi))
+        self.history.extend(np.column_stack((
+            times,
+            x + np.cumsum(chords * np.cos(yaws - turns / 2)),
+            y + np.cumsum(chords * np.sin(yaws - turns / 2)),
+            yaws,
+        )))
+        return bool(distances.any() or turns.any())
+
     def handle_detection(self, detection: Pose) -> None:
         self.detection = detection
 
@@ -76,24 +123,46 @@ class Odometer:
     def _handle_movement(self) -> None:
         self.prediction_frame.x = self.prediction.x
         self.prediction_frame.y = self.prediction.y
-        self.prediction_frame.rotation = Rotation.from_euler(0, 0, self.prediction.yaw)
+        cos, sin = math.cos(self.prediction.yaw), math.sin(self.prediction.yaw)
+        self.prediction_frame.rotation = Rotation(R=[[cos, -sin, 0.0], [sin, cos, 0.0], [0.0, 0.0, 1.0]])
         self.PREDICTION_UPDATED.emit()
 
     def prune_history(self, max_age: float = 10.0) -> None:
-        cut_off_time = rosys.time() - max_age
-        while self.history and self.history[0].time <= cut_off_time:
-            del self.history[0]
+        self.history.prune(rosys.time() - max_age)
 
     def get_pose(self, time: float, local: bool = False) -> Pose:
-        for i in range(1, len(self.history)):
-            if self.history[i-1].time <= time < self.history[i].time:
-                f = (time - self.history[i-1].time) / (self.history[i].time - self.history[i-1].time)
-                local_pose = self.history[i-1].interpolate(self.history[i], f)
-                return local_pose if local else self.odometry_frame.transform_pose(local_pose)
+        rows, valid = self.history.interpolate(np.array([time]))
+        if valid[0]:
+            local_pose = Pose(x=float(rows[0, 1]), y=float(rows[0, 2]), yaw=float(rows[0, 3]), time=float(rows[0, 0]))
+            return local_pose if local else self.odometry_frame.transform_pose(local_pose)
         if local:
-            return deepcopy(self.history[-1])
+            return self.history[-1]
         return Pose(x=self.prediction.x, y=self.prediction.y, yaw=self.prediction.yaw, time=time)
 
+    def get_poses(self, times: np.ndarray, local: bool = False) -> np.ndarray:
+        """Get the poses at many points in time like `get_pose`.
+
+        :param times: the points in time
+        :param local: whether to return poses in the odometry frame instead of the global frame
+        :return: an array with rows of time, x, y and yaw
+        """
+        times = np.asarray(times, dtype=float)
+        rows, valid = self.history.interpolate(times)
+        if not local:
+            frame = self.odometry_frame
+            cos, sin = np.cos(frame.yaw), np.sin(frame.yaw)
+            rows = np.column_stack((
+                rows[:, 0],
+                frame.x + rows[:, 1] * cos - rows[:, 2] * sin,
+                frame.y + rows[:, 1] * sin + rows[:, 2] * cos,
+                frame.yaw + rows[:, 3],
+            ))
+            rows[~valid, 0] = times[~valid]
+            rows[~valid, 1:] = self.prediction.x, self.prediction.y, self.prediction.yaw
+        elif not valid.all():
+            rows[~valid] = self.history.rows[-1]
+        return rows
+
     @staticmethod
     def _compute_odometry_frame(local_pose: Pose, global_pose: Pose) -> Pose:
         frame = Pose.from_matrix(global_pose.matrix @ local_pose.inv_matrix)
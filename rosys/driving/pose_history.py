@@ -0,0 +1,101 @@
+from typing import overload
+
+import numpy as np
+
+from ..geometry import Pose
+
+HISTORY_CAPACITY = 10_000
+"""Default maximum number of poses of a pose history (e.g. 100 s of wheel data at 100 Hz)."""
+
+
+class PoseHistory:
+    """A fixed-capacity buffer of timestamped poses, appended in chronological order.
+
+    The poses are stored as rows of time, x, y and yaw in an array of twice the capacity,
+    so that the stored rows are always contiguous and sorted by time.
+    When reaching the end of the array, the rows are moved to the front.
+    When exceeding the capacity, the oldest pose is dropped.
+    Like the list of poses it replaces, it supports ``len()``, indexing, slicing and iteration, returning ``Pose`` objects.
+    """
+
+    def __init__(self, capacity: int = HISTORY_CAPACITY) -> None:
+        self.capacity = capacity
+        self._buffer = np.empty((2 * capacity, 4))
+        self._start = 0
+        self._end = 0
+
+    @property
+    def rows(self) -> np.ndarray:
+        """Read-only view of the stored rows (time, x, y, yaw)."""
+        rows = self._buffer[self._start:self._end]
+        rows.flags.writeable = False
+        return rows
+
+    @property
+    def times(self) -> np.ndarray:
+        return self.rows[:, 0]
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    @overload
+    def __getitem__(self, index: int) -> Pose: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[Pose]: ...
+
+    def __getitem__(self, index: int | slice) -> Pose | list[Pose]:
+        if isinstance(index, slice):
+            return [_to_pose(row) for row in self.rows[index]]
+        return _to_pose(self.rows[index])
+
+    def append(self, time: float, x: float, y: float, yaw: float) -> None:
+        if self._end - self._start == self.capacity:
+            self._start += 1
+        if self._end == len(self._buffer):
+            self._buffer[:self._end - self._start] = self._buffer[self._start:self._end]
+            self._end -= self._start
+            self._start = 0
+        self._buffer[self._end] = time, x, y, yaw
+        self._end += 1
+
+    def extend(self, rows: np.ndarray) -> None:
+        """Append many rows (time, x, y, yaw) at once."""
+        rows = rows[-self.capacity:]
+        self._start += max(len(self) + len(rows) - self.capacity, 0)
+        if self._end + len(rows) > len(self._buffer):
+            self._buffer[:self._end - self._start] = self._buffer[self._start:self._end]
+            self._end -= self._start
+            self._start = 0
+        self._buffer[self._end:self._end + len(rows)] = rows
+        self._end += len(rows)
+
+    def prune(self, cut_off_time: float) -> None:
+        """Remove all poses up to the given time."""
+        self._start += int(np.searchsorted(self.times, cut_off_time, side='right'))
+
+    def clear(self) -> None:
+        self._start = 0
+        self._end = 0
+
+    def interpolate(self, times: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Linearly interpolate the poses at the given times.
+
+        :return: the interpolated rows (time, x, y, yaw) and a mask of the times within the covered time span
+        """
+        rows = self.rows
+        i = np.searchsorted(rows[:, 0], times, side='right')
+        valid = (i >= 1) & (i < len(rows))
+        i = np.clip(i, 1, max(len(rows) - 1, 1))
+        if len(rows) < 2:
+            return np.zeros((len(times), 4)), valid
+        a = rows[i - 1]
+        b = rows[i]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            f = ((times - a[:, 0]) / (b[:, 0] - a[:, 0]))[:, None]
+        return (1 - f) * a + f * b, valid
+
+
+def _to_pose(row: np.ndarray) -> Pose:
+    time, x, y, yaw = row
+    return Pose(x=float(x), y=float(y), yaw=float(yaw), time=float(time))
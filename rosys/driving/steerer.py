@@ -5,6 +5,7 @@ from rosys.event import Event
 
 from .. import rosys
 from .drivable import Drivable
+from .driver import DriveParameters
 
 
 class State(Enum):
@@ -18,9 +19,11 @@ class Steerer:
 
     The wheels module can be any drivable hardware representation.
     Changing the steering state emits events that can be used to react to manual user interaction.
+    Drive commands are sent every `steering_interval` seconds of the given drive parameters (e.g. those of the driver).
     """
 
-    def __init__(self, wheels: Drivable, speed_scaling: float = 1.0) -> None:
+    def __init__(self, wheels: Drivable, speed_scaling: float = 1.0, *,
+                 parameters: DriveParameters | None = None) -> None:
         self.STEERING_STARTED = Event()
         """steering has started"""
 
@@ -31,11 +34,12 @@ class Steerer:
 
         self.wheels = wheels
         self.speed_scaling = speed_scaling
+        self.parameters = parameters or DriveParameters()
         self.state = State.IDLE
         self.linear_speed = 0.0
         self.angular_speed = 0.0
 
-        rosys.on_repeat(self.step, 0.05)
+        rosys.on_repeat(self.step, self.parameters.steering_interval)
 
     def start(self) -> None:
         self.log.info('start steering')
@@ -11,6 +11,7 @@ from .prism import Prism
 from .rectangle import Rectangle
 from .rotation import Rotation
 from .spline import Spline
+from .spline_batch import SplineBatch
 from .velocity import Velocity
 
 __all__ = [
@@ -32,5 +33,6 @@ __all__ = [
     'Rectangle',
     'Rotation',
     'Spline',
+    'SplineBatch',
     'Velocity',
 ]
@@ -1,13 +1,19 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import overload
+from dataclasses import dataclass, field, fields
+from typing import Any, overload
 
 import numpy as np
+from dataclasses_json import Exclude, config
 
 from .point import Point
 from .pose import Pose
 
+ARC_LENGTH_STEPS = 100
+"""Number of intervals of the arc-length tables of splines."""
+CLOSEST_POINT_ITERATIONS = 5
+"""Maximum number of Newton steps of warm-started closest-point queries before solving the full polynomial."""
+
 
 @dataclass(slots=True, kw_only=True)
 class Spline:
@@ -32,6 +38,9 @@ class Spline:
     q: float = 0
     r: float = 0
 
+    _arc_length_table: np.ndarray | None = field(default=None, init=False, repr=False, compare=False,
+                                                 metadata=config(exclude=Exclude.ALWAYS))
+
     def __post_init__(self) -> None:
         self.a = self.start.x
         self.e = self.start.y
@@ -49,6 +58,15 @@ class Spline:
         self.q = self.g - 2 * self.f + self.e
         self.r = self.f - self.e
 
+    def __getstate__(self) -> dict[str, Any]:
+        # NOTE: the arc-length table is a cache which is rebuilt when needed, so it is not pickled
+        return {f.name: getattr(self, f.name) for f in fields(self) if f.name != '_arc_length_table'}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
+        self._arc_length_table = None
+
     def __repr__(self) -> str:
         return f'{type(self).__qualname__}(' + ' ~ '.join([
             f'{self.start.x:.3f},{self.start.y:.3f}',
@@ -190,7 +208,17 @@ class Spline:
         idx = np.argmax(np.abs(k))
         return k[idx]
 
-    def closest_point(self, x: float, y: float, t_min: float = 0.0, t_max: float = 1.0) -> float:
+    def closest_point(self, x: float, y: float, t_min: float = 0.0, t_max: float = 1.0, *,
+                      t_start: float | None = None) -> float:
+        """Find the parameter of the spline point closest to the given point.
+
+        :param t_start: parameter to warm-start a few Newton steps from (e.g. the result of the previous query);
+                        the full polynomial is solved if they do not converge to a local minimum
+        """
+        if t_start is not None:
+            t_newton = self._closest_point_newton(x, y, t_start, t_min, t_max)
+            if t_newton is not None:
+                return t_newton
         poly = [
             6 * self.h**2 + ((-36 * self.g) + 36 * self.f - 12 * self.e) * self.h + 54 * self.g**2 + (36 * self.e - 108 * self.f) * self.g + 54 * self.f**2 - 36 * self.e * self.f + 6 * self.e**2 +
             6 * self.d**2 + ((-36 * self.c) + 36 * self.b - 12 * self.a) * self.d + 54 * self.c**2 +
@@ -218,6 +246,28 @@ class Spline:
 
         return np.real(t[np.argmin(sqr_d)])
 
+    def _closest_point_newton(self, x: float, y: float, t: float, t_min: float, t_max: float) -> float | None:
+        t = min(max(t, t_min), t_max)
+        for _ in range(CLOSEST_POINT_ITERATIONS):
+            dx = self.x(t) - x
+            dy = self.y(t) - y
+            gx = self.gx(t)
+            gy = self.gy(t)
+            slope = dx * gx + dy * gy
+            convexity = gx**2 + gy**2 + dx * self.ggx(t) + dy * self.ggy(t)
+            if convexity <= 0:
+                return None
+            new_t = min(max(t - slope / convexity, t_min), t_max)
+            if abs(new_t - t) < 1e-9:
+                break
+            t = new_t
+        else:
+            return None
+        # NOTE: the interval bounds might be closer than the local minimum
+        candidates = [t, t_min, t_max]
+        sqr_d = [(self.x(t_) - x)**2 + (self.y(t_) - y)**2 for t_ in candidates]
+        return float(candidates[int(np.argmin(sqr_d))])
+
     def turning_points(self, t_min: float = 0.0, t_max: float = 1.0) -> np.ndarray:
         inner = self.m**2 * self.r**2 + ((4 * self.n**2 - 2 * self.m * self.o) * self.p - 4 * self.m * self.n * self.q) * \
             self.r + 4 * self.m * self.o * self.q**2 - 4 * self.n * self.o * self.p * self.q + self.o**2 * self.p**2
@@ -235,6 +285,37 @@ class Spline:
         return np.array([t_ for t_ in t if t_min <= t_ <= t_max])
 
     def estimated_length(self, steps: int = 10) -> float:
-        dx = np.diff([self.x(t) for t in np.linspace(0, 1, steps)])
-        dy = np.diff([self.y(t) for t in np.linspace(0, 1, steps)])
+        t = np.linspace(0, 1, steps)
+        dx = np.diff(self.x(t))
+        dy = np.diff(self.y(t))
         return np.sum(np.sqrt(dx**2 + dy**2))
+
+    @overload
+    def arc_length(self, t: float) -> float: ...
+
+    @overload
+    def arc_length(self, t: np.ndarray) -> np.ndarray: ...
+
+    def arc_length(self, t: float | np.ndarray) -> float | np.ndarray:
+        """Approximate the arc length from the start to the given parameter using the arc-length table."""
+        table = self._arc_lengths()
+        return np.interp(t, table[0], table[1])
+
+    @overload
+    def parameter_at(self, length: float) -> float: ...
+
+    @overload
+    def parameter_at(self, length: np.ndarray) -> np.ndarray: ...
+
+    def parameter_at(self, length: float | np.ndarray) -> float | np.ndarray:
+        """Approximate the parameter at the given arc length from the start (clipped to the spline)."""
+        table = self._arc_lengths()
+        return np.interp(length, table[1], table[0])
+
+    def _arc_lengths(self) -> np.ndarray:
+        """Get the lazily built table of parameters (first row) and arc lengths from the start (second row)."""
+        if self._arc_length_table is None:
+            t = np.linspace(0, 1, ARC_LENGTH_STEPS + 1)
+            lengths = np.concatenate(([0], np.cumsum(np.hypot(np.diff(self.x(t)), np.diff(self.y(t))))))
+            self._arc_length_table = np.vstack((t, lengths))
+        return self._arc_length_table
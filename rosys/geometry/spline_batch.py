@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from .point import Point
+from .spline import Spline
+
+if TYPE_CHECKING:
+    from ..driving import PathSegment
+
+
+@dataclass(slots=True, kw_only=True)
+class SplineBatch:
+    """Many cubic Bézier splines stored in contiguous arrays for vectorized evaluation.
+
+    Spline ``i`` has the control points ``points[i]`` (start, control1, control2, end) and the driving direction ``backward[i]``.
+    Parameters ``t`` are scalars or arrays whose first axis enumerates the splines,
+    e.g. shape ``(N,)`` for one parameter per spline or ``(N, k)`` for ``k`` parameters per spline.
+    """
+    points: np.ndarray
+    backward: np.ndarray
+    m: np.ndarray = field(init=False)
+    n: np.ndarray = field(init=False)
+    o: np.ndarray = field(init=False)
+    p: np.ndarray = field(init=False)
+    q: np.ndarray = field(init=False)
+    r: np.ndarray = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.points = np.ascontiguousarray(self.points, dtype=float).reshape(-1, 4, 2)
+        self.backward = np.broadcast_to(np.asarray(self.backward, dtype=bool), len(self.points)).copy()
+        a, b, c, d = self.points[:, :, 0].T
+        e, f, g, h = self.points[:, :, 1].T
+        self.m = d - 3 * c + 3 * b - a
+        self.n = c - 2 * b + a
+        self.o = b - a
+        self.p = h - 3 * g + 3 * f - e
+        self.q = g - 2 * f + e
+        self.r = f - e
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def __getitem__(self, index) -> SplineBatch:
+        """Select splines with an index array, a boolean mask or a slice."""
+        return SplineBatch(points=self.points[index], backward=self.backward[index])
+
+    @staticmethod
+    def from_splines(splines: list[Spline], backward: list[bool] | np.ndarray | bool = False) -> SplineBatch:
+        points = np.array([[s.a, s.e, s.b, s.f, s.c, s.g, s.d, s.h] for s in splines], dtype=float)
+        return SplineBatch(points=points, backward=np.asarray(backward, dtype=bool))
+
+    @staticmethod
+    def from_path(path: list[PathSegment]) -> SplineBatch:
+        return SplineBatch.from_splines([segment.spline for segment in path], [segment.backward for segment in path])
+
+    @staticmethod
+    def from_poses(start: np.ndarray, end: np.ndarray, *, backward: np.ndarray | bool = False) -> SplineBatch:
+        """Generate splines between poses like ``Spline.from_poses`` (with the default control distance).
+
+        :param start: start poses (x, y, yaw) of shape ``(N, 3)``
+        :param end: end poses (x, y, yaw) of shape ``(N, 3)``
+        :param backward: whether the splines move backwards (one flag per spline or for all)
+        """
+        start = np.asarray(start, dtype=float).reshape(-1, 3)
+        end = np.asarray(end, dtype=float).reshape(-1, 3)
+        backward = np.broadcast_to(np.asarray(backward, dtype=bool), len(start))
+        distance = 0.5 * np.sqrt((end[:, 0] - start[:, 0])**2 + (end[:, 1] - start[:, 1])**2) * np.where(backward, -1, 1)
+        points = np.stack((
+            start[:, :2],
+            start[:, :2] + distance[:, None] * np.column_stack((np.cos(start[:, 2]), np.sin(start[:, 2]))),
+            end[:, :2] - distance[:, None] * np.column_stack((np.cos(end[:, 2]), np.sin(end[:, 2]))),
+            end[:, :2],
+        ), axis=1)
+        return SplineBatch(points=points, backward=backward)
+
+    def spline(self, i: int) -> Spline:
+        start, control1, control2, end = (Point(x=float(x), y=float(y)) for x, y in self.points[i])
+        return Spline(start=start, control1=control1, control2=control2, end=end)
+
+    def to_splines(self) -> list[Spline]:
+        return [self.spline(i) for i in range(len(self))]
+
+    def to_path(self) -> list[PathSegment]:
+        # NOTE: imported here because the driving package depends on the geometry package
+        from ..driving import PathSegment  # noqa: PLC0415  # pylint: disable=import-outside-toplevel
+        return [PathSegment(spline=self.spline(i), backward=bool(self.backward[i])) for i in range(len(self))]
+
+    def x(self, t) -> np.ndarray:
+        a, b, c, d = (self._broadcast(self.points[:, i, 0], t) for i in range(4))
+        t = np.asarray(t)
+        return t**3 * d + 3 * t**2 * (1 - t) * c + 3 * t * (1 - t)**2 * b + (1 - t)**3 * a
+
+    def y(self, t) -> np.ndarray:
+        e, f, g, h = (self._broadcast(self.points[:, i, 1], t) for i in range(4))
+        t = np.asarray(t)
+        return t**3 * h + 3 * t**2 * (1 - t) * g + 3 * t * (1 - t)**2 * f + (1 - t)**3 * e
+
+    def gx(self, t) -> np.ndarray:
+        return 3 * (self._broadcast(self.m, t) * np.asarray(t)**2 + 2 * self._broadcast(self.n, t) * t +
+                    self._broadcast(self.o, t))
+
+    def gy(self, t) -> np.ndarray:
+        return 3 * (self._broadcast(self.p, t) * np.asarray(t)**2 + 2 * self._broadcast(self.q, t) * t +
+                    self._broadcast(self.r, t))
+
+    def ggx(self, t) -> np.ndarray:
+        return 6 * (self._broadcast(self.m, t) * t + self._broadcast(self.n, t))
+
+    def ggy(self, t) -> np.ndarray:
+        return 6 * (self._broadcast(self.p, t) * t + self._broadcast(self.q, t))
+
+    def yaw(self, t) -> np.ndarray:
+        return np.arctan2(self.gy(t), self.gx(t))
+
+    def curvature(self, t) -> np.ndarray:
+        x_ = self.gx(t)
+        y_ = self.gy(t)
+        x__ = self.ggx(t)
+        y__ = self.ggy(t)
+        return (x_ * y__ - y_ * x__) / (x_**2 + y_**2)**(3/2)
+
+    def max_curvature(self, t_min: float = 0.0, t_max: float = 1.0) -> np.ndarray:
+        """Signed curvature with the largest magnitude of each spline (see ``Spline.max_curvature``)."""
+        m, n, o, p, q, r = self.m, self.n, self.o, self.p, self.q, self.r
+        poly = np.column_stack([
+            (1296 * m * p ** 2 + 1296 * m ** 3) * q - 1296 * n * p ** 3 - 1296 * m ** 2 * n * p,
+            (1620 * m * p ** 2 + 1620 * m ** 3) * r + 3240 * m * p * q ** 2 + (3240 * m ** 2 * n - 3240 * n * p ** 2) * q -
+            1620 * o * p ** 3 + ((-1620 * m ** 2 * o) - 3240 * m * n ** 2) * p,
+            (5184 * m * p * q + 1296 * n * p ** 2 + 6480 * m ** 2 * n) * r + 1296 * m * q ** 3 - 1296 * n * p * q ** 2 +
+            ((-6480 * o * p ** 2) - 1296 * m ** 2 * o + 1296 * m * n ** 2) * q +
+            ((-5184 * m * n * o) - 1296 * n ** 3) * p,
+            1296 * m * p * r ** 2 +
+            (1944 * m * q ** 2 + 6480 * n * p * q - 1296 * o * p ** 2 + 1296 * m ** 2 * o + 8424 * m * n ** 2) * r -
+            8424 * o * p * q ** 2 - 6480 * m * n * o * q + ((-1296 * m * o ** 2) - 1944 * n ** 2 * o) * p,
+            2592 * n * p * r ** 2 + (3888 * n * q ** 2 - 2592 * o * p * q + 2592 * m * n * o + 3888 * n ** 3) * r -
+            3888 * o * q ** 3 + ((-2592 * m * o ** 2) - 3888 * n ** 2 * o) * q,
+            -324 * m * r ** 3 + (1944 * n * q + 324 * o * p) * r ** 2 +
+            ((-1944 * o * q ** 2) - 324 * m * o ** 2 + 1944 * n ** 2 * o) * r - 1944 * n * o ** 2 * q + 324 * o ** 3 * p,
+        ]).reshape(-1, 6)
+        t = self._candidates(poly, t_min, t_max)
+        k = np.real(self.curvature(t))
+        return k[np.arange(len(self)), np.argmax(np.abs(k), axis=1)]
+
+    def healthy(self, curvature_limit: float = 10.0) -> np.ndarray:
+        """Whether the maximum curvature magnitude of each spline is below the limit (``False`` if it is NaN)."""
+        return np.abs(self.max_curvature()) < curvature_limit
+
+    def closest_point(self, x, y, t_min: float = 0.0, t_max: float = 1.0) -> np.ndarray:
+        """Parameter of the point closest to the given point on each spline (see ``Spline.closest_point``).
+
+        :param x: x coordinate (one per spline or for all)
+        :param y: y coordinate (one per spline or for all)
+        """
+        x = np.broadcast_to(np.asarray(x, dtype=float), len(self))
+        y = np.broadcast_to(np.asarray(y, dtype=float), len(self))
+        a, b, c, d = self.points[:, :, 0].T
+        e, f, g, h = self.points[:, :, 1].T
+        poly = np.column_stack([
+            6 * h**2 + ((-36 * g) + 36 * f - 12 * e) * h + 54 * g**2 + (36 * e - 108 * f) * g + 54 * f**2 - 36 * e * f +
+            6 * e**2 + 6 * d**2 + ((-36 * c) + 36 * b - 12 * a) * d + 54 * c**2 + (36 * a - 108 * b) * c + 54 * b**2 -
+            36 * a * b + 6 * a**2,
+            (30 * g - 60 * f + 30 * e) * h - 90 * g**2 + (270 * f - 120 * e) * g - 180 * f**2 + 150 * e * f - 30 * e**2 +
+            (30 * c - 60 * b + 30 * a) * d - 90 * c**2 + (270 * b - 120 * a) * c - 180 * b**2 + 150 * a * b - 30 * a**2,
+            (24 * f - 24 * e) * h + 36 * g**2 + (144 * e - 216 * f) * g + 216 * f**2 - 240 * e * f + 60 * e**2 +
+            (24 * b - 24 * a) * d + 36 * c**2 + (144 * a - 216 * b) * c + 216 * b**2 - 240 * a * b + 60 * a**2,
+            ((-6 * h) + 18 * g - 18 * f + 6 * e) * y + ((-6 * d) + 18 * c - 18 * b + 6 * a) * x + 6 * e * h +
+            (54 * f - 72 * e) * g - 108 * f**2 + 180 * e * f - 60 * e**2 + 6 * a * d + (54 * b - 72 * a) * c -
+            108 * b**2 + 180 * a * b - 60 * a**2,
+            ((-12 * g) + 24 * f - 12 * e) * y + ((-12 * c) + 24 * b - 12 * a) * x + 12 * e * g + 18 * f**2 -
+            60 * e * f + 30 * e**2 + 12 * a * c + 18 * b**2 - 60 * a * b + 30 * a**2,
+            (6 * e - 6 * f) * y + (6 * a - 6 * b) * x + 6 * e * f - 6 * e**2 + 6 * a * b - 6 * a**2,
+        ]).reshape(-1, 6)
+        t = self._candidates(poly, t_min, t_max)
+        sqr_d = (self.x(t) - x[:, None])**2 + (self.y(t) - y[:, None])**2
+        return t[np.arange(len(self)), np.argmin(sqr_d, axis=1)]
+
+    def estimated_length(self, steps: int = 10) -> np.ndarray:
+        t = np.broadcast_to(np.linspace(0, 1, steps), (len(self), steps))
+        return np.sum(np.sqrt(np.diff(self.x(t), axis=1)**2 + np.diff(self.y(t), axis=1)**2), axis=1)
+
+    def _broadcast(self, values: np.ndarray, t) -> np.ndarray:
+        """Reshape per-spline values so that they broadcast along the first axis of ``t``."""
+        return values.reshape(len(self), *[1] * (np.ndim(t) - 1)) if np.ndim(t) else values
+
+    @staticmethod
+    def _candidates(poly: np.ndarray, t_min: float, t_max: float) -> np.ndarray:
+        """Real roots within ``(t_min, t_max)`` and the interval bounds; other roots are replaced by ``t_min``."""
+        roots = polynomial_roots(poly)
+        valid = (roots.imag == 0) & (roots.real > t_min) & (roots.real < t_max)
+        bounds = np.broadcast_to([t_min, t_max], (len(poly), 2))
+        return np.column_stack((np.where(valid, roots.real, t_min), bounds))
+
+
+def polynomial_roots(coefficients: np.ndarray) -> np.ndarray:
+    """Compute the roots of many polynomials like ``np.roots`` with one eigenvalue computation per degree.
+
+    :param coefficients: polynomial coefficients (highest power first) with one polynomial per row
+    :return: complex roots with one polynomial per row; polynomials of lower degree are padded with NaN
+    """
+    coefficients = np.asarray(coefficients, dtype=float)
+    num_polynomials, size = coefficients.shape
+    roots = np.full((num_polynomials, size - 1), np.nan, dtype=complex)
+    nonzero = coefficients != 0
+    # NOTE: leading zeros reduce the degree like in np.roots
+    degrees = np.where(nonzero.any(axis=1), size - 1 - np.argmax(nonzero, axis=1), 0)
+    for degree in np.unique(degrees[degrees > 0]).tolist():
+        rows = np.flatnonzero(degrees == degree)
+        c = coefficients[rows, size - 1 - degree:]
+        companion = np.zeros((len(rows), degree, degree))
+        companion[:, 0, :] = -c[:, 1:] / c[:, :1]
+        companion[:, np.arange(1, degree), np.arange(degree - 1)] = 1
+        roots[rows, :degree] = np.linalg.eigvals(companion)
+    return roots
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""Measure duration and peak memory of the path planning stages on the experiments, the demos and synthetic fields.
+
+Run with ``python -m rosys.pathplanning.benchmark [--output results.json]``.
+The results are written as JSON so that they can be compared across versions.
+"""
+from __future__ import annotations
+
+import argparse
+import functools
+import importlib
+import json
+import platform
+import time
+import tracemalloc
+from collections.abc import Callable, Generator
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from .. import __version__
+from ..geometry import Point, Pose, Spline
+from .delaunay_planner import DelaunayPlanner
+from .experiments import generate_experiment
+from .grid import Grid
+from .obstacle import Obstacle
+from .obstacle_map import ObstacleMap
+
+EXPERIMENTS = [1.0, 1.1, 2.0, 4.0, 5.0, 5.1]
+SYNTHETIC_SIZES = [25.0, 50.0, 100.0]
+"""Side lengths (meters) of the synthetic square fields."""
+SYNTHETIC_DENSITY = 0.01
+"""Number of 1 x 1 m obstacles per square meter of the synthetic fields."""
+NUM_SPLINES = 1000
+SPLINE_LENGTH = 3.0
+"""Maximum offset (meters) between start and end of the random splines."""
+NUM_POSES = 100_000
+
+
+@dataclass(slots=True, kw_only=True)
+class Scenario:
+    name: str
+    robot_outline: list[tuple[float, float]]
+    create_map: Callable[[], ObstacleMap]
+    start: Pose
+    goal: Pose
+
+
+@dataclass(slots=True, kw_only=True)
+class StageResult:
+    scenario: str
+    stage: str
+    duration: float
+    """seconds"""
+    peak_memory: int
+    """maximum number of bytes allocated during the stage (measured in a separate run with ``tracemalloc``)"""
+    info: dict[str, Any] = field(default_factory=dict)
+
+
+def experiment_scenarios() -> list[Scenario]:
+    scenarios = []
+    for id_ in EXPERIMENTS:
+        robot_renderer, pose, goal, _, _ = generate_experiment(id_)
+        scenarios.append(Scenario(
+            name=f'experiment-{id_}',
+            robot_outline=[(float(x), float(y)) for x, y in robot_renderer.outline],
+            create_map=functools.partial(_experiment_map, id_),
+            start=Pose(x=pose[0], y=pose[1], yaw=pose[2]),
+            goal=Pose(x=goal[0], y=goal[1], yaw=goal[2]),
+        ))
+    return scenarios
+
+
+def _experiment_map(id_: float) -> ObstacleMap:
+    return generate_experiment(id_)[3]
+
+
+def demo_scenarios() -> list[Scenario]:
+    scenarios = []
+    for path in sorted((Path(__file__).parent / 'demos').glob('*.py')):
+        module = importlib.import_module(f'rosys.pathplanning.demos.{path.stem}')
+        scenarios.append(world_scenario(f'demo-{path.stem}', module.robot_outline,
+                                        module.cmd.areas, module.cmd.obstacles, start=module.cmd.start, goal=module.cmd.goal))
+    return scenarios
+
+
+def synthetic_scenarios(sizes: list[float], seed: int = 0) -> list[Scenario]:
+    """Square fields without areas which are randomly covered with obstacles, from corner to corner."""
+    rng = np.random.default_rng(seed)
+    robot_outline = [(-0.22, -0.36), (1.07, -0.36), (1.07, 0.36), (-0.22, 0.36)]
+    scenarios = []
+    for size in sizes:
+        obstacles = []
+        for i, (x, y) in enumerate(rng.uniform(2.0, size - 3.0, (int(SYNTHETIC_DENSITY * size**2), 2))):
+            obstacles.append(Obstacle(id=str(i), outline=[
+                Point(x=x, y=y), Point(x=x + 1, y=y), Point(x=x + 1, y=y + 1), Point(x=x, y=y + 1),
+            ]))
+        scenarios.append(world_scenario(f'synthetic-{size:g}m', robot_outline, [], obstacles,
+                                        start=Pose(x=0.5, y=0.5, yaw=0.0),
+                                        goal=Pose(x=size - 0.5, y=size - 0.5, yaw=0.0)))
+    return scenarios
+
+
+def world_scenario(name: str, robot_outline, areas, obstacles, *, start: Pose, goal: Pose) -> Scenario:
+    """Create a scenario with an obstacle map covering the world like ``DelaunayPlanner.update_map``."""
+    points = [p for item in [*areas, *obstacles] for p in item.outline] + [start.point, goal.point]
+    grid = Grid.from_points(points, pixel_size=0.1, num_layers=36, padding=1.0)
+    return Scenario(
+        name=name,
+        robot_outline=robot_outline,
+        create_map=lambda: ObstacleMap.from_world(robot_outline, areas, obstacles, grid),
+        start=start,
+        goal=goal,
+    )
+
+
+def run_stages(scenario: Scenario, seed: int = 0) \
+        -> Generator[tuple[str, Callable[[], dict[str, Any]]], None, None]:
+    """Yield the name and function of each stage; later stages build on the results of earlier ones."""
+    planner = DelaunayPlanner(scenario.robot_outline)
+
+    def create_map() -> dict[str, Any]:
+        planner.obstacle_map = scenario.create_map()
+        return {'grid_size': list(planner.obstacle_map.grid.size)}
+    yield 'map', create_map
+
+    def create_graph() -> dict[str, Any]:
+        planner._create_graph()  # pylint: disable=protected-access
+        assert planner.graph is not None
+        return {'num_nodes': len(planner.node_poses), 'num_edges': len(planner.graph.candidate_sources)}
+    yield 'graph', create_graph
+
+    def search() -> dict[str, Any]:
+        try:
+            return {'num_segments': len(planner.search(scenario.start, scenario.goal))}
+        except RuntimeError as e:
+            return {'error': str(e)}
+    yield 'search', search
+
+    assert planner.obstacle_map is not None
+    obstacle_map = planner.obstacle_map
+    rng = np.random.default_rng(seed)
+    x0, y0, w, h = obstacle_map.grid.bbox
+    starts = rng.uniform((x0, y0, -np.pi), (x0 + w, y0 + h, np.pi), (NUM_SPLINES, 3))
+    ends = starts + rng.uniform((-SPLINE_LENGTH, -SPLINE_LENGTH, -np.pi / 2), (SPLINE_LENGTH, SPLINE_LENGTH, np.pi / 2),
+                                (NUM_SPLINES, 3))
+    splines = [Spline.from_poses(Pose(x=a[0], y=a[1], yaw=a[2]), Pose(x=b[0], y=b[1], yaw=b[2]))
+               for a, b in zip(starts, ends, strict=True)]
+
+    def test_spline() -> dict[str, Any]:
+        return {'num_splines': len(splines), 'num_collisions': sum(obstacle_map.test_spline(s) for s in splines)}
+    yield 'test_spline', test_spline
+
+    def test_splines() -> dict[str, Any]:
+        return {'num_splines': len(splines), 'num_collisions': int(obstacle_map.test_splines(splines).sum())}
+    yield 'test_splines', test_splines
+
+    x, y, yaw = rng.uniform((x0, y0, -np.pi), (x0 + w, y0 + h, np.pi), (NUM_POSES, 3)).T
+
+    def get_distance() -> dict[str, Any]:
+        return {'num_poses': NUM_POSES, 'mean_distance': float(np.mean(obstacle_map.get_distance(x, y, yaw)))}
+    yield 'get_distance', get_distance
+
+
+def run_scenario(scenario: Scenario, seed: int = 0) -> list[StageResult]:
+    """Run all stages twice: once for the durations and once with ``tracemalloc`` for the peak memory."""
+    results = []
+    for name, stage in run_stages(scenario, seed):
+        t = time.perf_counter()
+        info = stage()
+        results.append(StageResult(scenario=scenario.name, stage=name, duration=time.perf_counter() - t,
+                                   peak_memory=0, info=info))
+    tracemalloc.start()
+    try:
+        for result, (_, stage) in zip(results, run_stages(scenario, seed), strict=True):
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            stage()
+            result.peak_memory = tracemalloc.get_traced_memory()[1] - current
+    finally:
+        tracemalloc.stop()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', type=Path, help='JSON file to write the results to')
+    parser.add_argument('--filter', default='', help='only run scenarios whose names contain this string')
+    parser.add_argument('--sizes', type=float, nargs='*', default=SYNTHETIC_SIZES,
+                        help='side lengths (meters) of the synthetic fields')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    scenarios = experiment_scenarios() + demo_scenarios() + synthetic_scenarios(args.sizes, args.seed)
+    results = []
+    for scenario in scenarios:
+        if args.filter not in scenario.name:
+            continue
+        for result in run_scenario(scenario, args.seed):
+            print(f'{result.scenario:20s} {result.stage:12s} {result.duration * 1000:10.2f} ms '
+                  f'{result.peak_memory / 1e6:10.2f} MB  {result.info}')
+            results.append(result)
+
+    if args.output:
+        args.output.write_text(json.dumps({
+            'rosys': __version__,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'seed': args.seed,
+            'results': [asdict(result) for result in results],
+        }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,4 @@
 import numpy as np
-from matplotlib.path import Path
 
 
 class BinaryRenderer:
@@ -7,27 +6,46 @@ class BinaryRenderer:
     def __init__(self, size, fill_value: bool = False) -> None:
         self.map = np.full(size, fill_value=fill_value, dtype=bool)
 
-        self.xx, self.yy = np.meshgrid(range(size[1]), range(size[0]))
-        self.xy = np.vstack((self.xx.flatten(), self.yy.flatten())).T
-
     def circle(self, x, y, radius, value=True) -> None:
         x0 = max(int(x - radius), 0)
         y0 = max(int(y - radius), 0)
         x1 = min(int(x + radius) + 2, self.map.shape[1] - 1)
         y1 = min(int(y + radius) + 2, self.map.shape[0] - 1)
-        roi = self.map[y0:y1, x0:x1]
-        sqr_dist = (self.xx[y0:y1, x0:x1] - x)**2 + (self.yy[y0:y1, x0:x1] - y)**2
-        roi[sqr_dist <= radius**2] = value
-        self.map[y0:y1, x0:x1] = roi
+        sqr_dist = (np.arange(x0, x1) - x)**2 + (np.arange(y0, y1)[:, None] - y)**2
+        self.map[y0:y1, x0:x1][sqr_dist <= radius**2] = value
 
     def polygon(self, points, value=True) -> None:
+        """Set all pixels whose centers lie inside the polygon (even-odd rule).
+
+        The polygon is rasterized row by row (scanline fill):
+        for every pixel row the crossings with the polygon edges are computed
+        and each pixel toggles its inside state for every crossing to the right of its center.
+        """
         if len(points) == 0:
             return
         x0 = max(int(points[:, 0].min()), 0)
         y0 = max(int(points[:, 1].min()), 0)
-        x1 = min(int(points[:, 0].max()) + 2, self.map.shape[1] - 1)
-        y1 = min(int(points[:, 1].max()) + 2, self.map.shape[0] - 1)
-        xy = np.vstack((self.xx[y0:y1, x0:x1].flatten(), self.yy[y0:y1, x0:x1].flatten())).T
-        roi = self.map[y0:y1, x0:x1]
-        roi[Path(points).contains_points(xy).reshape(roi.shape)] = value
-        self.map[y0:y1, x0:x1] = roi
+        x1 = max(min(int(points[:, 0].max()) + 2, self.map.shape[1] - 1), x0)
+        y1 = max(min(int(points[:, 1].max()) + 2, self.map.shape[0] - 1), y0)
+        if x0 == x1 or y0 == y1:
+            return
+
+        xa, ya = points[:, 0], points[:, 1]
+        xb, yb = np.roll(xa, -1), np.roll(ya, -1)
+        # NOTE: an edge crosses all pixel rows y with ya >= y > yb or yb >= y > ya
+        first_rows = np.clip(np.floor(np.minimum(ya, yb)).astype(int) + 1, y0, y1)
+        last_rows = np.clip(np.floor(np.maximum(ya, yb)).astype(int) + 1, y0, y1)
+        counts = last_rows - first_rows
+        edges = np.repeat(np.arange(len(points)), counts)
+        rows = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(first_rows, counts)
+        crossings = xa[edges] + (rows - ya[edges]) * (xb[edges] - xa[edges]) / (yb[edges] - ya[edges])
+
+        # NOTE: count the crossings to the right of each pixel center and keep the pixels with odd counts;
+        # like matplotlib, crossings of upward edges exactly at a pixel center count, those of downward edges do not
+        cols = np.where(yb[edges] > ya[edges], np.floor(crossings), np.ceil(crossings) - 1).astype(int)
+        right = cols >= x0
+        width = x1 - x0
+        indices = (rows[right] - y0) * width + np.minimum(cols[right], x1 - 1) - x0
+        histogram = np.bincount(indices, minlength=(y1 - y0) * width).reshape(y1 - y0, width)
+        inside = np.cumsum(histogram[:, ::-1], axis=1)[:, ::-1] % 2 == 1
+        self.map[y0:y1, x0:x1][inside] = value
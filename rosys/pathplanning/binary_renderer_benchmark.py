@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Compare the scanline polygon rasterization with the former matplotlib-based one on the areas of all demos.
+
+Run with ``python -m rosys.pathplanning.binary_renderer_benchmark``.
+"""
+import importlib
+import time
+from pathlib import Path
+
+import numpy as np
+from matplotlib.path import Path as MplPath
+
+from ..geometry import Point
+from .binary_renderer import BinaryRenderer
+from .grid import Grid
+
+
+class MatplotlibRenderer:
+    """The former implementation testing every pixel of the bounding box with ``matplotlib.path.Path``."""
+
+    def __init__(self, size, fill_value: bool = False) -> None:
+        self.map = np.full(size, fill_value=fill_value, dtype=bool)
+        self.xx, self.yy = np.meshgrid(range(size[1]), range(size[0]))
+
+    def polygon(self, points, value=True) -> None:
+        if len(points) == 0:
+            return
+        x0 = max(int(points[:, 0].min()), 0)
+        y0 = max(int(points[:, 1].min()), 0)
+        x1 = min(int(points[:, 0].max()) + 2, self.map.shape[1] - 1)
+        y1 = min(int(points[:, 1].max()) + 2, self.map.shape[0] - 1)
+        xy = np.vstack((self.xx[y0:y1, x0:x1].flatten(), self.yy[y0:y1, x0:x1].flatten())).T
+        roi = self.map[y0:y1, x0:x1]
+        roi[MplPath(points).contains_points(xy).reshape(roi.shape)] = value
+        self.map[y0:y1, x0:x1] = roi
+
+
+def to_pixels(grid: Grid, outline: list[Point]) -> np.ndarray:
+    return np.array([grid.to_grid(p.x, p.y)[::-1] for p in outline]).reshape(-1, 2)
+
+
+def render(renderer_type: type, grid: Grid, areas: list[np.ndarray], obstacles: list[np.ndarray]) -> np.ndarray:
+    renderer = renderer_type(grid.size[:2], fill_value=bool(areas))
+    for outline in areas:
+        renderer.polygon(outline, False)
+    for outline in obstacles:
+        renderer.polygon(outline)
+    return renderer.map
+
+
+def main() -> None:
+    for path in sorted((Path(__file__).parent / 'demos').glob('*.py')):
+        cmd = importlib.import_module(f'rosys.pathplanning.demos.{path.stem}').cmd
+        points = [p for item in [*cmd.areas, *cmd.obstacles] for p in item.outline] + [cmd.start.point, cmd.goal.point]
+        grid = Grid.from_points(points, pixel_size=0.1, num_layers=36, padding=1.0)
+        areas = [to_pixels(grid, area.outline) for area in cmd.areas if len(area.outline) > 2]
+        obstacles = [to_pixels(grid, obstacle.outline) for obstacle in cmd.obstacles]
+
+        durations = {}
+        maps = {}
+        for renderer_type in (MatplotlibRenderer, BinaryRenderer):
+            t = time.perf_counter()
+            maps[renderer_type] = render(renderer_type, grid, areas, obstacles)
+            durations[renderer_type] = time.perf_counter() - t
+        mismatches = np.count_nonzero(maps[MatplotlibRenderer] != maps[BinaryRenderer])
+        print(f'{path.stem:12s} {grid.size[0]:5d} x {grid.size[1]:5d} px, {len(areas):3d} areas, {len(obstacles):3d} obstacles: '
+              f'matplotlib {durations[MatplotlibRenderer] * 1000:8.2f} ms, '
+              f'scanline {durations[BinaryRenderer] * 1000:7.2f} ms, '
+              f'{mismatches} mismatching pixels')
+
+
+if __name__ == '__main__':
+    main()
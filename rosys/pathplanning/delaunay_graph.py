@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+BACKWARD_PENALTY = 1.2
+"""Factor applied to the length of a spline when it is driven backwards."""
+
+
+@dataclass(slots=True, kw_only=True)
+class DelaunayGraph:
+    """Compact array-backed graph connecting the poses of Delaunay pose groups.
+
+    Pose ``p`` of pose group ``g`` is represented by node ``group_offsets[g] + p``.
+    Every candidate edge is a forward spline from one pose to a pose of a neighboring group.
+    Its length is ``NaN`` if the spline collides with an obstacle.
+    Free candidates become forward edges; if there is no free candidate in the opposite direction,
+    they can also be driven backwards with a penalty.
+    The resulting edges are stored in CSR format: the outgoing edges of node ``n`` are ``indptr[n]:indptr[n+1]``.
+    """
+    group_offsets: np.ndarray
+    candidate_sources: np.ndarray
+    candidate_targets: np.ndarray
+    candidate_lengths: np.ndarray
+    indptr: np.ndarray = field(init=False)
+    indices: np.ndarray = field(init=False)
+    weights: np.ndarray = field(init=False)
+    backward: np.ndarray = field(init=False)
+
+    def __post_init__(self) -> None:
+        self._build_edges()
+
+    @property
+    def num_nodes(self) -> int:
+        return int(self.group_offsets[-1])
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.indices)
+
+    @property
+    def node_groups(self) -> np.ndarray:
+        """Pose group index of every node."""
+        return np.repeat(np.arange(len(self.group_offsets) - 1), np.diff(self.group_offsets))
+
+    def node(self, g: int, p: int) -> int:
+        return int(self.group_offsets[g] + p)
+
+    def coordinate(self, node: int) -> tuple[int, int]:
+        """Pose group index and pose index of the given node."""
+        g = int(np.searchsorted(self.group_offsets, node, side='right') - 1)
+        return g, node - int(self.group_offsets[g])
+
+    def update_candidates(self, candidates: np.ndarray, lengths: np.ndarray) -> None:
+        """Update the lengths of some candidate edges (``NaN`` if blocked) and rebuild the edges."""
+        self.candidate_lengths[candidates] = lengths
+        self._build_edges()
+
+    def edge(self, u: int, v: int) -> int | None:
+        """Index of the edge from node ``u`` to node ``v`` or ``None`` if there is no such edge."""
+        start, end = self.indptr[u], self.indptr[u + 1]
+        hits = np.flatnonzero(self.indices[start:end] == v)
+        return int(start + hits[0]) if len(hits) else None
+
+    def search(self, sources: dict[int, float], targets: dict[int, float]) -> list[int] | None:
+        """Find the cheapest sequence of nodes from any of the sources to any of the targets.
+
+        All combinations of sources and targets are evaluated with a single Dijkstra search.
+
+        :param sources: costs for entering the graph at the given nodes
+        :param targets: costs for leaving the graph at the given nodes
+        :return: the node sequence or ``None`` if no target is reachable
+        """
+        return self.search_many(sources, [targets])[0]
+
+    def search_many(self, sources: dict[int, float], targets: list[dict[int, float]]) -> list[list[int] | None]:
+        """Find the cheapest sequence of nodes from any of the sources to any of the targets of each target set.
+
+        All target sets are evaluated with a single Dijkstra search (see ``search``).
+        """
+        if not sources:
+            return [None] * len(targets)
+        distances, predecessors = self._dijkstra([sources])
+        results: list[list[int] | None] = []
+        for target_set in targets:
+            if not target_set:
+                results.append(None)
+                continue
+            target_nodes = np.array(list(target_set.keys()))
+            totals = distances[0, target_nodes] + np.array(list(target_set.values()), dtype=float)
+            best = int(np.argmin(totals))
+            if not np.isfinite(totals[best]):
+                results.append(None)
+                continue
+            nodes = [int(target_nodes[best])]
+            while predecessors[0, nodes[-1]] != self.num_nodes:
+                nodes.append(int(predecessors[0, nodes[-1]]))
+            results.append(nodes[::-1])
+        return results
+
+    def cost_matrix(self, sources: list[dict[int, float]], targets: list[dict[int, float]]) -> np.ndarray:
+        """Costs of the cheapest node sequences from each source set to each target set (``inf`` if unreachable).
+
+        All source sets are evaluated with a single Dijkstra call.
+        """
+        costs = np.full((len(sources), len(targets)), np.inf)
+        if not sources:
+            return costs
+        distances, _ = self._dijkstra(sources)
+        for j, target_set in enumerate(targets):
+            if target_set:
+                target_nodes = np.array(list(target_set.keys()))
+                exit_costs = np.array(list(target_set.values()), dtype=float)
+                costs[:, j] = np.min(distances[:, target_nodes] + exit_costs, axis=1)
+        return costs
+
+    def _dijkstra(self, sources: list[dict[int, float]]) -> tuple[np.ndarray, np.ndarray]:
+        """Run Dijkstra from one virtual node per source set which is connected to the nodes of the set.
+
+        The virtual node of source set ``i`` is node ``num_nodes + i``.
+        """
+        # NOTE: a virtual node connected to all sources turns the multi-source search into a single-source search
+        n = self.num_nodes
+        source_nodes = np.array([node for source_set in sources for node in source_set], dtype=self.indices.dtype)
+        source_costs = np.maximum(np.array([cost for source_set in sources for cost in source_set.values()],
+                                           dtype=float), 1e-9)
+        virtual_indptr = self.indptr[-1] + np.cumsum([len(source_set) for source_set in sources])
+        matrix = csr_matrix((np.concatenate((self.weights, source_costs)),
+                             np.concatenate((self.indices, source_nodes)),
+                             np.concatenate((self.indptr, virtual_indptr))), shape=(n + len(sources), n + len(sources)))
+        return dijkstra(matrix, directed=True, indices=np.arange(n, n + len(sources)), return_predecessors=True)
+
+    def _build_edges(self) -> None:
+        n = self.num_nodes
+        free = ~np.isnan(self.candidate_lengths)
+        sources = self.candidate_sources[free]
+        targets = self.candidate_targets[free]
+        lengths = self.candidate_lengths[free]
+        has_forward_reverse = np.isin(targets.astype(np.int64) * n + sources, sources.astype(np.int64) * n + targets)
+        all_sources = np.concatenate((sources, targets[~has_forward_reverse]))
+        order = np.argsort(all_sources, kind='stable')
+        self.indices = np.concatenate((targets, sources[~has_forward_reverse]))[order]
+        self.weights = np.concatenate((lengths, BACKWARD_PENALTY * lengths[~has_forward_reverse]))[order]
+        self.backward = np.concatenate((np.zeros(len(sources), dtype=bool),
+                                        np.ones(np.count_nonzero(~has_forward_reverse), dtype=bool)))[order]
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(all_sources, minlength=n))))
@@ -1,21 +1,25 @@
 import itertools
 import logging
+import time
+from collections.abc import Generator
 from dataclasses import dataclass
-from functools import lru_cache
 
-import networkx as nx
 import numpy as np
-from scipy import ndimage, spatial
+from scipy import spatial
 
 from ..driving import PathSegment
-from ..geometry import Point, Pose, PoseStep, Spline
-from ..helpers import angle
+from ..geometry import Point, Pose, PoseStep, Spline, SplineBatch
+from ..helpers import angle, eliminate_2pi
 from .area import Area
+from .delaunay_graph import BACKWARD_PENALTY, DelaunayGraph
 from .delaunay_pose_group import DelaunayPoseGroup
 from .fast_spline import FastSpline
-from .grid import Grid
+from .grid import Grid, TiledGrid
+from .map_cache import MapCache
 from .obstacle import Obstacle
-from .obstacle_map import ObstacleMap
+from .obstacle_map import BaseObstacleMap, ObstacleMap
+from .robot_renderer import RobotRenderer
+from .tiled_obstacle_map import TiledObstacleMap
 
 GRID_RESOLUTION = 1.0
 MIN_MARGIN = 1.0
@@ -29,113 +33,369 @@ See https://trello.com/c/FtP4yHqA/777#comment-62d0323e97ba19392bcbceb8 for more
 TRY_SINGLE_SHUNTING = True
 """Try to find collision-free path with minimal switching (single shunting)."""
 
+SHORTCUT_BATCH_SIZE = 8
+"""Number of segment pairs whose shortcuts are computed and collision-tested together while smoothing a path."""
+
+ANYTIME_PASSAGES = [(10, 3), (20, 10), (40, 30)]
+"""Number of closest pose groups and passages connecting start and goal to the graph in the stages of an anytime search."""
+
+
+@dataclass(slots=True, kw_only=True)
+class SearchImprovement:
+    time: float
+    """seconds since the start of the graph search"""
+    cost: float
+    """path length with backward segments weighted by ``BACKWARD_PENALTY``"""
+    num_segments: int
+    stage: int
+    """index of the stage in ``ANYTIME_PASSAGES``"""
+
+
+@dataclass(slots=True, kw_only=True)
+class Passage:
+    segment: PathSegment
+    coordinate: tuple[int, int]
+
 
 class DelaunayPlanner:
 
-    def __init__(self, robot_outline: list[tuple[float, float]]) -> None:
+    def __init__(self, robot_outline: list[tuple[float, float]], *,
+                 workers: int = 1, compact: bool = False, tile_size: int | None = None,
+                 cache: MapCache | None = None) -> None:
+        """Planner searching paths on a graph of poses around the points of a Delaunay triangulation.
+
+        :param workers: number of threads building obstacle maps
+        :param compact: whether to use compact obstacle maps (see ``ObstacleMap``)
+        :param tile_size: tile size (cells) for tiled obstacle maps which only cover areas, obstacles and requested points
+        :param cache: on-disk cache for obstacle maps and graphs (see ``store_cache()``)
+        """
         self.robot_outline = robot_outline
+        self.workers = workers
+        self.compact = compact
+        self.tile_size = tile_size
+        self.cache = cache
+        self._cache_key: str | None = None
         self.areas: list[Area] = []
         self.obstacles: list[Obstacle] = []
-        self.obstacle_map: ObstacleMap | None = None
+        self.obstacle_map: BaseObstacleMap | None = None
         self.tri_points: np.ndarray | None = None
         self.tri_mesh: spatial.Delaunay | None = None
+        self.tri_tree: spatial.cKDTree | None = None
+        self.node_poses: np.ndarray = np.zeros((0, 3))
         self.pose_groups: list[DelaunayPoseGroup] | None = None
-        self.graph: nx.DiGraph | None = None
+        self.graph: DelaunayGraph | None = None
+        self.search_history: list[SearchImprovement] = []
         self.log = logging.getLogger('rosys.delaunay_planner')
 
     def update_map(self, areas: list[Area], obstacles: list[Obstacle], additional_points: list[Point],
-                   deadline: float) -> None:
+                   deadline: float, *,
+                   areas_changed: bool | None = None, changed_obstacles: list[Obstacle] | None = None) -> None:
+        """Update the obstacle map and graph for the given areas and obstacles.
+
+        :param areas_changed: whether the areas differ from the previous call (compared if not given)
+        :param changed_obstacles: previous and new versions of all obstacles which changed (compared if not given)
+        """
+        if areas_changed is None:
+            areas_changed = self.areas != areas
         if self.obstacle_map and \
-                self.areas == areas and \
-                self.obstacles == obstacles and \
+                not areas_changed and \
                 all(self.obstacle_map.grid.contains(point, padding=1.0) for point in additional_points):
-            return
+            if changed_obstacles is None:
+                changed_obstacles = [o for o in obstacles if o not in self.obstacles] + \
+                    [o for o in self.obstacles if o not in obstacles]
+            if self.obstacle_map.covers(changed_obstacles):
+                self.obstacles = obstacles
+                if changed_obstacles:
+                    self._update_obstacles(changed_obstacles, deadline)
+                return
         self.areas = areas
         self.obstacles = obstacles
-        self._create_obstacle_map(additional_points, deadline)
-        self._create_graph()
+        self._create_map(additional_points, deadline)
+
+    def _update_obstacles(self, changed_obstacles: list[Obstacle], deadline: float) -> None:
+        """Apply obstacle changes to the existing obstacle map and graph instead of rebuilding them."""
+        assert self.obstacle_map is not None
+        self._cache_key = None  # NOTE: the map does not correspond to its cache key anymore
+        try:
+            region = self.obstacle_map.update(self.areas, self.obstacles, changed_obstacles, deadline)
+        except TimeoutError:
+            self.obstacle_map = None  # NOTE: a partially updated map needs to be rebuilt with the next call
+            raise
+        if region is not None:
+            self._update_graph(region)
 
     def grow_map(self, points: list[Point], deadline: float) -> None:
         if self.obstacle_map is not None and \
                 all(self.obstacle_map.grid.contains(point, padding=1.0) for point in points):
             return
-        if self.obstacle_map is not None:
+        if isinstance(self.obstacle_map, TiledObstacleMap):
+            points.extend(self.obstacle_map.grid.tile_corners())
+        elif self.obstacle_map is not None:
             bbox = self.obstacle_map.grid.bbox
             points.append(Point(x=bbox[0],         y=bbox[1]))
             points.append(Point(x=bbox[0]+bbox[2], y=bbox[1]))
             points.append(Point(x=bbox[0],         y=bbox[1]+bbox[3]))
             points.append(Point(x=bbox[0]+bbox[2], y=bbox[1]+bbox[3]))
-        self._create_obstacle_map(points, deadline)
-        self._create_graph()
+        self._create_map(points, deadline)
 
-    def _create_obstacle_map(self, additional_points: list[Point], deadline: float) -> None:
+    def _create_map(self, additional_points: list[Point], deadline: float) -> None:
         points = [p for obstacle in self.obstacles for p in obstacle.outline]
         points += [p for area in self.areas for p in area.outline]
         points += additional_points
+        if self.tile_size is not None:
+            tiled_grid = TiledGrid.from_points(points, pixel_size=0.1, num_layers=36, padding=1.0,
+                                               tile_size=self.tile_size)
+            self.obstacle_map = TiledObstacleMap.from_world(self.robot_outline, self.areas, self.obstacles, tiled_grid,
+                                                            deadline, workers=self.workers, compact=self.compact)
+            self._create_graph()
+            self._cache_key = None  # NOTE: tiled maps are not cached
+            return
         grid = Grid.from_points(points, pixel_size=0.1, num_layers=36, padding=1.0)
-        self.obstacle_map = ObstacleMap.from_world(self.robot_outline, self.areas, self.obstacles, grid, deadline)
-
-    def _create_graph(self) -> None:
+        key = self.cache.key(self.robot_outline, self.areas, self.obstacles, grid, compact=self.compact) \
+            if self.cache else None
+        cached = self.cache.load(key) if self.cache and key else None
+        if cached is not None:
+            self.obstacle_map = ObstacleMap.from_stacks(grid, cached['stack'], cached['dist_stack'],
+                                                        map_=cached['map'],
+                                                        robot_renderer=RobotRenderer(self.robot_outline))
+            self._create_graph(cached)
+            self._cache_key = None
+        else:
+            self.obstacle_map = ObstacleMap.from_world(self.robot_outline, self.areas, self.obstacles, grid, deadline,
+                                                       workers=self.workers, compact=self.compact)
+            self._create_graph()
+            self._cache_key = key
+
+    def store_cache(self) -> None:
+        """Store a newly created obstacle map and graph in the cache (if any).
+
+        This is separate from creating the map so that callers can store it after they have used the result.
+        """
+        if self.cache is None or self._cache_key is None:
+            return
+        assert isinstance(self.obstacle_map, ObstacleMap) and self.graph is not None and self.tri_points is not None
+        self.cache.store(self._cache_key, {
+            'map': self.obstacle_map.map,
+            'stack': self.obstacle_map.stack,
+            'dist_stack': self.obstacle_map.dist_stack,
+            'tri_points': self.tri_points,
+            'candidate_sources': self.graph.candidate_sources,
+            'candidate_targets': self.graph.candidate_targets,
+            'candidate_lengths': self.graph.candidate_lengths,
+        })
+        self._cache_key = None
+
+    def _create_graph(self, cached: dict[str, np.ndarray] | None = None) -> None:
         assert self.obstacle_map is not None
-        min_x, min_y, size_x, size_y = self.obstacle_map.grid.bbox
-        X, Y = np.meshgrid(np.arange(min_x, min_x + size_x - GRID_RESOLUTION / 2, GRID_RESOLUTION),
-                           np.arange(min_y, min_y + size_y, GRID_RESOLUTION * np.sqrt(3) / 2))
-        X[::2] += GRID_RESOLUTION / 2
-
-        rows, cols = self.obstacle_map.grid.to_grid(X.flatten(), Y.flatten())
-        distance = ndimage.distance_transform_edt(1 - self.obstacle_map.map) * self.obstacle_map.grid.pixel_size
-        D = ndimage.map_coordinates(distance, [[rows], [cols]], order=0).reshape(X.shape)
-        gradient_y, gradient_x = np.gradient(distance)
-        dD_dX = ndimage.map_coordinates(gradient_x, [[rows], [cols]], order=0).reshape(X.shape)
-        dD_dY = ndimage.map_coordinates(gradient_y, [[rows], [cols]], order=0).reshape(X.shape)
-        dD = np.sqrt(dD_dX**2 + dD_dY**2)
-        close = np.logical_and(0.0 < D, D < MIN_MARGIN)
-        close = np.logical_and(close, dD > 0)
-        X[close] += dD_dX[close] / dD[close] * (MIN_MARGIN - D[close])
-        Y[close] += dD_dY[close] / dD[close] * (MIN_MARGIN - D[close])
-
-        keep = np.reshape([not all(self.obstacle_map.stack[int(np.round(row)), int(np.round(col)), :])
-                           for row, col in zip(rows, cols, strict=True)], X.shape)
-        keep[1::2, :] = np.logical_and(keep[1::2, :], D[1::2, :] < 2)
-        keep[::4, 1::2] = np.logical_and(keep[::4, 1::2], D[::4, 1::2] < 2)
-        keep[2::4, ::2] = np.logical_and(keep[2::4, ::2], D[2::4, ::2] < 2)
-        self.tri_points = np.stack((X[keep], Y[keep]), axis=1)
-        assert self.tri_points is not None  # NOTE: mypy doesn't seem to understand np.stack
+        if cached is not None:
+            self.tri_points = np.asarray(cached['tri_points'])
+        else:
+            self.tri_points = self._create_tri_points()
 
         self.tri_mesh = spatial.Delaunay(self.tri_points)
+        self.tri_tree = spatial.cKDTree(self.tri_points)
+        # NOTE: pylint cannot infer that the Cython property is a tuple
+        group_offsets, neighbors = tuple(self.tri_mesh.vertex_neighbor_vertices)
+        node_groups = np.repeat(np.arange(len(self.tri_points)), np.diff(group_offsets))
+        directions = self.tri_points[neighbors] - self.tri_points[node_groups]
+        self.node_poses = np.column_stack((self.tri_points[node_groups], np.arctan2(directions[:, 1], directions[:, 0])))
         self.pose_groups = [
             DelaunayPoseGroup(
                 index=i,
-                point=Point(x=self.tri_points[i, 0], y=self.tri_points[i, 1]),
-                neighbor_indices=_tri_neighbors(self.tri_mesh, i).tolist(),
-                poses=[
-                    Pose(x=point[0], y=point[1], yaw=np.arctan2(neighbor[1] - point[1], neighbor[0] - point[0]))
-                    for neighbor in self.tri_points[_tri_neighbors(self.tri_mesh, i)]
-                ],
+                point=Point(x=point[0], y=point[1]),
+                neighbor_indices=neighbors[group_offsets[i]:group_offsets[i+1]].tolist(),
+                poses=[Pose(x=x, y=y, yaw=yaw) for x, y, yaw in self.node_poses[group_offsets[i]:group_offsets[i+1]]],
             )
             for i, point in enumerate(self.tri_points)
         ]
 
-        self.graph = nx.DiGraph()
-        for g, group in enumerate(self.pose_groups):
-            for p in range(len(group.poses)):
-                self.graph.add_node((g, p))
-        for g, group in enumerate(self.pose_groups):
-            for p, (pose, g_) in enumerate(zip(group.poses, group.neighbor_indices, strict=True)):
-                for p_, pose_ in enumerate(self.pose_groups[g_].poses):
-                    if abs(angle(pose.yaw, pose_.yaw + np.pi)) < 0.01:
-                        continue  # NOTE: avoid 180-degree turns
-                    x, y, yaw = _generate_poses(self.obstacle_map.grid, pose, pose_)
-                    if not self.obstacle_map.test(x, y, yaw).any():
-                        length = np.sum(np.sqrt(np.diff(x)**2 + np.diff(y)**2))
-                        self.graph.add_edge((g, p), (g_, p_), backward=False, weight=length)
-                        if ((g_, p_), (g, p)) not in self.graph.edges:
-                            self.graph.add_edge((g_, p_), (g, p), backward=True, weight=1.2*length)
-
-    def search(self, start: Pose, goal: Pose) -> list[PathSegment]:
+        # NOTE: each pose is connected to all poses of the neighbor group it is facing
+        counts = np.diff(group_offsets)[neighbors]
+        sources = np.repeat(np.arange(len(neighbors)), counts)
+        targets = np.repeat(group_offsets[neighbors], counts) + np.arange(len(sources)) - np.repeat(np.cumsum(counts) - counts, counts)
+        yaws = self.node_poses[:, 2]
+        no_u_turn = np.abs(eliminate_2pi(yaws[targets] + np.pi - yaws[sources])) >= 0.01
+        sources = sources[no_u_turn].astype(np.int32)
+        targets = targets[no_u_turn].astype(np.int32)
+        if cached is not None and \
+                np.array_equal(cached['candidate_sources'], sources) and \
+                np.array_equal(cached['candidate_targets'], targets):
+            lengths = np.asarray(cached['candidate_lengths'])
+        else:
+            lengths = self._test_candidates(sources, targets)
+        self.graph = DelaunayGraph(
+            group_offsets=group_offsets,
+            candidate_sources=sources,
+            candidate_targets=targets,
+            candidate_lengths=lengths,
+        )
+
+    def _create_tri_points(self) -> np.ndarray:
+        assert self.obstacle_map is not None
+        J, I = _lattice(self.obstacle_map.grid)
+        min_x, min_y = self.obstacle_map.grid.bbox[:2]
+        X = min_x + I * GRID_RESOLUTION + (J % 2 == 0) * GRID_RESOLUTION / 2
+        Y = min_y + J * GRID_RESOLUTION * np.sqrt(3) / 2
+
+        rows, cols = self.obstacle_map.grid.to_grid(X, Y)
+        D, dD_dX, dD_dY = self.obstacle_map.map_distance(rows, cols)
+        dD = np.sqrt(dD_dX**2 + dD_dY**2)
+        close = np.logical_and(0.0 < D, D < MIN_MARGIN)
+        close = np.logical_and(close, dD > 0)
+        X[close] += dD_dX[close] / dD[close] * (MIN_MARGIN - D[close])
+        Y[close] += dD_dY[close] / dD[close] * (MIN_MARGIN - D[close])
+
+        occupied = self.obstacle_map.occupied_layers(np.round(rows).astype(int), np.round(cols).astype(int))
+        keep = np.any(~occupied, axis=1)
+        # NOTE: far away from obstacles only every second point of every second lattice row is needed
+        sparse = (J % 2 == 1) | ((J % 4 == 0) & (I % 2 == 1)) | ((J % 4 == 2) & (I % 2 == 0))
+        keep &= ~sparse | (D < 2)
+        return np.stack((X[keep], Y[keep]), axis=1)
+
+    def _update_graph(self, region: tuple[float, float, float, float]) -> None:
+        """Re-test all candidate edges which might cross the given region (x, y, width, height)."""
+        assert self.obstacle_map is not None
+        assert self.graph is not None
+        pixel_size = self.obstacle_map.grid.pixel_size
+        min_x, min_y = region[0] - pixel_size, region[1] - pixel_size
+        max_x, max_y = region[0] + region[2] + pixel_size, region[1] + region[3] + pixel_size
+
+        # NOTE: a spline between two neighbors stays within one edge length of the edge's midpoint
+        points0 = self.node_poses[self.graph.candidate_sources, :2]
+        points1 = self.node_poses[self.graph.candidate_targets, :2]
+        midpoints = (points0 + points1) / 2
+        reach = np.linalg.norm(points1 - points0, axis=1)
+        close = np.flatnonzero((midpoints[:, 0] > min_x - reach) & (midpoints[:, 0] < max_x + reach) &
+                               (midpoints[:, 1] > min_y - reach) & (midpoints[:, 1] < max_y + reach))
+        if len(close):
+            lengths = self._test_candidates(self.graph.candidate_sources[close], self.graph.candidate_targets[close])
+            self.graph.update_candidates(close, lengths)
+
+    def _test_candidates(self, sources: np.ndarray, targets: np.ndarray, max_samples: int = 1_000_000) -> np.ndarray:
+        """Compute the lengths of the splines between the given nodes or ``NaN`` if they collide with an obstacle.
+
+        The splines are sampled and looked up in the obstacle map in large batches of up to ``max_samples`` samples.
+        """
+        assert self.obstacle_map is not None
+        lengths = np.empty(len(sources))
+        counts = _sample_counts(self.obstacle_map.grid, self.node_poses[sources], self.node_poses[targets])
+        cumulative = np.cumsum(counts)
+        i = 0
+        while i < len(sources):
+            # NOTE: long splines (e.g. between distant tiles) need many samples, so batches are limited by samples
+            done = cumulative[i - 1] if i > 0 else 0
+            j = max(int(np.searchsorted(cumulative, done + max_samples, side='right')), i + 1)
+            start = self.node_poses[sources[i:j]]
+            end = self.node_poses[targets[i:j]]
+            x, y, yaw, offsets = _sample_splines(self.obstacle_map.grid, start, end)
+            row, col, layer = self.obstacle_map.grid.to_3d_grid(x, y, yaw)
+            hits = self.obstacle_map.occupied(row, col, layer)
+            steps = np.sqrt(np.diff(x)**2 + np.diff(y)**2)
+            steps[offsets[1:-1] - 1] = 0  # NOTE: remove steps between consecutive splines
+            collision = np.zeros(len(start), dtype=bool)
+            length = np.zeros(len(start))
+            sampled = np.flatnonzero(np.diff(offsets) > 0)
+            if len(sampled):
+                collision[sampled] = np.logical_or.reduceat(hits, offsets[sampled])
+                length[sampled] = np.add.reduceat(np.append(steps, 0), offsets[sampled])
+            lengths[i:j] = np.where(collision, np.nan, length)
+            i = j
+        return lengths
+
+    def search(self, start: Pose, goal: Pose, deadline: float | None = None) -> list[PathSegment]:
+        """Search a path from start to goal.
+
+        Without a deadline the cheapest path through the graph (including the passages from the start and to the goal)
+        is shortened until no shortcut is left.
+        With a deadline the search runs in anytime mode: the first path through the graph is improved
+        by shortcuts and by connecting start and goal via more passages (see ``ANYTIME_PASSAGES``)
+        until the deadline has passed, and the best path found so far is returned.
+        The improvements are recorded in ``search_history``.
+        """
         assert self.obstacle_map is not None
         assert self.graph is not None
         assert self.pose_groups is not None
+        assert self.tri_tree is not None
+        simple_path = self._simple_path(start, goal)
+        if simple_path is not None:
+            return simple_path
+
+        t0 = time.time()
+        self.search_history = []
+        best: list[PathSegment] | None = None
+        best_stage = -1
+        error: RuntimeError | None = None
+        for stage, (max_num_groups, max_num_results) in enumerate(ANYTIME_PASSAGES[:1] if deadline is None else ANYTIME_PASSAGES):
+            if best is not None and deadline is not None and time.time() > deadline:
+                break
+            try:
+                graph_path = self._graph_path(start, goal,
+                                              max_num_groups=max_num_groups, max_num_results=max_num_results)
+            except RuntimeError as e:
+                error = e
+                continue
+            path = graph_path
+            for path in self._shortcut(graph_path, deadline):
+                # NOTE: shortcuts trade a little length for fewer segments, so they always improve the current path
+                if best is None or best_stage == stage:
+                    best, best_stage = list(path), stage
+                    self._record_improvement(t0, best, stage)
+            if best is not None and best_stage != stage and _path_cost(path) < _path_cost(best):
+                best, best_stage = list(path), stage
+                self._record_improvement(t0, best, stage)
+        if best is None:
+            assert error is not None
+            raise error
+        if deadline is not None:
+            self.log.debug('anytime search improved the path %d times (final cost: %.2f)',
+                           len(self.search_history), self.search_history[-1].cost)
+        return best
+
+    def search_many(self, start: Pose, goals: list[Pose]) -> list[list[PathSegment] | None]:
+        """Search paths from the start to each of the goals.
+
+        Like ``search`` without a deadline, but the passages entering the graph from the start
+        and a single Dijkstra search are shared by all goals which cannot be reached with a single spline or shunt.
+
+        :return: one path per goal (``None`` if the goal cannot be reached)
+        """
+        assert self.graph is not None
+        paths = [self._simple_path(start, goal) for goal in goals]
+        remaining = [i for i, path in enumerate(paths) if path is None]
+        if not remaining:
+            return paths
+        entries = self._passages(start, True)
+        exits = [self._passages(goals[i], False) for i in remaining]
+        node_sequences = self.graph.search_many({node: cost for node, (cost, _) in entries.items()},
+                                                [{node: cost for node, (cost, _) in goal_exits.items()}
+                                                 for goal_exits in exits])
+        for i, goal_exits, nodes in zip(remaining, exits, node_sequences, strict=True):
+            if nodes is None:
+                continue
+            path = self._to_path(nodes, entries, goal_exits)
+            for _ in self._shortcut(path):
+                pass  # NOTE: the path is shortened in place
+            paths[i] = path
+        return paths
+
+    def cost_matrix(self, poses: list[Pose]) -> np.ndarray:
+        """Estimate the costs of driving between all pairs of poses, e.g. to order the goals of a tour.
+
+        The cost from pose ``i`` to pose ``j`` is the cost of the cheapest path through the graph before shortcuts,
+        with backward segments weighted by ``BACKWARD_PENALTY`` (``inf`` if there is no such path).
+        All costs are computed with a single Dijkstra call.
+        """
+        assert self.graph is not None
+        entries = [self._passages(pose, True) for pose in poses]
+        exits = [self._passages(pose, False) for pose in poses]
+        costs = self.graph.cost_matrix([{node: cost for node, (cost, _) in e.items()} for e in entries],
+                                       [{node: cost for node, (cost, _) in e.items()} for e in exits])
+        np.fill_diagonal(costs, 0.0)
+        return costs
+
+    def _simple_path(self, start: Pose, goal: Pose) -> list[PathSegment] | None:
+        """Find the shortest path consisting of a single spline or a single shunt (if enabled)."""
+        assert self.obstacle_map is not None
         paths: list[list[PathSegment]] = []
 
         if TRY_SINGLE_PATH:
@@ -167,127 +427,231 @@ class DelaunayPlanner:
         if paths:
             self.log.info('found single shunt to reach goal')
             return min(paths, key=lambda path: path[0].spline.estimated_length() + path[1].spline.estimated_length())
+        return None
+
+    def _record_improvement(self, t0: float, path: list[PathSegment], stage: int) -> None:
+        self.search_history.append(SearchImprovement(time=time.time() - t0, cost=float(_path_cost(path)),
+                                                     num_segments=len(path), stage=stage))
 
-        grid_entries = _find_grid_passages(self.obstacle_map, self.pose_groups, start, True)
-        grid_exits = _find_grid_passages(self.obstacle_map, self.pose_groups, goal, False)
-        if not grid_entries:
+    def _graph_path(self, start: Pose, goal: Pose, *, max_num_groups: int, max_num_results: int) -> list[PathSegment]:
+        """Find the cheapest path through the graph connected to start and goal with the given passages."""
+        assert self.graph is not None
+        entries = self._passages(start, True, max_num_groups=max_num_groups, max_num_results=max_num_results)
+        exits = self._passages(goal, False, max_num_groups=max_num_groups, max_num_results=max_num_results)
+        if not entries:
             raise RuntimeError('could not find start segment')
-        if not grid_exits:
+        if not exits:
             raise RuntimeError('could not find exit segment')
 
-        for enter, exit_ in itertools.product(grid_entries, grid_exits):
-            p, g = enter.coordinate
-            p_, g_ = exit_.coordinate
-            path: list[PathSegment] = [enter.segment]
-            last_g, last_p = g, p
-            try:
-                for next_g, next_p in nx.shortest_path(self.graph, (g, p), (g_, p_), weight='weight')[1:]:
-                    last_pose = self.pose_groups[last_g].poses[last_p]
-                    next_pose = self.pose_groups[next_g].poses[next_p]
-                    backward = self.graph.edges[((last_g, last_p), (next_g, next_p))]['backward']
-                    spline = Spline.from_poses(last_pose, next_pose, backward=backward)
-                    path.append(PathSegment(spline=spline, backward=backward))
-                    last_g, last_p = next_g, next_p
-            except nx.exception.NetworkXNoPath:
-                continue
-            path.append(exit_.segment)
-
-            while True:
-                shortcuts: list[PathSegment] = []
-                for step_size in [1, 2]:
-                    for s in range(len(path) - step_size):
-                        new_start = Pose(
-                            x=path[s].spline.start.x,
-                            y=path[s].spline.start.y,
-                            yaw=path[s].spline.yaw(0) + (np.pi if path[s].backward else 0),
-                        )
-                        new_end = Pose(
-                            x=path[s+step_size].spline.end.x,
-                            y=path[s+step_size].spline.end.y,
-                            yaw=path[s+step_size].spline.yaw(1) + (np.pi if path[s+step_size].backward else 0),
-                        )
-                        if abs(angle(new_start.yaw, new_end.yaw + np.pi)) < 0.01:
-                            continue
-                        for new_backward in [False, True]:
-                            new_spline = Spline.from_poses(new_start, new_end, backward=new_backward)
-                            if not _is_healthy(new_spline):
-                                continue
-                            if self.obstacle_map.test_spline(new_spline, new_backward):
-                                continue
-                            combined_length = path[s].spline.estimated_length() + \
-                                path[s+step_size].spline.estimated_length()
-                            if .9 * new_spline.estimated_length() > combined_length:
-                                continue
-                            shortcuts.append(PathSegment(spline=new_spline, backward=new_backward))
-                        if shortcuts:
-                            lengths = [segment.spline.estimated_length() for segment in shortcuts]
-                            path[s] = shortcuts[np.argmin(lengths)]
-                            for _ in range(step_size):
-                                del path[s+1]
-                            break  # restart while loop
-                    if shortcuts:
-                        break  # restart while loop
-                if not shortcuts:
-                    break  # exit while loop
-            paths.append(path)
-        if not paths:
+        nodes = self.graph.search({node: cost for node, (cost, _) in entries.items()},
+                                  {node: cost for node, (cost, _) in exits.items()})
+        if nodes is None:
             raise RuntimeError('could not find path')
-        return min(paths, key=len)
-
-
-def _tri_neighbors(tri_mesh: spatial.Delaunay, vertex_index: int) -> np.ndarray:
-    return tri_mesh.vertex_neighbor_vertices[1][tri_mesh.vertex_neighbor_vertices[0][vertex_index]:
-                                                tri_mesh.vertex_neighbor_vertices[0][vertex_index + 1]]
-
-
-@lru_cache(maxsize=1000)
-def _t_array(n: int) -> np.ndarray:
-    return np.linspace(0, 1, n)
+        return self._to_path(nodes, entries, exits)
 
-
-@lru_cache(maxsize=10000)
-def _generate_pose_offsets(grid: Grid, dx: float, dy: float, yaw: float, yaw_: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
-    spline = FastSpline(0, 0, yaw, dx, dy, yaw_, False)
-    row0, col0, layer0 = grid.to_3d_grid(0, 0, yaw)
-    row1, col1, layer1 = grid.to_3d_grid(dx, dy, yaw_)
-    num_rows = int(abs(row1 - row0))
-    num_cols = int(abs(col1 - col0))
-    num_layers = int(abs(layer1 - layer0))
-    t = _t_array(max(num_rows, num_cols, num_layers))
-    return (spline.x(t), spline.y(t), spline.yaw(t) + [0, np.pi][spline.backward])
-
-
-def _generate_poses(grid: Grid, pose: Pose, pose_: Pose) -> tuple:
-    dx, dy, yaw = _generate_pose_offsets(grid, pose_.x - pose.x, pose_.y - pose.y, pose.yaw, pose_.yaw)
-    return pose.x + dx, pose.y + dy, yaw
+    def _passages(self, pose: Pose, entering: bool, *,
+                  max_num_groups: int = ANYTIME_PASSAGES[0][0],
+                  max_num_results: int = ANYTIME_PASSAGES[0][1]) -> dict[int, tuple[float, Passage]]:
+        """Find the cheapest passages between the pose and the graph nodes close to it."""
+        assert self.obstacle_map is not None
+        assert self.graph is not None
+        assert self.pose_groups is not None
+        assert self.tri_tree is not None
+        grid_passages = _find_grid_passages(self.obstacle_map, self.tri_tree, self.pose_groups, pose, entering,
+                                            max_num_groups=max_num_groups, max_num_results=max_num_results)
+        return _cheapest_passages(self.graph, grid_passages)
+
+    def _to_path(self, nodes: list[int],
+                 entries: dict[int, tuple[float, Passage]],
+                 exits: dict[int, tuple[float, Passage]]) -> list[PathSegment]:
+        """Convert a node sequence into a path from the entry passage via graph edges to the exit passage."""
+        assert self.graph is not None
+        assert self.pose_groups is not None
+        path: list[PathSegment] = [entries[nodes[0]][1].segment]
+        for last_node, next_node in itertools.pairwise(nodes):
+            last_g, last_p = self.graph.coordinate(last_node)
+            next_g, next_p = self.graph.coordinate(next_node)
+            last_pose = self.pose_groups[last_g].poses[last_p]
+            next_pose = self.pose_groups[next_g].poses[next_p]
+            edge = self.graph.edge(last_node, next_node)
+            assert edge is not None
+            backward = bool(self.graph.backward[edge])
+            spline = Spline.from_poses(last_pose, next_pose, backward=backward)
+            path.append(PathSegment(spline=spline, backward=backward))
+        path.append(exits[nodes[-1]][1].segment)
+
+        return path
+
+    def _shortcut(self, path: list[PathSegment], deadline: float | None = None) -> Generator[list[PathSegment], None, None]:
+        """Replace consecutive segments by shorter collision-free splines until no shortcut is left.
+
+        The first shortcut is applied (step size 1 before 2, first segment first) and the path is scanned again.
+        A shortcut only depends on the first and the last segment it replaces,
+        so it is computed once per pair of segments; new pairs are computed in batches in scan order.
+        The initial path and the path after each shortcut are yielded, so callers can stop at any time.
+
+        :param deadline: stop shortening when this time has passed
+        """
+        yield path
+        keys = list(range(len(path)))
+        lengths = [segment.spline.estimated_length() for segment in path]
+        shortcuts: dict[tuple[int, int], tuple[PathSegment, float] | None] = {}
+        while deadline is None or time.time() < deadline:
+            positions = [(s, step_size) for step_size in [1, 2] for s in range(len(path) - step_size)]
+            for i, (s, step_size) in enumerate(positions):
+                if (keys[s], keys[s+step_size]) not in shortcuts:
+                    self._find_shortcuts(path, keys, lengths, shortcuts, positions[i:i+SHORTCUT_BATCH_SIZE])
+                shortcut = shortcuts[keys[s], keys[s+step_size]]
+                if shortcut is not None:
+                    break
+            else:
+                break  # NOTE: no shortcut left
+            assert shortcut is not None
+            path[s:s+step_size+1] = [shortcut[0]]
+            keys[s:s+step_size+1] = [max(keys) + 1]
+            lengths[s:s+step_size+1] = [shortcut[1]]
+            yield path
+
+    def _find_shortcuts(self,
+                        path: list[PathSegment],
+                        keys: list[int],
+                        lengths: list[float],
+                        shortcuts: dict[tuple[int, int], tuple[PathSegment, float] | None],
+                        positions: list[tuple[int, int]]) -> None:
+        """Compute the shortest shortcut and its length for the new pairs of segments at the given positions (index, step size)."""
+        assert self.obstacle_map is not None
+        pairs: list[tuple[int, int]] = []
+        candidates: list[tuple[tuple[int, int], PathSegment, float]] = []
+        for s, step_size in positions:
+            pair = keys[s], keys[s+step_size]
+            if pair in shortcuts:
+                continue
+            pairs.append(pair)
+            new_start = Pose(
+                x=path[s].spline.start.x,
+                y=path[s].spline.start.y,
+                yaw=path[s].spline.yaw(0) + (np.pi if path[s].backward else 0),
+            )
+            new_end = Pose(
+                x=path[s+step_size].spline.end.x,
+                y=path[s+step_size].spline.end.y,
+                yaw=path[s+step_size].spline.yaw(1) + (np.pi if path[s+step_size].backward else 0),
+            )
+            if abs(angle(new_start.yaw, new_end.yaw + np.pi)) < 0.01:
+                continue
+            for new_backward in [False, True]:
+                new_spline = Spline.from_poses(new_start, new_end, backward=new_backward)
+                length = new_spline.estimated_length()
+                if .9 * length > lengths[s] + lengths[s+step_size]:
+                    continue
+                candidates.append((pair, PathSegment(spline=new_spline, backward=new_backward), length))
+        batch = SplineBatch.from_path([segment for _, segment, _ in candidates])
+        candidates = [candidate for candidate, healthy in zip(candidates, batch.healthy(), strict=True) if healthy]
+        collisions = self.obstacle_map.test_splines([segment.spline for _, segment, _ in candidates],
+                                                    [segment.backward for _, segment, _ in candidates])
+        for pair in pairs:
+            shortcuts[pair] = None
+        for (pair, segment, length), collision in zip(candidates, collisions, strict=True):
+            best = shortcuts[pair]
+            if not collision and (best is None or length < best[1]):
+                shortcuts[pair] = segment, length
+
+
+def _lattice(grid: Grid) -> tuple[np.ndarray, np.ndarray]:
+    """Get the row and column indices of the triangular lattice points within the grid (or its tiles in use)."""
+    min_x, min_y, size_x, size_y = grid.bbox
+    dy = GRID_RESOLUTION * np.sqrt(3) / 2
+    num_rows = len(np.arange(min_y, min_y + size_y, dy))
+    num_cols = len(np.arange(min_x, min_x + size_x - GRID_RESOLUTION / 2, GRID_RESOLUTION))
+    if not isinstance(grid, TiledGrid):
+        J, I = np.meshgrid(np.arange(num_rows), np.arange(num_cols), indexing='ij')
+        return J.flatten(), I.flatten()
+    lattices = [(np.zeros(0, dtype=int), np.zeros(0, dtype=int))]
+    for tile in sorted(grid.tiles):
+        row0, row1, col0, col1 = grid.tile_bounds(tile)
+        x0, y0 = grid.from_grid(row0 - 0.5, col0 - 0.5)
+        x1, y1 = grid.from_grid(row1 - 0.5, col1 - 0.5)
+        J, I = np.meshgrid(np.arange(max(int(np.floor((y0 - min_y) / dy)), 0),
+                                     min(int(np.ceil((y1 - min_y) / dy)) + 1, num_rows)),
+                           np.arange(max(int(np.floor((x0 - min_x) / GRID_RESOLUTION)) - 1, 0),
+                                     min(int(np.ceil((x1 - min_x) / GRID_RESOLUTION)) + 1, num_cols)),
+                           indexing='ij')
+        J, I = J.flatten(), I.flatten()
+        rows, cols = grid.to_grid(min_x + I * GRID_RESOLUTION + (J % 2 == 0) * GRID_RESOLUTION / 2,
+                                  min_y + J * dy)
+        rows, cols = np.floor(rows + 0.5), np.floor(cols + 0.5)
+        inside = (rows >= row0) & (rows < row1) & (cols >= col0) & (cols < col1)
+        lattices.append((J[inside], I[inside]))
+    return np.concatenate([J for J, _ in lattices]), np.concatenate([I for _, I in lattices])
+
+
+def _sample_counts(grid: Grid, start: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """Get the number of samples of the forward splines between pairs of poses (see ``_sample_splines``)."""
+    dx = end[:, 0] - start[:, 0]
+    dy = end[:, 1] - start[:, 1]
+    row0, col0, layer0 = grid.to_3d_grid(np.zeros_like(dx), np.zeros_like(dy), start[:, 2])
+    row1, col1, layer1 = grid.to_3d_grid(dx, dy, end[:, 2])
+    return np.maximum.reduce([np.abs(row1 - row0), np.abs(col1 - col0), np.abs(layer1 - layer0)]).astype(int)
+
+
+def _sample_splines(grid: Grid, start: np.ndarray, end: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Sample forward splines between pairs of poses (rows of x, y, yaw) with about one sample per grid cell.
+
+    The samples of all splines are concatenated; spline ``i`` covers the samples ``offsets[i]:offsets[i+1]``.
+    """
+    dx = end[:, 0] - start[:, 0]
+    dy = end[:, 1] - start[:, 1]
+    counts = _sample_counts(grid, start, end)
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    index = np.repeat(np.arange(len(counts)), counts)
+    t = (np.arange(offsets[-1]) - offsets[index]) / np.maximum(counts[index] - 1, 1)
+    spline = FastSpline(0, 0, start[index, 2], dx[index], dy[index], end[index, 2], False)
+    return start[index, 0] + spline.x(t), start[index, 1] + spline.y(t), spline.yaw(t), offsets
+
+
+def _path_cost(path: list[PathSegment]) -> float:
+    return sum(segment.spline.estimated_length() * (BACKWARD_PENALTY if segment.backward else 1) for segment in path)
 
 
 def _is_healthy(spline: Spline, curvature_limit: float = 10.0) -> bool:
     return np.abs(spline.max_curvature()) < curvature_limit
 
 
-@dataclass(slots=True, kw_only=True)
-class Passage:
-    segment: PathSegment
-    coordinate: tuple[int, int]
-
-
-def _find_grid_passages(obstacle_map: ObstacleMap,
+def _find_grid_passages(obstacle_map: BaseObstacleMap,
+                        tri_tree: spatial.cKDTree,
                         pose_groups: list[DelaunayPoseGroup],
                         pose: Pose,
-                        entering: bool,
+                        entering: bool, *,
                         max_num_groups: int = 10,
                         max_num_results: int = 3) -> list[Passage]:
-    group_distances = [g.point.distance(pose) for g in pose_groups]
-    group_indices = np.argsort(group_distances)
-    results: list[Passage] = []
-    for g, group in zip(group_indices, np.array(pose_groups)[group_indices][:max_num_groups], strict=False):
-        for p, group_pose in enumerate(group.poses):
-            for backward in [False, True]:
-                poses = (pose, group_pose) if entering else (group_pose, pose)
-                spline = Spline.from_poses(*poses, backward=backward)
-                if _is_healthy(spline) and not obstacle_map.test_spline(spline, backward):
-                    passage = Passage(segment=PathSegment(spline=spline, backward=backward), coordinate=(p, g))
-                    results.append(passage)
+    """Find the shortest collision-free splines between the pose and the poses of the closest pose groups."""
+    _, group_indices = tri_tree.query([pose.x, pose.y], k=min(max_num_groups, tri_tree.n))
+    group_poses = [(p, g, group_pose) for g in np.atleast_1d(group_indices).tolist()
+                   for p, group_pose in enumerate(pose_groups[g].poses)]
+    # NOTE: every group pose is connected forward and backward
+    poses = np.array([[q.x, q.y, q.yaw] for _, _, q in group_poses]).reshape(-1, 3).repeat(2, axis=0)
+    own_poses = np.broadcast_to([pose.x, pose.y, pose.yaw], poses.shape)
+    backward = np.tile([False, True], len(group_poses))
+    splines = SplineBatch.from_poses(own_poses, poses, backward=backward) if entering else \
+        SplineBatch.from_poses(poses, own_poses, backward=backward)
+    healthy = np.flatnonzero(splines.healthy())
+    collisions = obstacle_map.test_splines(splines[healthy])
+    results = [
+        Passage(segment=PathSegment(spline=splines.spline(i), backward=bool(backward[i])),
+                coordinate=group_poses[i // 2][:2])
+        for i in healthy[~collisions].tolist()
+    ]
     results.sort(key=lambda passage: passage.segment.spline.estimated_length())
     return results[:max_num_results]
+
+
+def _cheapest_passages(graph: DelaunayGraph, passages: list[Passage]) -> dict[int, tuple[float, Passage]]:
+    """Map graph nodes to the cheapest passage connected to them and its cost."""
+    result: dict[int, tuple[float, Passage]] = {}
+    for passage in passages:
+        p, g = passage.coordinate
+        node = graph.node(g, p)
+        cost = passage.segment.spline.estimated_length() * (BACKWARD_PENALTY if passage.segment.backward else 1)
+        if node not in result or cost < result[node][0]:
+            result[node] = (cost, passage)
+    return result
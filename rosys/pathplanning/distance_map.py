@@ -1,83 +1,81 @@
 import time
 
 import numpy as np
-import scipy.interpolate
+from scipy import ndimage
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
 
 from ..geometry import Point
 from .obstacle_map import ObstacleMap
 
+NEIGHBORS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
 
-class DistanceMap:
 
-    def __init__(self, obstacle_map: ObstacleMap, target: Point, deadline: float | None = None):
-        self.grid = obstacle_map.grid
-        scaled_obstacle_map = obstacle_map.map
+class DistanceMap:
+    INF = 1000000
 
-        self.INF = 1000000
-        self.F = 100
-        dx = self.F * self.grid.bbox[2] / self.grid.size[1]
-        dy = self.F * self.grid.bbox[3] / self.grid.size[0]
-        self.DX = int(dx)
-        self.DY = int(dy)
-        self.DD = int(np.sqrt(dx**2 + dy**2))
+    def __init__(self, obstacle_map: ObstacleMap, target: Point, deadline: float | None = None) -> None:
+        """Compute the shortest path length from every grid cell to the target while avoiding obstacle cells.
 
-        scaled_inf = self.F * self.INF
+        The distances are computed in a single pass with Dijkstra's algorithm on the 8-connected grid.
+        Obstacle cells and cells which cannot reach the target are infinitely far away.
+        """
+        self.grid = obstacle_map.grid
+        rows, cols = self.grid.size[:2]
+        free = ~obstacle_map.map.astype(bool)
+        dx = self.grid.bbox[2] / cols
+        dy = self.grid.bbox[3] / rows
 
-        d = np.zeros(self.grid.size[:2], dtype=int)
-        d.fill(scaled_inf)
+        # NOTE: one extra node connected to the cells around the target acts as the source
+        source = rows * cols
+        index = np.arange(source).reshape(rows, cols)
+        sources: list[np.ndarray] = []
+        targets: list[np.ndarray] = []
+        weights: list[np.ndarray] = []
+        for dr, dc in NEIGHBORS:
+            from_cells = index[max(-dr, 0):rows - max(dr, 0), max(-dc, 0):cols - max(dc, 0)]
+            to_cells = index[max(dr, 0):rows + min(dr, 0), max(dc, 0):cols + min(dc, 0)]
+            passable = free.ravel()[from_cells] & free.ravel()[to_cells]
+            sources.append(from_cells[passable])
+            targets.append(to_cells[passable])
+            weights.append(np.full(np.count_nonzero(passable), np.hypot(dr * dy, dc * dx)))
         row, col = self.grid.to_grid(target.x, target.y)
-        for r in [np.floor(row), np.ceil(row)]:
-            for c in [np.floor(col), np.ceil(col)]:
-                d[int(r), int(c)] = np.sqrt((row - r)**2 + (col - c)**2)
+        for r in sorted({int(np.floor(row)), int(np.ceil(row))}):
+            for c in sorted({int(np.floor(col)), int(np.ceil(col))}):
+                if 0 <= r < rows and 0 <= c < cols and free[r, c]:
+                    sources.append(np.array([source]))
+                    targets.append(np.array([index[r, c]]))
+                    # NOTE: explicit zeros are ignored by csgraph, so the target cell itself gets a tiny weight
+                    weights.append(np.array([max(np.hypot((row - r) * dy, (col - c) * dx), 1e-9)]))
+        graph = csr_matrix((np.concatenate(weights), (np.concatenate(sources), np.concatenate(targets))),
+                           shape=(source + 1, source + 1))
+        if deadline and time.time() > deadline:
+            raise TimeoutError('distance map creation took too long')
+        distances = dijkstra(graph, indices=source)[:source].reshape(rows, cols)
+        if deadline and time.time() > deadline:
+            raise TimeoutError('distance map creation took too long')
 
-        old_sum = d.sum()
-        while True:
-            d_dx = d + self.DX
-            d_dy = d + self.DY
-            d_dd = d + self.DD
-            d[1:-1, 1:-1] = np.minimum(
-                d[1:-1, 1:-1],
-                np.minimum(
-                    np.minimum(
-                        np.minimum(d_dy[:-2, 1:-1], d_dy[+2:, 1:-1]),
-                        np.minimum(d_dx[1:-1, :-2], d_dx[1:-1, +2:])
-                    ),
-                    np.minimum(
-                        np.minimum(d_dd[+2:, +2:], d_dd[+2:, :-2]),
-                        np.minimum(d_dd[:-2, +2:], d_dd[:-2, :-2])
-                    )
-                )
-            )
-            d[scaled_obstacle_map] = scaled_inf
-            new_sum = d.sum()
-            if new_sum == old_sum:
-                break
-            old_sum = new_sum
-            if deadline and time.time() > deadline:
-                raise TimeoutError('distance map creation took too long')
+        # NOTE: interpolation works on finite values; results influenced by unreachable cells become infinite again
+        self._values = np.minimum(distances, self.INF)
+        self._grad_y, self._grad_x = np.gradient(self._values)
+        self.map = distances
 
-        self.map = d.astype(float) / self.F
-        gy, gx = np.gradient(self.map)
-
-        rows = np.arange(self.grid.size[0])
-        cols = np.arange(self.grid.size[1])
-        xx, yy = self.grid.from_grid(rows, cols)
-        self._interp = scipy.interpolate.interp2d(xx, yy, self.map, kind='linear')
-        self._grad_x = scipy.interpolate.interp2d(xx, yy, gx, kind='linear')
-        self._grad_y = scipy.interpolate.interp2d(xx, yy, gy, kind='linear')
-
-        self.map[self.map >= self.INF] = np.inf
-
-    def interpolate(self, x, y):
-        result = self._interp(x, y)  # pylint: disable=not-callable
-        result[result >= self.INF / self.F] = np.inf
+    def interpolate(self, x, y) -> np.ndarray:
+        """Bilinearly interpolate the distances at the given points (scalars or arrays of the same shape)."""
+        result = self._sample(self._values, x, y)
+        result[result >= self.INF / 100] = np.inf
         return result
 
-    def gradient(self, x, y):
-        result_x = self._grad_x(x, y)  # pylint: disable=not-callable
-        result_y = self._grad_y(x, y)  # pylint: disable=not-callable
-        result_x[result_x <= -self.INF / self.F] = -np.inf
-        result_y[result_y <= -self.INF / self.F] = -np.inf
-        result_x[result_x >= self.INF / self.F] = np.inf
-        result_y[result_y >= self.INF / self.F] = np.inf
+    def gradient(self, x, y) -> tuple[np.ndarray, np.ndarray]:
+        """Bilinearly interpolate the distance gradient (per cell) at the given points."""
+        result_x = self._sample(self._grad_x, x, y)
+        result_y = self._sample(self._grad_y, x, y)
+        for result in (result_x, result_y):
+            large = np.abs(result) >= self.INF / 100
+            result[large] = np.copysign(np.inf, result[large])
         return result_x, result_y
+
+    def _sample(self, values: np.ndarray, x, y) -> np.ndarray:
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+        row, col = self.grid.to_grid(x, y)
+        return ndimage.map_coordinates(values, [row.ravel(), col.ravel()], order=1, mode='nearest').reshape(x.shape)
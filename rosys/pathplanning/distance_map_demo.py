@@ -32,10 +32,9 @@ with ui.pyplot():
     extent = pt.bbox_to_extent(grid.bbox)
 
 with ui.pyplot():
-    rows = np.arange(0, grid.size[0] - 1, 0.2)
-    cols = np.arange(0, grid.size[1] - 1, 0.2)
-    xx, yy = grid.from_grid(rows, cols)  # pylint: disable=unpacking-non-sequence
-    interp = distance_map.interpolate(xx, yy).reshape(len(rows), len(cols))
+    rows, cols = np.meshgrid(np.arange(0, grid.size[0] - 1, 0.2), np.arange(0, grid.size[1] - 1, 0.2), indexing='ij')
+    xx, yy = grid.from_grid(rows, cols)
+    interp = distance_map.interpolate(xx, yy)
     pl.imshow(interp, cmap=pl.cm.gray, interpolation='nearest',  # pylint: disable=no-member
               extent=extent, clim=[0, 30])
     pt.show_obstacle_map(obstacle_map)
@@ -47,7 +46,7 @@ with ui.pyplot():
             pl.plot([x, x + dx], [y, y + dy], 'C2', lw=1)
 
 with ui.pyplot():
-    Gx = distance_map.gradient(xx, yy)[0].reshape(len(yy), len(xx))
+    Gx = distance_map.gradient(xx, yy)[0]
     pl.imshow(Gx, cmap=pl.cm.gray, interpolation='nearest', extent=extent, clim=[-1, 1])  # pylint: disable=no-member
     pt.show_obstacle_map(obstacle_map)
 
@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+from collections.abc import Iterable
 from typing import overload
 
+import cv2
 import numpy as np
 
 from ..geometry import Point
@@ -33,12 +35,25 @@ class Grid:
         v_size = self.bbox[3] / self.size[0]
         return (h_size + v_size) / 2.0
 
-    def to_grid(self, x: float, y: float) -> tuple[float, float]:
+    @overload
+    def to_grid(self, x: float, y: float) -> tuple[float, float]: ...
+
+    @overload
+    def to_grid(self, x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, np.ndarray]: ...
+
+    def to_grid(self, x: float | np.ndarray, y: float | np.ndarray) -> tuple[float | np.ndarray, float | np.ndarray]:
         row = (y - self.bbox[1]) / self.bbox[3] * self.size[0] - 0.5
         col = (x - self.bbox[0]) / self.bbox[2] * self.size[1] - 0.5
         return row, col
 
-    def to_3d_grid(self, x: float, y: float, yaw: float) -> tuple[float, float, float]:
+    @overload
+    def to_3d_grid(self, x: float, y: float, yaw: float) -> tuple[float, float, float]: ...
+
+    @overload
+    def to_3d_grid(self, x: np.ndarray, y: np.ndarray, yaw: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]: ...
+
+    def to_3d_grid(self, x: float | np.ndarray, y: float | np.ndarray, yaw: float | np.ndarray) \
+            -> tuple[float | np.ndarray, float | np.ndarray, float | np.ndarray]:
         row = (y - self.bbox[1]) / self.bbox[3] * self.size[0] - 0.5
         col = (x - self.bbox[0]) / self.bbox[2] * self.size[1] - 0.5
         layer = (yaw / 2.0 / np.pi * self.size[2]) % self.size[2]
@@ -64,3 +79,90 @@ class Grid:
     def contains(self, point: Point, *, padding: float = 0) -> bool:
         return self.bbox[0] + padding < point.x < self.bbox[0] + self.bbox[2] - padding \
             and self.bbox[1] + padding < point.y < self.bbox[1] + self.bbox[3] - padding
+
+    def subgrid(self, row0: int, row1: int, col0: int, col1: int) -> Grid:
+        """Create a grid covering the given cells (rows and columns) of this grid."""
+        h_size = self.bbox[2] / self.size[1]
+        v_size = self.bbox[3] / self.size[0]
+        return Grid((row1 - row0, col1 - col0, *self.size[2:]),
+                    (self.bbox[0] + col0 * h_size, self.bbox[1] + row0 * v_size,
+                     (col1 - col0) * h_size, (row1 - row0) * v_size))
+
+
+class TiledGrid(Grid):
+    """Grid of which only some square tiles are in use.
+
+    Tile (i, j) covers the rows ``i * tile_size`` to ``(i + 1) * tile_size`` and the columns ``j * tile_size`` to
+    ``(j + 1) * tile_size`` of the grid.
+    Obstacle maps on tiled grids only allocate memory for the tiles in use,
+    so distant areas and obstacles do not result in a huge mostly empty raster.
+    """
+
+    def __init__(self, size, bbox, tile_size: int, tiles: Iterable[tuple[int, int]] = ()) -> None:
+        super().__init__(size, bbox)
+        self.tile_size = tile_size
+        self.tiles: frozenset[tuple[int, int]] = frozenset(tiles)
+
+    @staticmethod
+    def from_points(points: list[Point], pixel_size: float, num_layers: int, *,
+                    padding: float = 0, tile_size: int = 100) -> TiledGrid:
+        """Create a grid around the given points using only the tiles which are closer than ``padding`` to any point."""
+        grid = Grid.from_points(points, pixel_size, num_layers, padding=padding)
+        return TiledGrid(grid.size, grid.bbox, tile_size).with_polygons([[point] for point in points], padding=padding)
+
+    @property
+    def tile_shape(self) -> tuple[int, int]:
+        return -(-self.size[0] // self.tile_size), -(-self.size[1] // self.tile_size)
+
+    def tile_bounds(self, tile: tuple[int, int]) -> tuple[int, int, int, int]:
+        """Get the cells (row0, row1, col0, col1) of a tile."""
+        row0, col0 = tile[0] * self.tile_size, tile[1] * self.tile_size
+        return row0, min(row0 + self.tile_size, self.size[0]), col0, min(col0 + self.tile_size, self.size[1])
+
+    def tile_corners(self) -> list[Point]:
+        """Get the centers of the corner cells of all tiles in use (e.g. to keep them in use when growing the grid)."""
+        points: list[Point] = []
+        for tile in sorted(self.tiles):
+            row0, row1, col0, col1 = self.tile_bounds(tile)
+            for row, col in ((row0, col0), (row0, col1 - 1), (row1 - 1, col0), (row1 - 1, col1 - 1)):
+                x, y = self.from_grid(row, col)
+                points.append(Point(x=x, y=y))
+        return points
+
+    def with_polygons(self, polygons: list[list[Point]], *, padding: float = 0) -> TiledGrid:
+        """Create a copy of this grid which additionally uses all tiles closer than ``padding`` to any of the polygons.
+
+        Polygons may also consist of a single point or two points (a line segment).
+        """
+        used = np.zeros(self.tile_shape, dtype=np.uint8)
+        for tile in self.tiles:
+            used[tile] = 1
+        padding_cells = padding / self.pixel_size
+        # NOTE: polygons are rasterized with subtiles, so the result exceeds the polygons by at most one subtile
+        subdivision = 4
+        subtiles: np.ndarray = np.zeros((used.shape[0] * subdivision, used.shape[1] * subdivision), dtype=np.uint8)
+        subtile_size = self.tile_size / subdivision
+        for polygon in polygons:
+            rows, cols = self.to_grid(np.array([p.x for p in polygon]), np.array([p.y for p in polygon]))
+            if len(polygon) == 1:
+                # NOTE: cell (r, c) belongs to tile (floor((r + 0.5) / tile_size), floor((c + 0.5) / tile_size))
+                i0, i1 = np.floor((rows[0] + 0.5 + np.array([-padding_cells, padding_cells])) / self.tile_size)
+                j0, j1 = np.floor((cols[0] + 0.5 + np.array([-padding_cells, padding_cells])) / self.tile_size)
+                used[max(int(i0), 0):max(int(i1) + 1, 0), max(int(j0), 0):max(int(j1) + 1, 0)] = 1
+                continue
+            # NOTE: cv2 rasterizes pixel centers, so we dilate by one more subtile
+            points = np.stack(((cols + 0.5) / subtile_size - 0.5, (rows + 0.5) / subtile_size - 0.5), axis=1)
+            points = np.round(points * 256).astype(np.int32)
+            polygon_subtiles = np.zeros_like(subtiles)
+            cv2.fillPoly(polygon_subtiles, [points], 1, shift=8)
+            cv2.polylines(polygon_subtiles, [points], True, 1, shift=8)
+            radius = int(np.ceil(padding_cells / subtile_size)) + 1
+            kernel = np.ones((2 * radius + 1, 2 * radius + 1), dtype=np.uint8)
+            subtiles = np.maximum(subtiles, cv2.dilate(polygon_subtiles, kernel))
+        used |= subtiles.reshape(used.shape[0], subdivision, used.shape[1], subdivision).max(axis=(1, 3))
+        tile_rows, tile_cols = np.nonzero(used)
+        return TiledGrid(self.size, self.bbox, self.tile_size, zip(tile_rows.tolist(), tile_cols.tolist(), strict=True))
+
+    def contains(self, point: Point, *, padding: float = 0) -> bool:
+        return super().contains(point, padding=padding) and \
+            self.with_polygons([[point]], padding=padding).tiles <= self.tiles
@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import shutil
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+from .area import Area
+from .grid import Grid
+from .obstacle import Obstacle
+
+CACHE_FORMAT = 1
+"""Increment whenever the cached arrays or the algorithms computing them change."""
+
+
+class MapCache:
+    """Content-addressed on-disk cache of obstacle maps and planning graphs.
+
+    Every entry is a directory named after a hash of everything the arrays depend on
+    and contains one ``.npy`` file per array.
+    Entries are loaded memory-mapped (copy-on-write), so a warm start takes milliseconds
+    and pages are only read from disk when they are used.
+    Only the most recently used entries are kept.
+    """
+
+    def __init__(self, path: Path, *, max_entries: int = 3) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.log = logging.getLogger('rosys.pathplanning.map_cache')
+
+    @staticmethod
+    def key(robot_outline: list[tuple[float, float]], areas: list[Area], obstacles: list[Obstacle], grid: Grid, *,
+            compact: bool = False) -> str:
+        sha = hashlib.sha256()
+        sha.update(np.array([CACHE_FORMAT, *grid.size, compact], dtype=np.int64).tobytes())
+        sha.update(np.array(grid.bbox, dtype=np.float64).tobytes())
+        sha.update(np.array(robot_outline, dtype=np.float64).tobytes())
+        for tag, items in ((b'areas', areas), (b'obstacles', obstacles)):
+            sha.update(tag)
+            for item in items:
+                sha.update(np.array([len(item.outline)], dtype=np.int64).tobytes())
+                sha.update(np.array([(p.x, p.y) for p in item.outline], dtype=np.float64).tobytes())
+        return sha.hexdigest()
+
+    def load(self, key: str) -> dict[str, np.ndarray] | None:
+        """Load the arrays of an entry or return ``None`` if there is no such entry."""
+        directory = self.path / key
+        if not directory.is_dir():
+            return None
+        try:
+            arrays = {file.stem: np.load(file, mmap_mode='c') for file in directory.glob('*.npy')}
+            os.utime(directory)
+        except (OSError, ValueError):
+            self.log.exception('could not load map cache entry %s', key)
+            return None
+        return arrays
+
+    def store(self, key: str, arrays: dict[str, np.ndarray]) -> None:
+        """Store the arrays as a new entry and remove the least recently used entries."""
+        if (self.path / key).is_dir():
+            return
+        # NOTE: write into a temporary directory first so that other processes never see incomplete entries
+        temporary = self.path / f'.{key}-{uuid.uuid4()}'
+        try:
+            temporary.mkdir(parents=True)
+            for name, array in arrays.items():
+                np.save(temporary / f'{name}.npy', array)
+            temporary.rename(self.path / key)
+        except OSError:
+            if not (self.path / key).is_dir():
+                self.log.exception('could not store map cache entry %s', key)
+            shutil.rmtree(temporary, ignore_errors=True)
+            return
+        entries = sorted((p for p in self.path.iterdir() if p.is_dir() and not p.name.startswith('.')),
+                         key=lambda p: p.stat().st_mtime)
+        for entry in entries[:-self.max_entries]:
+            shutil.rmtree(entry, ignore_errors=True)
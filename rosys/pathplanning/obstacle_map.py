@@ -1,103 +1,454 @@
 from __future__ import annotations
 
+import abc
 import time
-from typing import ClassVar, overload
+from concurrent.futures import ThreadPoolExecutor
 
 import cv2
 import numpy as np
 from scipy import ndimage
 
+from ..geometry import Point, Spline, SplineBatch
 from .area import Area
 from .binary_renderer import BinaryRenderer
 from .grid import Grid
 from .obstacle import Obstacle
 from .robot_renderer import RobotRenderer
 
+DISTANCE_RESOLUTION = 0.001
+"""Resolution of the quantized distances of compact obstacle maps (saturating at 65.535 m)."""
 
-class ObstacleMap:
 
-    def __init__(self, grid, map_, robot_renderer, deadline=None) -> None:
+class BaseObstacleMap(abc.ABC):
+    """Collision tests and obstacle distances of robot poses and splines based on the cell lookups of an obstacle map."""
+
+    grid: Grid
+
+    @abc.abstractmethod
+    def covers(self, obstacles: list[Obstacle]) -> bool:
+        """Whether changes of the given obstacles can be applied with ``update()``."""
+
+    @abc.abstractmethod
+    def update(self,
+               areas: list[Area],
+               obstacles: list[Obstacle],
+               changed_obstacles: list[Obstacle],
+               deadline: float | None = None) -> tuple[float, float, float, float] | None:
+        """Update the map in place after some obstacles have been added, removed or modified."""
+
+    @abc.abstractmethod
+    def occupied(self, row, col, layer) -> np.ndarray:
+        """Look up the stack at grid coordinates (cells outside of the grid are free)."""
+
+    @abc.abstractmethod
+    def distance(self, row, col, layer) -> np.ndarray:
+        """Look up the distances at grid coordinates (zero outside of the grid)."""
+
+    @abc.abstractmethod
+    def occupied_layers(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """Look up all layers of the stack at integer grid cells."""
+
+    @abc.abstractmethod
+    def map_distance(self, row, col) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Look up the distance to the nearest cell of the binary map and its gradient (x, y) at grid coordinates."""
+
+    def test(self, x, y, yaw):
+        row, col, layer = self.grid.to_3d_grid(x, y, yaw)
+        return self.occupied(np.array([row]), np.array([col]), np.array([layer]))
+
+    def test_spline(self, spline: Spline, backward: bool = False) -> bool:
+        return bool(self.test_splines([spline], [backward])[0])
+
+    def test_splines(self, splines: list[Spline] | SplineBatch, backward: list[bool] | bool = False) -> np.ndarray:
+        """Test which splines collide with an obstacle (sampling all splines at once, see ``sample_splines``).
+
+        :param backward: whether the robot drives backward along the splines (one flag per spline or for all;
+                         a ``SplineBatch`` has its own flags)
+        :return: boolean array with one entry per spline
+        """
+        x, y, yaw, offsets = self.sample_splines(splines, backward)
+        hits = self.occupied(*self.grid.to_3d_grid(x, y, yaw))
+        result = np.zeros(len(splines), dtype=bool)
+        sampled = np.flatnonzero(np.diff(offsets) > 0)
+        if len(sampled):
+            result[sampled] = np.logical_or.reduceat(hits, offsets[sampled])
+        return result
+
+    def get_distance(self, x, y, yaw) -> np.ndarray:
+        row, col, layer = self.grid.to_3d_grid(x, y, yaw)
+        return self.distance(np.array([row]), np.array([col]), np.array([layer]))
+
+    def get_minimum_spline_distance(self, spline: Spline, backward: bool = False) -> float:
+        return float(self.min_distances([spline], [backward])[0])
+
+    def min_distances(self, splines: list[Spline] | SplineBatch, backward: list[bool] | bool = False) -> np.ndarray:
+        """Compute the minimum obstacle distance along each spline (infinite for splines without samples)."""
+        x, y, yaw, offsets = self.sample_splines(splines, backward)
+        distances = self.distance(*self.grid.to_3d_grid(x, y, yaw))
+        result = np.full(len(splines), np.inf)
+        sampled = np.flatnonzero(np.diff(offsets) > 0)
+        if len(sampled):
+            result[sampled] = np.minimum.reduceat(distances, offsets[sampled])
+        return result
+
+    def sample_splines(self, splines: list[Spline] | SplineBatch, backward: list[bool] | bool = False) \
+            -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Sample robot poses (x, y, yaw) along the splines with about one sample per grid cell or yaw layer.
+
+        The samples of all splines are concatenated; spline ``i`` covers the samples ``offsets[i]:offsets[i+1]``.
+        """
+        if not isinstance(splines, SplineBatch):
+            splines = SplineBatch.from_splines(splines, backward)
+        (a, e), (b, f), (c, g), (d, h) = splines.points.transpose(1, 2, 0)
+        yaw_offset = np.where(splines.backward, np.pi, 0.0)
+        row0, col0, layer0 = self.grid.to_3d_grid(a, e, np.arctan2(f - e, b - a) + yaw_offset)
+        row1, col1, layer1 = self.grid.to_3d_grid(d, h, np.arctan2(h - g, d - c) + yaw_offset)
+        counts = np.maximum.reduce([np.abs(row1 - row0), np.abs(col1 - col0), np.abs(layer1 - layer0)]).astype(int)
+        offsets = np.concatenate(([0], np.cumsum(counts)))
+        index = np.repeat(np.arange(len(splines)), counts)
+        t = (np.arange(offsets[-1]) - offsets[index]) / np.maximum(counts[index] - 1, 1)
+        a, b, c, d, e, f, g, h, yaw_offset = a[index], b[index], c[index], d[index], \
+            e[index], f[index], g[index], h[index], yaw_offset[index]
+        x = t**3 * d + 3 * t**2 * (1 - t) * c + 3 * t * (1 - t)**2 * b + (1 - t)**3 * a
+        y = t**3 * h + 3 * t**2 * (1 - t) * g + 3 * t * (1 - t)**2 * f + (1 - t)**3 * e
+        gx = (d - 3 * c + 3 * b - a) * t**2 + 2 * (c - 2 * b + a) * t + (b - a)
+        gy = (h - 3 * g + 3 * f - e) * t**2 + 2 * (g - 2 * f + e) * t + (f - e)
+        return x, y, np.arctan2(gy, gx) + yaw_offset, offsets
+
+
+class ObstacleMap(BaseObstacleMap):
+
+    def __init__(self, grid, map_, robot_renderer, deadline=None, *, workers: int = 1, compact: bool = False,
+                 stacks: tuple[np.ndarray, np.ndarray] | None = None) -> None:
+        """Create an obstacle map by dilating the binary map with the robot shape for every yaw layer of the grid.
+
+        Compact maps store the occupancy stack bit-packed along the columns (``uint8``)
+        and the distances quantized to ``DISTANCE_RESOLUTION`` (``uint16``), which needs about 4 times less memory.
+
+        :param workers: number of threads building the layers in parallel (cv2 and scipy release the GIL)
+        :param compact: whether to use the compact representation
+        :param stacks: existing occupancy and distance stacks to wrap instead of building them (see ``from_stacks()``)
+        """
         self.grid = grid
         self.map = map_
-        self.stack = np.zeros(grid.size, dtype=bool)
-        self.dist_stack = np.zeros(self.stack.shape)
-        for layer in range(grid.size[2]):
+        self.robot_renderer = robot_renderer
+        if stacks is not None:
+            self.stack, self.dist_stack = stacks
+            self.compact = self.dist_stack.dtype == np.uint16
+            if map_ is not None and robot_renderer is not None:
+                self._max_distances = self._decode(self.dist_stack.max(axis=(0, 1)))
+            return
+        self.compact = compact
+        # NOTE: when yaw wraps around, lookups should wrap around on axis 2, so we allocate one extra layer
+        rows, cols, layers = grid.size[0], grid.size[1], grid.size[2] + 1
+        if compact:
+            self.stack = np.zeros((rows, (cols + 7) // 8, layers), dtype=np.uint8)
+            self.dist_stack = np.zeros((rows, cols, layers), dtype=np.uint16)
+        else:
+            self.stack = np.zeros((rows, cols, layers), dtype=bool)
+            self.dist_stack = np.zeros((rows, cols, layers))
+        map_uint8 = self.map.astype(np.uint8)
+
+        def build_layer(layer: int) -> None:
             _, _, yaw = grid.from_3d_grid(0, 0, layer)
             kernel = robot_renderer.render(grid.pixel_size, yaw).astype(np.uint8)
-            self.stack[:, :, layer] = cv2.dilate(self.map.astype(np.uint8), kernel)
-            self.dist_stack[:, :, layer] = \
-                ndimage.distance_transform_edt(~self.stack[:, :, layer]) * grid.pixel_size
+            layer_stack = cv2.dilate(map_uint8, kernel).astype(bool)
+            self._set_stack_layer(layer, layer_stack, 0, 0)
+            self._set_dist_layer(layer, _distances(~layer_stack, grid.pixel_size), 0, 0)
             if deadline and time.time() > deadline:
                 raise TimeoutError('obstacle map creation took too long')
 
-        # NOTE: when yaw wraps around, map_coordinates should wrap around on axis 2
-        self.stack = np.dstack((self.stack, self.stack[:, :, :1]))
-        self.dist_stack = np.dstack((self.dist_stack, self.dist_stack[:, :, :1]))
+        if workers > 1:
+            executor = ThreadPoolExecutor(max_workers=workers)
+            try:
+                for future in [executor.submit(build_layer, layer) for layer in range(grid.size[2])]:
+                    future.result()
+            finally:
+                executor.shutdown(cancel_futures=True)
+        else:
+            for layer in range(grid.size[2]):
+                build_layer(layer)
+
+        self.stack[:, :, -1] = self.stack[:, :, 0]
+        self.dist_stack[:, :, -1] = self.dist_stack[:, :, 0]
+        self._max_distances = self._decode(self.dist_stack.max(axis=(0, 1)))
+
+    @staticmethod
+    def from_stacks(grid: Grid, stack: np.ndarray, dist_stack: np.ndarray, *,
+                    map_: np.ndarray | None = None, robot_renderer: RobotRenderer | None = None) -> ObstacleMap:
+        """Wrap existing stacks (e.g. in shared memory or from a cache) without rendering anything.
+
+        Compact stacks are recognized by their data types.
+        The binary map and the robot renderer are only needed for updating the map incrementally.
+        """
+        return ObstacleMap(grid, map_, robot_renderer, stacks=(stack, dist_stack))
 
     @staticmethod
-    def from_list(grid, obstacles, robot_renderer) -> ObstacleMap:
+    def from_list(grid, obstacles, robot_renderer, *, workers: int = 1, compact: bool = False) -> ObstacleMap:
         map_ = np.zeros(grid.size[:2], dtype=bool)
         for x, y, w, h in obstacles:
             r0, c0 = grid.to_grid(x, y)
             r1, c1 = grid.to_grid(x + w, y + h)
             map_[int(np.round(r0)):int(np.round(r1))+1,
                  int(np.round(c0)):int(np.round(c1))+1] = True
-        return ObstacleMap(grid, map_, robot_renderer)
+        return ObstacleMap(grid, map_, robot_renderer, workers=workers, compact=compact)
 
     @staticmethod
     def from_world(robot_outline: list[tuple[float, float]],
                    areas: list[Area],
                    obstacles: list[Obstacle],
                    grid: Grid,
-                   deadline: float | None = None) -> ObstacleMap:
+                   deadline: float | None = None, *,
+                   workers: int = 1,
+                   compact: bool = False) -> ObstacleMap:
         robot_renderer = RobotRenderer(robot_outline)
-        has_areas = any(len(a.outline) > 2 for a in areas)
-        binary_renderer = BinaryRenderer(grid.size[:2], fill_value=has_areas)
-        for area in areas:
-            binary_renderer.polygon(np.array([grid.to_grid(p.x, p.y)[::-1] for p in area.outline]), False)
-            if deadline and time.time() > deadline:
-                raise TimeoutError('obstacle map creation took too long')
-        for obstacle in obstacles:
-            binary_renderer.polygon(np.array([grid.to_grid(p.x, p.y)[::-1] for p in obstacle.outline]))
+        map_ = render_world(grid, areas, obstacles, (0, grid.size[0], 0, grid.size[1]), deadline)
+        return ObstacleMap(grid, map_, robot_renderer, deadline, workers=workers, compact=compact)
+
+    def covers(self, obstacles: list[Obstacle]) -> bool:  # pylint: disable=unused-argument
+        """Whether changes of the given obstacles can be applied with ``update()``."""
+        return True
+
+    def update(self,
+               areas: list[Area],
+               obstacles: list[Obstacle],
+               changed_obstacles: list[Obstacle],
+               deadline: float | None = None) -> tuple[float, float, float, float] | None:
+        """Update the map in place after some obstacles have been added, removed or modified.
+
+        Only the region covered by the changed obstacles is re-rendered, re-dilated and re-measured.
+        The resulting stacks are identical to those of a map built from scratch.
+
+        :param areas: all areas (unchanged since the map was created)
+        :param obstacles: all obstacles after the change
+        :param changed_obstacles: obstacles which have been added or removed (both versions of modified obstacles)
+        :param deadline: optional deadline after which a ``TimeoutError`` is raised
+        :return: the bounding box (x, y, width, height) of the region where the robot's free space has changed or ``None``
+        """
+        height, width = self.grid.size[:2]
+        points = np.array([self.grid.to_grid(p.x, p.y) for o in changed_obstacles for p in o.outline]).reshape(-1, 2)
+        if len(points) == 0:
+            return None
+        r0 = max(int(np.floor(points[:, 0].min())) - 2, 0)
+        r1 = min(int(np.ceil(points[:, 0].max())) + 3, height)
+        c0 = max(int(np.floor(points[:, 1].min())) - 2, 0)
+        c1 = min(int(np.ceil(points[:, 1].max())) + 3, width)
+        if r0 >= r1 or c0 >= c1:
+            return None
+
+        # NOTE: render with a margin because the binary renderer never fills the last row and column
+        roi = (max(r0 - 2, 0), min(r1 + 2, height), max(c0 - 2, 0), min(c1 + 2, width))
+        map_ = render_world(self.grid, areas, obstacles, roi, deadline)[r0 - roi[0]:r1 - roi[0], c0 - roi[2]:c1 - roi[2]]
+        diff = map_ != self.map[r0:r1, c0:c1]
+        if not diff.any():
+            return None
+        had_obstacles = self.map.any()
+        self.map[r0:r1, c0:c1] = map_
+        rows, cols = np.nonzero(diff)
+        r0, r1, c0, c1 = r0 + rows.min(), r0 + rows.max() + 1, c0 + cols.min(), c0 + cols.max() + 1
+
+        has_obstacles = self.map.any()
+        dirty: list[tuple[int, int, int, int]] = []
+        for layer in range(self.grid.size[2]):
+            _, _, yaw = self.grid.from_3d_grid(0, 0, layer)
+            kernel = self.robot_renderer.render(self.grid.pixel_size, yaw).astype(np.uint8)
+            k = kernel.shape[0] // 2
+            s0, s1, t0, t1 = max(r0 - k, 0), min(r1 + k, height), max(c0 - k, 0), min(c1 + k, width)
+            m0, m1, n0, n1 = max(s0 - k, 0), min(s1 + k, height), max(t0 - k, 0), min(t1 + k, width)
+            dilated = cv2.dilate(self.map[m0:m1, n0:n1].astype(np.uint8), kernel)
+            layer_stack = dilated[s0 - m0:s1 - m0, t0 - n0:t1 - n0].astype(bool)
+            changed = layer_stack != self._stack_layer(layer, s0, s1, t0, t1)
+            if changed.any():
+                self._set_stack_layer(layer, layer_stack, s0, t0)
+                rows, cols = np.nonzero(changed)
+                box = (s0 + rows.min(), s0 + rows.max() + 1, t0 + cols.min(), t0 + cols.max() + 1)
+                if has_obstacles and had_obstacles:
+                    self._update_distances(layer, *box)
+                else:
+                    # NOTE: without any obstacle before or after the change every cell is affected
+                    self._set_dist_layer(layer, _distances(~self._stack_layer(layer), self.grid.pixel_size), 0, 0)
+                    self._max_distances[layer] = self._decode(self.dist_stack[:, :, layer].max())
+                dirty.append(box)
             if deadline and time.time() > deadline:
-                raise TimeoutError('obstacle map creation took too long')
-        return ObstacleMap(grid, binary_renderer.map, robot_renderer, deadline)
+                raise TimeoutError('obstacle map update took too long')
+        self.stack[:, :, -1] = self.stack[:, :, 0]
+        self.dist_stack[:, :, -1] = self.dist_stack[:, :, 0]
+        self._max_distances[-1] = self._max_distances[0]
+        if not dirty:
+            return None
 
-    def test(self, x, y, yaw):
-        row, col, layer = self.grid.to_3d_grid(x, y, yaw)
-        return ndimage.map_coordinates(self.stack, [[row], [col], [layer]], order=0)
+        x0, y0 = self.grid.from_grid(min(b[0] for b in dirty) - 0.5, min(b[2] for b in dirty) - 0.5)
+        x1, y1 = self.grid.from_grid(max(b[1] for b in dirty) - 0.5, max(b[3] for b in dirty) - 0.5)
+        return x0, y0, x1 - x0, y1 - y0
 
-    t_lookup: ClassVar[list[np.ndarray]] = [np.linspace(0, 1, i) for i in range(360)]
+    def _update_distances(self, layer: int, r0: int, r1: int, c0: int, c1: int) -> None:
+        """Update a distance layer after its stack layer has changed within the given region."""
+        pixel_size = self.grid.pixel_size
+        height, width = self.grid.size[:2]
+        tolerance = DISTANCE_RESOLUTION if self.compact else 1e-6
 
-    def _create_poses(self, spline, backward) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
-        @overload
-        def pose(t: float) -> tuple[float, float, float]: ...
+        # NOTE: a cell can only be affected if the changed region is not farther away than its nearest obstacle
+        reach = int(np.ceil(self._max_distances[layer] / pixel_size))
+        b0, b1, d0, d1 = max(r0 - reach, 0), min(r1 + reach, height), max(c0 - reach, 0), min(c1 + reach, width)
+        box_rows, box_cols = np.arange(b0, b1), np.arange(d0, d1)
+        dr = np.maximum(np.maximum(r0 - box_rows, box_rows - (r1 - 1)), 0)
+        dc = np.maximum(np.maximum(c0 - box_cols, box_cols - (c1 - 1)), 0)
+        affected = np.hypot(dr[:, None], dc[None, :]) * pixel_size <= self._dist_layer(layer, b0, b1, d0, d1) + tolerance
+        rows, cols = np.nonzero(affected)
+        a0, a1, e0, e1 = b0 + rows.min(), b0 + rows.max() + 1, d0 + cols.min(), d0 + cols.max() + 1
+        mask = affected[a0 - b0:a1 - b0, e0 - d0:e1 - d0]
+        distances = self._dist_layer(layer, a0, a1, e0, e1)
+        pad = int(np.ceil(distances[mask].max() / pixel_size)) + 1
+        while True:
+            w0, w1, v0, v1 = max(a0 - pad, 0), min(a1 + pad, height), max(e0 - pad, 0), min(e1 + pad, width)
+            if w0 == 0 and w1 == height and v0 == 0 and v1 == width:
+                self._set_dist_layer(layer, _distances(~self._stack_layer(layer), pixel_size), 0, 0)
+                self._max_distances[layer] = self._decode(self.dist_stack[:, :, layer].max())
+                return
+            window = ~self._stack_layer(layer, w0, w1, v0, v1)
+            if not window.all():
+                new = ndimage.distance_transform_edt(window)[a0 - w0:a1 - w0, e0 - v0:e1 - v0] * pixel_size
+                # NOTE: the result is exact where the nearest obstacle inside the window is closer than the window border
+                box_rows, box_cols = np.arange(a0, a1), np.arange(e0, e1)
+                margin_r = np.minimum(np.where(w0 > 0, box_rows - w0 + 1, np.inf),
+                                      np.where(w1 < height, w1 - box_rows, np.inf))
+                margin_c = np.minimum(np.where(v0 > 0, box_cols - v0 + 1, np.inf),
+                                      np.where(v1 < width, v1 - box_cols, np.inf))
+                margin = np.minimum(margin_r[:, None], margin_c[None, :]) * pixel_size
+                if np.all(new[mask] <= margin[mask]):
+                    distances[mask] = new[mask]
+                    self._set_dist_layer(layer, distances, a0, e0)
+                    self._max_distances[layer] = max(self._max_distances[layer], distances[mask].max())
+                    return
+            pad *= 2
 
-        @overload
-        def pose(t: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]: ...
+    def _stack_layer(self, layer: int, r0: int = 0, r1: int | None = None, c0: int = 0, c1: int | None = None) -> np.ndarray:
+        """Get a (copied) window of a stack layer as boolean array."""
+        r1 = self.grid.size[0] if r1 is None else r1
+        c1 = self.grid.size[1] if c1 is None else c1
+        if not self.compact:
+            return self.stack[r0:r1, c0:c1, layer].copy()
+        bits = np.unpackbits(self.stack[r0:r1, c0 // 8:(c1 + 7) // 8, layer], axis=1, bitorder='little')
+        return bits[:, c0 % 8:c0 % 8 + c1 - c0].view(bool)
 
-        def pose(t: float | np.ndarray) -> tuple[float | np.ndarray, float | np.ndarray, float | np.ndarray]:
-            return (
-                spline.x(t),
-                spline.y(t),
-                spline.yaw(t) + [0, np.pi][backward],
-            )
+    def _set_stack_layer(self, layer: int, values: np.ndarray, r0: int, c0: int) -> None:
+        """Overwrite a window of a stack layer with a boolean array."""
+        r1, c1 = r0 + values.shape[0], c0 + values.shape[1]
+        if not self.compact:
+            self.stack[r0:r1, c0:c1, layer] = values
+            return
+        # NOTE: the bytes at the window border also hold bits outside of the window, so we unpack them first
+        b0, b1 = c0 // 8, (c1 + 7) // 8
+        bits = np.unpackbits(self.stack[r0:r1, b0:b1, layer], axis=1, bitorder='little')
+        bits[:, c0 - 8 * b0:c1 - 8 * b0] = values
+        self.stack[r0:r1, b0:b1, layer] = np.packbits(bits, axis=1, bitorder='little')
 
-        row0, col0, layer0 = self.grid.to_3d_grid(*pose(0.0))
-        row1, col1, layer1 = self.grid.to_3d_grid(*pose(1.0))
-        num_rows = int(abs(row1 - row0))
-        num_cols = int(abs(col1 - col0))
-        num_layers = int(abs(layer1 - layer0))
-        n = max(num_rows, num_cols, num_layers)
-        t = ObstacleMap.t_lookup[n] if n < len(ObstacleMap.t_lookup) else np.linspace(0, 1, n)
-        return pose(t)
+    def _dist_layer(self, layer: int, r0: int, r1: int, c0: int, c1: int) -> np.ndarray:
+        """Get a (copied) window of a distance layer in meters."""
+        return self._decode(self.dist_stack[r0:r1, c0:c1, layer])
 
-    def test_spline(self, spline, backward=False) -> bool:
-        return self.test(*self._create_poses(spline, backward)).any()
+    def _set_dist_layer(self, layer: int, values: np.ndarray, r0: int, c0: int) -> None:
+        """Overwrite a window of a distance layer with distances in meters."""
+        window = self.dist_stack[r0:r0 + values.shape[0], c0:c0 + values.shape[1], layer]
+        if self.compact:
+            window[:] = np.minimum(np.rint(values / DISTANCE_RESOLUTION), np.iinfo(np.uint16).max)
+        else:
+            window[:] = values
+
+    def _decode(self, distances):
+        return distances * DISTANCE_RESOLUTION if self.compact else distances.astype(float)
+
+    def occupied(self, row, col, layer) -> np.ndarray:
+        """Look up the stack at grid coordinates (cells outside of the grid are free)."""
+        (r, c, l), valid = nearest_cells((*self.grid.size[:2], self.grid.size[2] + 1), row, col, layer)
+        return valid & self.occupied_cells(r, c, l)
+
+    def distance(self, row, col, layer) -> np.ndarray:
+        """Look up the distances at grid coordinates (zero outside of the grid)."""
+        (r, c, l), valid = nearest_cells((*self.grid.size[:2], self.grid.size[2] + 1), row, col, layer)
+        return np.where(valid, self.distance_cells(r, c, l), 0.0)
+
+    def occupied_layers(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        """Look up all layers of the stack at integer grid cells."""
+        if self.compact:
+            return ((self.stack[rows, cols >> 3, :] >> (cols & 7)[:, None]) & 1).astype(bool)
+        return self.stack[rows, cols, :]
+
+    def map_distance(self, row, col) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Look up the distance to the nearest cell of the binary map and its gradient (x, y) at grid coordinates."""
+        distance, gradient_x, gradient_y = map_distances(self.map, self.grid.pixel_size)
+        (r, c), valid = nearest_cells(self.grid.size[:2], row, col)
+        return (np.where(valid, distance[r, c], 0.0),
+                np.where(valid, gradient_x[r, c], 0.0),
+                np.where(valid, gradient_y[r, c], 0.0))
+
+    def crop(self, row0: int, row1: int, col0: int, col1: int) -> ObstacleMap:
+        """Copy the stacks of the given cells into a new obstacle map (which can not be updated)."""
+        if self.compact:
+            bits = np.unpackbits(self.stack[row0:row1], axis=1, bitorder='little')[:, col0:col1]
+            stack = np.packbits(bits, axis=1, bitorder='little')
+        else:
+            stack = self.stack[row0:row1, col0:col1].copy()
+        return ObstacleMap.from_stacks(self.grid.subgrid(row0, row1, col0, col1),
+                                       stack, self.dist_stack[row0:row1, col0:col1].copy())
+
+    def occupied_cells(self, r: np.ndarray, c: np.ndarray, l: np.ndarray) -> np.ndarray:
+        """Look up the stack at integer cells within the grid."""
+        if self.compact:
+            return ((self.stack[r, c >> 3, l] >> (c & 7)) & 1).astype(bool)
+        return self.stack[r, c, l]
+
+    def distance_cells(self, r: np.ndarray, c: np.ndarray, l: np.ndarray) -> np.ndarray:
+        """Look up the distances at integer cells within the grid."""
+        return self._decode(self.dist_stack[r, c, l])
+
+
+def nearest_cells(shape: tuple[int, ...], *coordinates) -> tuple[tuple[np.ndarray, ...], np.ndarray]:
+    """Compute the nearest cell indices and their validity like ``scipy.ndimage.map_coordinates`` with ``order=0``."""
+    indices = []
+    valid = np.ones(np.shape(coordinates[0]), dtype=bool)
+    for values, n in zip(coordinates, shape, strict=True):
+        coordinate = np.asarray(values, dtype=float)
+        valid &= (coordinate >= 0) & (coordinate <= n - 1)
+        indices.append(np.clip(np.floor(coordinate + 0.5), 0, n - 1).astype(np.intp))
+    return tuple(indices), valid
+
+
+def _distances(free: np.ndarray, pixel_size: float) -> np.ndarray:
+    """Compute the distance of every cell to the nearest occupied cell (infinite if there is none)."""
+    if free.all():
+        return np.full(free.shape, np.inf)
+    return ndimage.distance_transform_edt(free) * pixel_size
+
+
+def map_distances(map_: np.ndarray, pixel_size: float) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Compute the distance to the nearest cell of a binary map and its gradient (x, y) for every cell."""
+    if not map_.any():
+        return np.full(map_.shape, np.inf), np.zeros(map_.shape), np.zeros(map_.shape)
+    distance = _distances(~map_, pixel_size)
+    gradient_y, gradient_x = np.gradient(distance)
+    return distance, gradient_x, gradient_y
+
+
+def render_world(grid: Grid,
+                  areas: list[Area],
+                  obstacles: list[Obstacle],
+                  roi: tuple[int, int, int, int],
+                  deadline: float | None = None) -> np.ndarray:
+    """Render areas and obstacles into a binary map covering the given region of interest (row0, row1, col0, col1)."""
+    r0, r1, c0, c1 = roi
+    has_areas = any(len(a.outline) > 2 for a in areas)
+    binary_renderer = BinaryRenderer((r1 - r0, c1 - c0), fill_value=has_areas)
+    for area in areas:
+        binary_renderer.polygon(_to_pixels(grid, area.outline, r0, c0), False)
+        if deadline and time.time() > deadline:
+            raise TimeoutError('obstacle map creation took too long')
+    for obstacle in obstacles:
+        binary_renderer.polygon(_to_pixels(grid, obstacle.outline, r0, c0))
+        if deadline and time.time() > deadline:
+            raise TimeoutError('obstacle map creation took too long')
+    return binary_renderer.map
 
-    def get_distance(self, x, y, yaw) -> np.ndarray:
-        row, col, layer = self.grid.to_3d_grid(x, y, yaw)
-        return ndimage.map_coordinates(self.dist_stack, [[row], [col], [layer]], order=0)
 
-    def get_minimum_spline_distance(self, spline, backward=False) -> float:
-        return self.get_distance(*self._create_poses(spline, backward)).min()
+def _to_pixels(grid: Grid, outline: list[Point], row0: int, col0: int) -> np.ndarray:
+    return np.array([grid.to_grid(p.x, p.y)[::-1] for p in outline]).reshape(-1, 2) - (col0, row0)
@@ -1,9 +1,15 @@
 import asyncio
 import logging
+import math
 import time
+from collections.abc import Callable
 from copy import copy
 from multiprocessing import Pipe
-from typing import Any
+from multiprocessing.connection import Connection
+from pathlib import Path
+from typing import Any, TypeVar
+
+import numpy as np
 
 from .. import persistence, rosys, run
 from ..driving import PathSegment
@@ -11,15 +17,25 @@ from ..event import Event
 from ..geometry import Point, Pose, Prism, Spline
 from .area import Area
 from .obstacle import Obstacle
+from .obstacle_map import ObstacleMap
 from .planner_process import (
     PlannerCommand,
+    PlannerCostMatrixCommand,
     PlannerGrowMapCommand,
     PlannerObstacleDistanceCommand,
     PlannerProcess,
     PlannerResponse,
     PlannerSearchCommand,
+    PlannerSearchManyCommand,
     PlannerTestCommand,
+    PlannerTestSplinesCommand,
+    PlannerWorldCommand,
 )
+from .shared_obstacle_map import SharedObstacleMap
+
+T = TypeVar('T')
+
+MAP_CACHE_PATH = Path('~/.rosys/path_planner_cache').expanduser()
 
 
 class PathPlanner(persistence.PersistentModule):
@@ -27,16 +43,47 @@ class PathPlanner(persistence.PersistentModule):
 
     If given, the algorithm respects the given robot shape as well as a dictionary of accessible areas and a dictionary of obstacles, both of which a backed up and restored automatically.
     The path planner can search paths, check if a spline interferes with obstacles and get the distance of a pose to any obstacle.
+    Paths to many goals and the cost matrix for ordering them are computed with a single process call and graph search.
+    The number of `processes` determines how many planner processes handle requests concurrently;
+    each request is routed to the process with the fewest pending requests so that quick queries are not blocked by long searches.
+    The number of `workers` determines how many threads each planner process uses to build obstacle maps.
+    Changes of areas and obstacles are sent to the planner processes as versioned diffs; commands only refer to a world version.
+    When modifying areas or obstacles in place, emit `AREAS_CHANGED` or `OBSTACLES_CHANGED` so that the changes are detected.
+    The planner processes publish their obstacle maps in shared memory,
+    so spline tests and obstacle distances are computed locally if the map is up to date.
+    Unless `map_cache` is disabled, obstacle maps and graphs are cached in `~/.rosys` to speed up restarts.
+    With `compact_maps` the obstacle maps are bit-packed and their distances quantized to millimeters,
+    which reduces their memory by a factor of about 4 at the cost of slightly slower map updates.
+    With a `tile_size` (in cells of 10 cm) the obstacle maps are tiled and only cover areas, obstacles and requested points,
+    so that planning on large fields with distant areas scales with the used area instead of the bounding box.
     """
 
-    def __init__(self, robot_shape: Prism) -> None:
+    def __init__(self, robot_shape: Prism, *,
+                 processes: int = 1, workers: int = 1, map_cache: bool = True, compact_maps: bool = False,
+                 tile_size: int | None = None) -> None:
         super().__init__()
 
         self.log = logging.getLogger('rosys.path_planner')
 
-        self.connection, process_connection = Pipe()
-        self.process = PlannerProcess(process_connection, robot_shape.outline)
-        self.responses: dict[str, Any] = {}
+        self.connections: list[Connection] = []
+        self.processes: list[PlannerProcess] = []
+        self.shared_maps: list[SharedObstacleMap] = []
+        cache_path = MAP_CACHE_PATH if map_cache and not rosys.is_test else None
+        for _ in range(processes):
+            connection, process_connection = Pipe()
+            shared_map = SharedObstacleMap()
+            self.connections.append(connection)
+            self.shared_maps.append(shared_map)
+            self.processes.append(PlannerProcess(process_connection, robot_shape.outline,
+                                                 workers=workers, compact=compact_maps, tile_size=tile_size,
+                                                 shared_map=shared_map.name, cache_path=cache_path))
+        self.responses: list[dict[str, asyncio.Future]] = [{} for _ in range(processes)]
+        self.world_version = 0
+        self._synced_areas: dict[str, tuple[Area, tuple]] = {}
+        self._synced_obstacles: dict[str, tuple[Obstacle, tuple]] = {}
+        self._modified_areas: set[str] | None = set()
+        self._modified_obstacles = False
+        self._started = False
 
         self.obstacles: dict[str, Obstacle] = {}
         self.areas: dict[str, Area] = {}
@@ -46,9 +93,11 @@ class PathPlanner(persistence.PersistentModule):
         self.AREAS_CHANGED = Event()
         """the areas have changed (argument: list of areas that have changed, can be None for all areas)"""
 
+        self.OBSTACLES_CHANGED.register(self._handle_obstacles_changed)
+        self.AREAS_CHANGED.register(self._handle_areas_changed)
+
         rosys.on_startup(self.startup)
         rosys.on_shutdown(self.shutdown)
-        rosys.on_repeat(self.step, 0.1)
 
     def backup(self) -> dict:
         finished_areas = {area_id: copy(area).close() for area_id, area in self.areas.items() if len(area.outline) >= 3}
@@ -64,73 +113,233 @@ class PathPlanner(persistence.PersistentModule):
         self.OBSTACLES_CHANGED.emit(self.obstacles)
 
     def startup(self) -> None:
-        self.process.start()
+        for i, (process, connection) in enumerate(zip(self.processes, self.connections, strict=True)):
+            process.start()
+            # NOTE: responses are received as soon as the pipe becomes readable instead of polling it
+            asyncio.get_running_loop().add_reader(connection.fileno(), self._receive, i)
+        self._started = True
+        self._sync_world()
 
     async def shutdown(self) -> None:
-        self.log.info('stopping planner process...')
-        self.connection.close()
-        self.process.connection.close()
-        self.process.join(5)
-        if self.process.is_alive():
-            self.process.terminate()
-        elif self.process.exitcode:
-            self.log.info('bad exitcode for process: %s', self.process.exitcode)
-        self.log.info('teardown of %s completed', self.process)
-
-    async def step(self) -> None:
+        self.log.info('stopping planner processes...')
+        # NOTE: pending calls are finished now because their deadlines might not be reached before the loop stops
+        for responses in self.responses:
+            for future in responses.values():
+                if not future.done():
+                    future.set_exception(ConnectionError('path planner is shutting down'))
+        await asyncio.sleep(0)
+        try:
+            for i, (process, connection) in enumerate(zip(self.processes, self.connections, strict=True)):
+                self._stop_receiving(i)
+                connection.close()
+                process.connection.close()
+            for process in self.processes:
+                process.join(5)
+                if process.is_alive():
+                    process.terminate()
+                elif process.exitcode:
+                    self.log.info('bad exitcode for process: %s', process.exitcode)
+                self.log.info('teardown of %s completed', process)
+        finally:
+            for shared_map in self.shared_maps:
+                shared_map.close()
+
+    def _receive(self, worker: int) -> None:
+        connection = self.connections[worker]
+        responses = self.responses[worker]
         try:
-            if self.connection.poll():
-                response = self.connection.recv()
+            while connection.poll():
+                response = connection.recv()
                 assert isinstance(response, PlannerResponse)
-                if time.time() < response.deadline:
-                    self.responses[response.id] = response.content
-        except OSError as e:
-            if 'handle is closed' in str(e):
-                self.log.info('path planner process connection closed')
-            else:
-                raise
+                future = responses.pop(response.id, None)
+                if future is None or future.done():
+                    continue  # NOTE: the caller has already given up waiting for this response
+                if isinstance(response.content, Exception):
+                    future.set_exception(response.content)
+                else:
+                    future.set_result(response.content)
+        except (EOFError, OSError):
+            self.log.info('path planner process connection closed')
+            self._stop_receiving(worker)
+            for future in responses.values():
+                if not future.done():
+                    future.set_exception(ConnectionError('path planner process connection closed'))
+            responses.clear()
+
+    def _stop_receiving(self, worker: int) -> None:
+        connection = self.connections[worker]
+        if connection.closed:
+            return
+        try:
+            asyncio.get_running_loop().remove_reader(connection.fileno())
+        except RuntimeError:
+            pass  # NOTE: there is no running loop (anymore)
 
     async def grow_map(self, points: list[Point], timeout: float = 3.0) -> None:
-        return await self._call(PlannerGrowMapCommand(
-            points=points,
-            deadline=time.time()+timeout,
+        # NOTE: all processes grow their maps so that they keep working on the same grid
+        deadline = time.time() + timeout
+        await asyncio.gather(*(
+            self._call(PlannerGrowMapCommand(points=points, deadline=deadline), worker)
+            for worker in range(len(self.processes))
         ))
 
-    async def search(self, *, start: Pose, goal: Pose, timeout: float = 3.0) -> list[PathSegment]:
+    async def search(self, *, start: Pose, goal: Pose, timeout: float = 3.0, anytime: bool = False) -> list[PathSegment]:
+        """Search a path from start to goal.
+
+        :param anytime: whether to keep improving the path until shortly before the timeout and return the best one
+        """
         return await self._call(PlannerSearchCommand(
-            areas=list(self.areas.values()),
-            obstacles=list(self.obstacles.values()),
+            version=self._sync_world(),
             start=start,
             goal=goal,
+            anytime=anytime,
+            deadline=time.time()+timeout,
+        ))
+
+    async def search_many(self, *, start: Pose, goals: list[Pose], timeout: float = 3.0) -> list[list[PathSegment] | None]:
+        """Search paths from the start to each of the goals with a single process call and graph search.
+
+        :return: one path per goal (``None`` if the goal cannot be reached)
+        """
+        return await self._call(PlannerSearchManyCommand(
+            version=self._sync_world(),
+            start=start,
+            goals=goals,
+            deadline=time.time()+timeout,
+        ))
+
+    async def cost_matrix(self, poses: list[Pose], timeout: float = 3.0) -> np.ndarray:
+        """Estimate the costs of driving between all pairs of poses, e.g. to order the goals of a tour.
+
+        Entry ``[i, j]`` is the cost from pose ``i`` to pose ``j`` (``inf`` if pose ``j`` cannot be reached).
+        """
+        return await self._call(PlannerCostMatrixCommand(
+            version=self._sync_world(),
+            poses=poses,
             deadline=time.time()+timeout,
         ))
 
     async def test_spline(self, spline: Spline, timeout: float = 3.0) -> bool:
+        version = self._sync_world()
+        result = self._compute_locally(version, [spline.start, spline.end], lambda m: bool(m.test_spline(spline)))
+        if result is not None:
+            return result
         return await self._call(PlannerTestCommand(
-            areas=list(self.areas.values()),
-            obstacles=list(self.obstacles.values()),
+            version=version,
             spline=spline,
             deadline=time.time()+timeout,
         ))
 
+    async def test_splines(self, splines: list[Spline], backward: list[bool] | bool = False,
+                           timeout: float = 3.0) -> list[bool]:
+        """Test which splines collide with an obstacle (with a single lookup or process call for all splines).
+
+        :param backward: whether the robot drives backward along the splines (one flag per spline or for all)
+        """
+        version = self._sync_world()
+        points = [p for spline in splines for p in (spline.start, spline.end)]
+        result = self._compute_locally(version, points, lambda m: m.test_splines(splines, backward).tolist())
+        if result is not None:
+            return result
+        return await self._call(PlannerTestSplinesCommand(
+            version=version,
+            splines=splines,
+            backward=backward,
+            deadline=time.time()+timeout,
+        ))
+
     async def get_obstacle_distance(self, pose: Pose, timeout: float = 3.0) -> float:
+        version = self._sync_world()
+        result = self._compute_locally(version, [pose.point],
+                                       lambda m: float(m.get_distance(pose.x, pose.y, pose.yaw)[0]))
+        if result is not None:
+            return result
         return await self._call(PlannerObstacleDistanceCommand(
-            areas=list(self.areas.values()),
-            obstacles=list(self.obstacles.values()),
+            version=version,
             pose=pose,
             deadline=time.time()+timeout,
         ))
 
-    async def _call(self, command: PlannerCommand, check_interval: float = 0.1) -> Any:
+    def _handle_obstacles_changed(self, _: Any) -> None:
+        self._modified_obstacles = True
+        if self._started:
+            self._sync_world()
+
+    def _handle_areas_changed(self, areas: list[Area] | None) -> None:
+        if areas is None:
+            self._modified_areas = None
+        elif self._modified_areas is not None:
+            self._modified_areas.update(area.id for area in areas)
+        if self._started:
+            self._sync_world()
+
+    def _sync_world(self) -> int:
+        """Send all changes of areas and obstacles to the planner processes and return the current world version.
+
+        Replaced, added and removed items are detected by identity;
+        items modified in place are only compared if a corresponding change event has been emitted.
+        """
+        changed_areas, removed_areas = _diff(self.areas, self._synced_areas, self._modified_areas)
+        changed_obstacles, removed_obstacles = \
+            _diff(self.obstacles, self._synced_obstacles, None if self._modified_obstacles else set())
+        self._modified_areas = set()
+        self._modified_obstacles = False
+        if changed_areas or removed_areas or changed_obstacles or removed_obstacles:
+            self.world_version += 1
+            for connection in self.connections:
+                connection.send(PlannerWorldCommand(
+                    version=self.world_version,
+                    areas=changed_areas,
+                    obstacles=changed_obstacles,
+                    removed_areas=removed_areas,
+                    removed_obstacles=removed_obstacles,
+                    deadline=math.inf,
+                ))
+        return self.world_version
+
+    def _compute_locally(self, version: int, points: list[Point], callback: Callable[[ObstacleMap], T]) -> T | None:
+        """Evaluate the callback on a shared obstacle map if it has been computed for the given world version."""
+        for shared_map in self.shared_maps:
+            result = shared_map.read(
+                lambda m: callback(m) if all(m.grid.contains(point, padding=1.0) for point in points) else None)
+            if result is not None and result[0] == str(version):
+                return result[1]
+        return None
+
+    async def _call(self, command: PlannerCommand, worker: int | None = None) -> Any:
+        if worker is None:
+            worker = min(range(len(self.processes)), key=lambda i: len(self.responses[i]))
         with run.cpu():
-            self.connection.send(command)
-            while command.id not in self.responses:
-                if time.time() > command.deadline:
-                    raise TimeoutError(f'process call {command.id} did not respond in time')
-                if rosys.is_test:
-                    await self.step()  # NOTE: otherwise step() is not called while awaiting response
-                await asyncio.sleep(check_interval)
-            result = self.responses.pop(command.id)
-            if isinstance(result, Exception):
-                raise result
-            return result
+            future = asyncio.get_running_loop().create_future()
+            self.responses[worker][command.id] = future
+            self.connections[worker].send(command)
+            try:
+                return await asyncio.wait_for(future, timeout=max(command.deadline - time.time(), 0))
+            except asyncio.TimeoutError:
+                raise TimeoutError(f'process call {command.id} did not respond in time') from None
+            finally:
+                self.responses[worker].pop(command.id, None)
+
+
+def _diff(items: dict[str, Any], synced: dict[str, tuple[Any, tuple]], modified: set[str] | None) \
+        -> tuple[list[Any], list[str]]:
+    """Determine changed and removed items and update the synced snapshots (geometry) accordingly.
+
+    :param modified: ids of items which might have been modified in place (``None`` for all)
+    """
+    changed = []
+    for id_, item in items.items():
+        entry = synced.get(id_)
+        if entry is not None and entry[0] is item and \
+                ((modified is not None and id_ not in modified) or entry[1] == _geometry(item)):
+            continue
+        changed.append(item)
+        synced[id_] = (item, _geometry(item))
+    removed = [id_ for id_ in synced if id_ not in items]
+    for id_ in removed:
+        del synced[id_]
+    return changed, removed
+
+
+def _geometry(item: Area | Obstacle) -> tuple:
+    return tuple((p.x, p.y) for p in item.outline)
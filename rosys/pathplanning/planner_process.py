@@ -1,15 +1,24 @@
 import abc
 import logging
+import time
 import uuid
+from collections.abc import Generator
+from contextlib import contextmanager, nullcontext
 from dataclasses import dataclass, field
 from multiprocessing import Process
 from multiprocessing.connection import Connection
+from pathlib import Path
 from typing import Any
 
 from ..geometry import Point, Pose, Spline
 from .area import Area
 from .delaunay_planner import DelaunayPlanner
+from .map_cache import MapCache
 from .obstacle_map import Obstacle
+from .shared_obstacle_map import SharedObstacleMap
+
+ANYTIME_RESPONSE_TIME = 0.1
+"""Time (seconds) reserved for sending the result of an anytime search before the command's deadline."""
 
 
 @dataclass
@@ -21,12 +30,37 @@ class PlannerCommand(abc.ABC):
         self.id = str(uuid.uuid4())
 
 
-@dataclass
-class PlannerSearchCommand(PlannerCommand):
-    areas: list[Area]
-    obstacles: list[Obstacle]
+@dataclass(kw_only=True)
+class PlannerMapCommand(PlannerCommand):
+    """Command which needs the obstacle map for the given areas and obstacles.
+
+    If a world ``version`` is given, areas and obstacles are omitted
+    and the planner process uses the world state it has received with ``PlannerWorldCommand`` instead.
+    """
+    areas: list[Area] = field(default_factory=list)
+    obstacles: list[Obstacle] = field(default_factory=list)
+    version: int | None = None
+
+
+@dataclass(kw_only=True)
+class PlannerSearchCommand(PlannerMapCommand):
+    """Search a path; anytime searches return the best path found shortly before the deadline."""
     start: Pose
     goal: Pose
+    anytime: bool = False
+
+
+@dataclass(kw_only=True)
+class PlannerSearchManyCommand(PlannerMapCommand):
+    """Search paths from the start to each of the goals (``None`` for unreachable goals)."""
+    start: Pose
+    goals: list[Pose]
+
+
+@dataclass(kw_only=True)
+class PlannerCostMatrixCommand(PlannerMapCommand):
+    """Estimate the costs of driving between all pairs of poses (see ``DelaunayPlanner.cost_matrix``)."""
+    poses: list[Pose]
 
 
 @dataclass
@@ -34,22 +68,34 @@ class PlannerGrowMapCommand(PlannerCommand):
     points: list[Point]
 
 
-@dataclass
-class PlannerTestCommand(PlannerCommand):
-    areas: list[Area]
-    obstacles: list[Obstacle]
+@dataclass(kw_only=True)
+class PlannerTestCommand(PlannerMapCommand):
     spline: Spline
     backward: bool = False
 
 
-@dataclass
-class PlannerObstacleDistanceCommand(PlannerCommand):
-    areas: list[Area]
-    obstacles: list[Obstacle]
+@dataclass(kw_only=True)
+class PlannerTestSplinesCommand(PlannerMapCommand):
+    splines: list[Spline]
+    backward: list[bool] | bool = False
+
+
+@dataclass(kw_only=True)
+class PlannerObstacleDistanceCommand(PlannerMapCommand):
     pose: Pose
     backward: bool = False
 
 
+@dataclass(kw_only=True)
+class PlannerWorldCommand(PlannerCommand):
+    """Areas and obstacles which have been added, changed or removed since the previous world version."""
+    version: int
+    areas: list[Area] = field(default_factory=list)
+    obstacles: list[Obstacle] = field(default_factory=list)
+    removed_areas: list[str] = field(default_factory=list)
+    removed_obstacles: list[str] = field(default_factory=list)
+
+
 @dataclass
 class PlannerResponse:
     id: str
@@ -59,39 +105,136 @@ class PlannerResponse:
 
 class PlannerProcess(Process):
 
-    def __init__(self, connection: Connection, robot_outline: list[tuple[float, float]]) -> None:
+    def __init__(self, connection: Connection, robot_outline: list[tuple[float, float]], *,
+                 workers: int = 1, compact: bool = False, tile_size: int | None = None,
+                 shared_map: str | None = None, cache_path: Path | None = None) -> None:
+        """Process computing planner commands received via the given connection.
+
+        :param compact: whether to use compact obstacle maps (see ``ObstacleMap``)
+        :param tile_size: tile size (cells) for tiled obstacle maps (see ``TiledObstacleMap``)
+        :param shared_map: name of a ``SharedObstacleMap`` header to publish the current obstacle map to
+        :param cache_path: directory for caching obstacle maps and graphs on disk
+        """
         super().__init__()
         self.log = logging.getLogger('rosys.pathplanning.PlannerProcess')
         self.connection = connection
-        self.planner = DelaunayPlanner(robot_outline)
+        self.planner = DelaunayPlanner(robot_outline, workers=workers, compact=compact, tile_size=tile_size,
+                                       cache=MapCache(cache_path) if cache_path is not None else None)
+        self.shared_map_name = shared_map
+        self.shared_map: SharedObstacleMap | None = None
+        self.map_state = ''
+        self.world_version = 0
+        self.areas: dict[str, Area] = {}
+        self.obstacles: dict[str, Obstacle] = {}
+        self.areas_changed: bool | None = False
+        self.changed_obstacles: list[Obstacle] | None = []
 
     def run(self) -> None:
+        if self.shared_map_name is not None:
+            self.shared_map = SharedObstacleMap(self.shared_map_name)
+        try:
+            self._run()
+        finally:
+            if self.shared_map is not None:
+                self.shared_map.close()
+
+    def _run(self) -> None:
         while True:
             try:
                 cmd = self.connection.recv()
             except (EOFError, KeyboardInterrupt):
                 self.log.info('PlannerProcess stopped')
                 return
+            if time.time() > cmd.deadline:
+                self.log.info('skipping expired command "%s"', cmd)
+                continue  # NOTE: nobody is waiting for the result anymore
             try:
+                if isinstance(cmd, PlannerWorldCommand):
+                    self.update_world(cmd)
                 if isinstance(cmd, PlannerSearchCommand):
                     self.log.info(cmd)
-                    additional_points = [cmd.start.point, cmd.goal.point]
-                    self.planner.update_map(cmd.areas, cmd.obstacles, additional_points, cmd.deadline)
-                    self.respond(cmd, self.planner.search(cmd.start, cmd.goal))
+                    self.update_map(cmd, [cmd.start.point, cmd.goal.point])
+                    deadline = cmd.deadline - ANYTIME_RESPONSE_TIME if cmd.anytime else None
+                    self.respond(cmd, self.planner.search(cmd.start, cmd.goal, deadline))
+                if isinstance(cmd, PlannerSearchManyCommand):
+                    self.log.info(cmd)
+                    self.update_map(cmd, [cmd.start.point] + [goal.point for goal in cmd.goals])
+                    self.respond(cmd, self.planner.search_many(cmd.start, cmd.goals))
+                if isinstance(cmd, PlannerCostMatrixCommand):
+                    self.update_map(cmd, [pose.point for pose in cmd.poses])
+                    self.respond(cmd, self.planner.cost_matrix(cmd.poses))
                 if isinstance(cmd, PlannerGrowMapCommand):
-                    self.planner.grow_map(cmd.points, cmd.deadline)
+                    with self._modifying_map():
+                        self.planner.grow_map(cmd.points, cmd.deadline)
                     self.respond(cmd, None)
                 if isinstance(cmd, PlannerTestCommand):
-                    self.planner.update_map(cmd.areas, cmd.obstacles, [cmd.spline.start, cmd.spline.end], cmd.deadline)
+                    self.update_map(cmd, [cmd.spline.start, cmd.spline.end])
                     assert self.planner.obstacle_map is not None
                     self.respond(cmd, bool(self.planner.obstacle_map.test_spline(cmd.spline, cmd.backward)))
+                if isinstance(cmd, PlannerTestSplinesCommand):
+                    self.update_map(cmd, [p for spline in cmd.splines for p in (spline.start, spline.end)])
+                    assert self.planner.obstacle_map is not None
+                    self.respond(cmd, self.planner.obstacle_map.test_splines(cmd.splines, cmd.backward).tolist())
                 if isinstance(cmd, PlannerObstacleDistanceCommand):
-                    self.planner.update_map(cmd.areas, cmd.obstacles, [cmd.pose.point], cmd.deadline)
+                    self.update_map(cmd, [cmd.pose.point])
                     assert self.planner.obstacle_map is not None
-                    self.respond(cmd, self.planner.obstacle_map.get_distance(cmd.pose.x, cmd.pose.y, cmd.pose.yaw))
+                    self.respond(cmd, float(self.planner.obstacle_map.get_distance(cmd.pose.x, cmd.pose.y, cmd.pose.yaw)[0]))
             except Exception as e:
                 self.log.exception('failed to compute cmd "%s"', cmd)
                 self.respond(cmd, e)
+            # NOTE: new maps are stored after responding so that writing to disk does not delay the response
+            self.planner.store_cache()
+
+    def update_world(self, cmd: PlannerWorldCommand) -> None:
+        """Apply the changes of a new world version without touching the map."""
+        for area in cmd.areas:
+            self.areas[area.id] = area
+        for area_id in cmd.removed_areas:
+            self.areas.pop(area_id, None)
+        if cmd.areas or cmd.removed_areas:
+            self.areas_changed = True
+        for obstacle in cmd.obstacles:
+            self._change_obstacle(self.obstacles.get(obstacle.id), obstacle)
+            self.obstacles[obstacle.id] = obstacle
+        for obstacle_id in cmd.removed_obstacles:
+            self._change_obstacle(self.obstacles.pop(obstacle_id, None), None)
+        self.world_version = cmd.version
+
+    def _change_obstacle(self, old: Obstacle | None, new: Obstacle | None) -> None:
+        if self.changed_obstacles is not None:
+            self.changed_obstacles.extend(o for o in (old, new) if o is not None)
+
+    def update_map(self, cmd: PlannerMapCommand, points: list[Point]) -> None:
+        """Update the planner's map for the areas and obstacles of the command or its world version."""
+        if cmd.version is not None and cmd.version != self.world_version:
+            raise RuntimeError(f'world version {cmd.version} is unknown (current version: {self.world_version})')
+        with self._modifying_map():
+            if cmd.version is None:
+                self.planner.update_map(cmd.areas, cmd.obstacles, points, cmd.deadline)
+                # NOTE: the planner's map does not correspond to the world state anymore; it needs to be compared again
+                self.areas_changed = None
+                self.changed_obstacles = None
+                self.map_state = ''
+                return
+            self.planner.update_map(list(self.areas.values()), list(self.obstacles.values()), points, cmd.deadline,
+                                    areas_changed=self.areas_changed, changed_obstacles=self.changed_obstacles)
+            self.areas_changed = False
+            self.changed_obstacles = []
+            self.map_state = str(cmd.version)
+
+    @contextmanager
+    def _modifying_map(self) -> Generator[None, None, None]:
+        with self.shared_map.modifying() if self.shared_map is not None else nullcontext():
+            try:
+                yield
+            except BaseException:
+                # NOTE: the map might be partially updated, so it is rebuilt with the next command
+                self.map_state = ''
+                self.planner.obstacle_map = None
+                raise
+            finally:
+                if self.shared_map is not None:
+                    self.shared_map.publish(self.planner.obstacle_map if self.map_state else None, self.map_state)
 
     def respond(self, cmd: PlannerCommand, content: Any) -> None:
         self.connection.send(PlannerResponse(cmd.id, cmd.deadline, content))
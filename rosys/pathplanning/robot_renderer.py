@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import functools
+
 import numpy as np
 
 from .binary_renderer import BinaryRenderer
@@ -9,7 +11,6 @@ class RobotRenderer:
 
     def __init__(self, outline) -> None:
         self.outline = outline
-        self.rendered_outline: np.ndarray = np.zeros((0, 2))
 
     @staticmethod
     def from_size(width, length, x_shift=0) -> RobotRenderer:
@@ -21,13 +22,32 @@ class RobotRenderer:
         ])
 
     def render(self, pixel_size, yaw=0) -> np.ndarray:
-        radius = np.linalg.norm(self.outline, axis=1).max()
-        width = 2 * int(np.ceil(radius / pixel_size)) + 1
+        """Render the robot footprint into a square kernel centered at the robot origin.
+
+        Kernels are cached per outline, pixel size and yaw and shared by all robot renderers of the process,
+        so they are read-only.
+        """
+        return _render(*self._key(pixel_size, yaw))
+
+    def render_outline(self, pixel_size, yaw=0) -> np.ndarray:
+        """Get the robot outline in the pixel coordinates of the kernel rendered by ``render`` (e.g. for plotting)."""
+        return _transform(*self._key(pixel_size, yaw))[0]
+
+    def _key(self, pixel_size, yaw) -> tuple[tuple[tuple[float, float], ...], float, float]:
+        return tuple((float(x), float(y)) for x, y in self.outline), float(pixel_size), float(yaw)
+
+
+def _transform(outline: tuple[tuple[float, float], ...], pixel_size: float, yaw: float) -> tuple[np.ndarray, int]:
+    radius = np.linalg.norm(outline, axis=1).max()
+    width = 2 * int(np.ceil(radius / pixel_size)) + 1
+    R = np.array([[np.cos(yaw), -np.sin(yaw)], [np.sin(yaw), np.cos(yaw)]])
+    return np.array(outline).dot(R.T) / pixel_size + width // 2, width
 
-        R = np.array([[np.cos(yaw), -np.sin(yaw)], [np.sin(yaw), np.cos(yaw)]])
-        self.rendered_outline = np.array(self.outline).dot(R.T) / pixel_size + width // 2
 
-        renderer = BinaryRenderer((width, width))
-        renderer.map.fill(False)
-        renderer.polygon(self.rendered_outline)
-        return renderer.map
+@functools.lru_cache(maxsize=1000)
+def _render(outline: tuple[tuple[float, float], ...], pixel_size: float, yaw: float) -> np.ndarray:
+    rendered_outline, width = _transform(outline, pixel_size, yaw)
+    renderer = BinaryRenderer((width, width))
+    renderer.polygon(rendered_outline)
+    renderer.map.setflags(write=False)
+    return renderer.map
@@ -15,7 +15,7 @@ with ui.pyplot():
     pl.imshow(robot_renderer.render(0.1, pose[2]), cmap=pl.cm.gray,  # pylint: disable=no-member
               interpolation='nearest')
     pl.gca().invert_yaxis()
-    pl.fill(robot_renderer.rendered_outline[:, 0],
-            robot_renderer.rendered_outline[:, 1], color='none', ec='C0')
+    rendered_outline = robot_renderer.render_outline(0.1, pose[2])
+    pl.fill(rendered_outline[:, 0], rendered_outline[:, 1], color='none', ec='C0')
 
 ui.run()
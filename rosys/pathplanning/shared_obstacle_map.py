@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+from collections.abc import Callable, Generator
+from contextlib import contextmanager
+from multiprocessing.shared_memory import SharedMemory
+from typing import TypeVar
+
+import numpy as np
+
+from .grid import Grid
+from .obstacle_map import BaseObstacleMap, ObstacleMap
+
+T = TypeVar('T')
+
+HEADER = np.dtype([
+    ('sequence', np.int64),
+    ('version', np.int64),
+    ('size', np.int64, 3),
+    ('bbox', np.float64, 4),
+    ('compact', np.bool_),
+    ('segment', 'S32'),
+    ('state', 'S36'),
+])
+
+
+class SharedObstacleMap:
+    """Obstacle map of a planner process published in shared memory.
+
+    A small header segment describes the current map: its grid, the name of the data segment holding
+    ``dist_stack`` and ``stack`` and the id of the map state (areas and obstacles) it was computed for.
+    The planner process writes the header and the data segment; other processes read them without any IPC.
+    The header's sequence number is odd while the map is being modified, so readers can detect and discard torn reads.
+    """
+
+    def __init__(self, name: str | None = None) -> None:
+        """Create a new header segment or attach to an existing one.
+
+        :param name: name of an existing header segment or ``None`` to create a new one
+        """
+        self.header_memory = SharedMemory(name=name, create=name is None, size=HEADER.itemsize)
+        self.header: np.ndarray = np.ndarray((), dtype=HEADER, buffer=self.header_memory.buf)
+        if name is None:
+            self.header[()] = np.zeros((), dtype=HEADER)
+        self._owns_header = name is None
+        self._publishing = False
+        self._segment: SharedMemory | None = None
+        self._retired_segments: list[SharedMemory] = []
+        self._obstacle_map: ObstacleMap | None = None
+        self._version = -1
+
+    @property
+    def name(self) -> str:
+        return self.header_memory.name
+
+    @contextmanager
+    def modifying(self) -> Generator[None, None, None]:
+        """Mark the map as inconsistent while the published obstacle map is modified in place."""
+        self.header['sequence'] += 1
+        try:
+            yield
+        finally:
+            self.header['sequence'] += 1
+
+    def publish(self, obstacle_map: BaseObstacleMap | None, state: str) -> None:
+        """Publish an obstacle map computed for the given map state (must be called within ``modifying()``).
+
+        New obstacle maps are copied into shared memory once and their stacks are replaced by views into it,
+        so that subsequent in-place updates of the obstacle map are visible to readers without copying.
+        Tiled obstacle maps are not published.
+        """
+        assert self.header['sequence'] % 2 == 1, 'publish() must be called within modifying()'
+        self._publishing = True
+        if not isinstance(obstacle_map, ObstacleMap):
+            self.header['state'] = b''
+            return
+        if obstacle_map is not self._obstacle_map:
+            shape = obstacle_map.dist_stack.shape
+            compact = obstacle_map.compact
+            if self._segment is None or self._obstacle_map is None or \
+                    self._obstacle_map.dist_stack.shape != shape or self._obstacle_map.compact != compact:
+                self._release_segment(unlink=True)
+                self._segment = SharedMemory(create=True, size=obstacle_map.dist_stack.nbytes + obstacle_map.stack.nbytes)
+            dist_stack, stack = _views(self._segment, shape, compact)
+            dist_stack[:] = obstacle_map.dist_stack
+            stack[:] = obstacle_map.stack
+            obstacle_map.dist_stack = dist_stack
+            obstacle_map.stack = stack
+            self._obstacle_map = obstacle_map
+            self.header['size'] = shape[0], shape[1], shape[2] - 1
+            self.header['bbox'] = obstacle_map.grid.bbox
+            self.header['compact'] = compact
+            self.header['segment'] = self._segment.name.encode()
+        self.header['state'] = state.encode()
+        self.header['version'] += 1
+
+    def read(self, callback: Callable[[ObstacleMap], T]) -> tuple[str, T] | None:
+        """Evaluate the callback on the published obstacle map.
+
+        :return: the map state and the result of the callback or ``None`` if no consistent map is available
+        """
+        for _ in range(3):
+            sequence = int(self.header['sequence'])
+            if sequence % 2 == 1:
+                return None
+            state = self.header['state'].item().decode()
+            if not state:
+                return None
+            version = int(self.header['version'])
+            try:
+                if version != self._version:
+                    self._attach(self.header['segment'].item().decode(),
+                                 tuple(int(s) for s in self.header['size']),
+                                 tuple(float(b) for b in self.header['bbox']),
+                                 bool(self.header['compact']))
+                    self._version = version
+                assert self._obstacle_map is not None
+                result = callback(self._obstacle_map)
+            except (FileNotFoundError, TypeError, ValueError, IndexError):
+                result = None  # NOTE: the map has been replaced while reading; the sequence check below fails
+            if int(self.header['sequence']) == sequence:
+                return (state, result) if result is not None else None
+        return None
+
+    def close(self) -> None:
+        """Close all segments and remove the ones created by this instance."""
+        self._release_segment(unlink=self._publishing)
+        segment = self.header['segment'].item().decode()
+        del self.header
+        self.header_memory.close()
+        if self._owns_header:
+            self.header_memory.unlink()
+            # NOTE: the publishing process might have been terminated before it could clean up
+            if segment:
+                try:
+                    leftover = SharedMemory(name=segment)
+                except FileNotFoundError:
+                    return
+                leftover.close()
+                leftover.unlink()
+
+    def _attach(self, segment: str, size: tuple[int, ...], bbox: tuple[float, ...], compact: bool) -> None:
+        if self._segment is None or self._segment.name != segment:
+            self._release_segment(unlink=False)
+            self._segment = SharedMemory(name=segment)
+        dist_stack, stack = _views(self._segment, (size[0], size[1], size[2] + 1), compact)
+        self._obstacle_map = ObstacleMap.from_stacks(Grid(size, bbox), stack, dist_stack)
+
+    def _release_segment(self, *, unlink: bool) -> None:
+        self._obstacle_map = None
+        if self._segment is not None:
+            if unlink:
+                self._segment.unlink()
+            self._retired_segments.append(self._segment)
+            self._segment = None
+        for segment in self._retired_segments[:]:
+            try:
+                segment.close()
+            except BufferError:
+                continue  # NOTE: some arrays still use this segment; try again later
+            self._retired_segments.remove(segment)
+
+
+def _views(segment: SharedMemory, shape: tuple[int, ...], compact: bool) -> tuple[np.ndarray, np.ndarray]:
+    dist_stack: np.ndarray = np.ndarray(shape, dtype=np.uint16 if compact else np.float64, buffer=segment.buf)
+    stack_shape = (shape[0], (shape[1] + 7) // 8, shape[2]) if compact else shape
+    stack: np.ndarray = np.ndarray(stack_shape, dtype=np.uint8 if compact else bool,
+                                   buffer=segment.buf, offset=dist_stack.nbytes)
+    return dist_stack, stack
@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+from collections.abc import Callable
+
+import numpy as np
+
+from .area import Area
+from .grid import Grid, TiledGrid
+from .obstacle import Obstacle
+from .obstacle_map import BaseObstacleMap, ObstacleMap, map_distances, nearest_cells, render_world
+from .robot_renderer import RobotRenderer
+
+DISTANCE_MARGIN = 3.0
+"""Obstacle distances of tiled obstacle maps are exact up to this distance (meters); larger distances are clipped."""
+
+
+class TiledObstacleMap(BaseObstacleMap):
+    """Obstacle map on a tiled grid consisting of one dense obstacle map per tile in use.
+
+    Each tile map is computed with a halo of the robot radius and ``DISTANCE_MARGIN`` around its tile,
+    and rendered in the pixel frame of the whole grid,
+    so collision tests are exact and distances are exact up to ``DISTANCE_MARGIN``.
+    Only the tiles themselves are kept, so the memory scales with the number of tiles.
+    Lookups are dispatched to the tile maps; cells of unused tiles are treated like cells outside of all areas.
+    """
+    grid: TiledGrid
+
+    def __init__(self,
+                 robot_outline: list[tuple[float, float]],
+                 areas: list[Area],
+                 obstacles: list[Obstacle],
+                 grid: TiledGrid,
+                 deadline: float | None = None, *,
+                 workers: int = 1,
+                 compact: bool = False) -> None:
+        """Create tile maps for the tiles of the grid and all tiles covered by areas or close to obstacles."""
+        self.robot_outline = robot_outline
+        self.areas = areas
+        self.obstacles = obstacles
+        self.workers = workers
+        self.compact = compact
+        self.fill = any(len(area.outline) > 2 for area in areas)
+        pixel_size = grid.pixel_size
+        radius = RobotRenderer(robot_outline).render(pixel_size).shape[0] // 2
+        self.halo = radius + int(np.ceil(DISTANCE_MARGIN / pixel_size)) + 1
+        self.grid = grid.with_polygons([area.outline for area in areas]) \
+            .with_polygons([obstacle.outline for obstacle in obstacles], padding=self.halo * pixel_size)
+        self.tiles = {tile: self._create_tile(tile, deadline) for tile in sorted(self.grid.tiles)}
+
+    @staticmethod
+    def from_world(robot_outline: list[tuple[float, float]],
+                   areas: list[Area],
+                   obstacles: list[Obstacle],
+                   grid: Grid,
+                   deadline: float | None = None, *,
+                   workers: int = 1,
+                   compact: bool = False) -> TiledObstacleMap:
+        assert isinstance(grid, TiledGrid)
+        return TiledObstacleMap(robot_outline, areas, obstacles, grid, deadline, workers=workers, compact=compact)
+
+    def covers(self, obstacles: list[Obstacle]) -> bool:
+        return self._tiles_close_to(obstacles) <= self.grid.tiles
+
+    def update(self,
+               areas: list[Area],
+               obstacles: list[Obstacle],
+               changed_obstacles: list[Obstacle],
+               deadline: float | None = None) -> tuple[float, float, float, float] | None:
+        """Recompute all tile maps close to the changed obstacles (see ``ObstacleMap.update``).
+
+        The changed obstacles must be covered by the tiles in use (see ``covers``).
+        """
+        self.obstacles = obstacles
+        regions = []
+        for tile in sorted(self._tiles_close_to(changed_obstacles) & self.grid.tiles):
+            tile_map = self._create_tile(tile, deadline)
+            old_stack, new_stack = self.tiles[tile].stack, tile_map.stack
+            self.tiles[tile] = tile_map
+            changed = np.any(old_stack != new_stack, axis=2)
+            if not changed.any():
+                continue
+            rows, cols = np.nonzero(changed)
+            col_scale = 8 if self.compact else 1
+            row0, _, col0, _ = self.grid.tile_bounds(tile)
+            x0, y0 = self.grid.from_grid(row0 + rows.min() - 0.5, col0 + cols.min() * col_scale - 0.5)
+            x1, y1 = self.grid.from_grid(row0 + rows.max() + 0.5, col0 + (cols.max() + 1) * col_scale - 0.5)
+            regions.append((x0, y0, x1, y1))
+        if not regions:
+            return None
+        x0, y0 = min(r[0] for r in regions), min(r[1] for r in regions)
+        x1, y1 = max(r[2] for r in regions), max(r[3] for r in regions)
+        return x0, y0, x1 - x0, y1 - y0
+
+    def occupied(self, row, col, layer) -> np.ndarray:
+        (r, c, l), valid = nearest_cells((*self.grid.size[:2], self.grid.size[2] + 1), row, col, layer)
+        result = self._dispatch(r, c, lambda tile_map, rr, cc, selection: tile_map.occupied_cells(rr, cc, l[selection]),
+                                self.fill)
+        return valid & result
+
+    def distance(self, row, col, layer) -> np.ndarray:
+        (r, c, l), valid = nearest_cells((*self.grid.size[:2], self.grid.size[2] + 1), row, col, layer)
+        result = self._dispatch(r, c, lambda tile_map, rr, cc, selection: tile_map.distance_cells(rr, cc, l[selection]),
+                                0.0 if self.fill else DISTANCE_MARGIN)
+        return np.where(valid, np.minimum(result, DISTANCE_MARGIN), 0.0)
+
+    def occupied_layers(self, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+        result = np.full((len(rows), self.grid.size[2] + 1), self.fill)
+        for tile, selection in self._tiles_of(rows, cols):
+            row0, _, col0, _ = self.grid.tile_bounds(tile)
+            result[selection] = self.tiles[tile].occupied_layers(rows[selection] - row0, cols[selection] - col0)
+        return result
+
+    def map_distance(self, row, col) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        (r, c), valid = nearest_cells(self.grid.size[:2], row, col)
+        results = np.zeros((3, *r.shape))
+        for tile, in_tile in self._tiles_of(r, c):
+            selection = in_tile & valid
+            halo_row0, halo_row1, halo_col0, halo_col1 = self._halo_bounds(tile)
+            halo_grid = self.grid.subgrid(halo_row0, halo_row1, halo_col0, halo_col1)
+            map_ = render_world(self.grid, self.areas, _nearby(self.obstacles, halo_grid.bbox),
+                                (halo_row0, halo_row1, halo_col0, halo_col1))
+            for result, values in zip(results, map_distances(map_, halo_grid.pixel_size), strict=True):
+                result[selection] = values[r[selection] - halo_row0, c[selection] - halo_col0]
+        return results[0], results[1], results[2]
+
+    def _create_tile(self, tile: tuple[int, int], deadline: float | None) -> ObstacleMap:
+        row0, row1, col0, col1 = self.grid.tile_bounds(tile)
+        halo_row0, halo_row1, halo_col0, halo_col1 = self._halo_bounds(tile)
+        halo_grid = self.grid.subgrid(halo_row0, halo_row1, halo_col0, halo_col1)
+        # NOTE: render in the pixel frame of the whole grid so that the pixels match those of a dense map exactly;
+        # all areas are needed to decide whether the space outside of them is occupied
+        map_ = render_world(self.grid, self.areas, _nearby(self.obstacles, halo_grid.bbox),
+                            (halo_row0, halo_row1, halo_col0, halo_col1), deadline)
+        tile_map = ObstacleMap(halo_grid, map_, RobotRenderer(self.robot_outline), deadline,
+                               workers=self.workers, compact=self.compact)
+        return tile_map.crop(row0 - halo_row0, row1 - halo_row0, col0 - halo_col0, col1 - halo_col0)
+
+    def _halo_bounds(self, tile: tuple[int, int]) -> tuple[int, int, int, int]:
+        row0, row1, col0, col1 = self.grid.tile_bounds(tile)
+        return (max(row0 - self.halo, 0), min(row1 + self.halo, self.grid.size[0]),
+                max(col0 - self.halo, 0), min(col1 + self.halo, self.grid.size[1]))
+
+    def _tiles_close_to(self, obstacles: list[Obstacle]) -> frozenset[tuple[int, int]]:
+        grid = TiledGrid(self.grid.size, self.grid.bbox, self.grid.tile_size)
+        return grid.with_polygons([obstacle.outline for obstacle in obstacles], padding=self.halo * grid.pixel_size).tiles
+
+    def _dispatch(self, r: np.ndarray, c: np.ndarray,
+                  lookup: Callable[[ObstacleMap, np.ndarray, np.ndarray, np.ndarray], np.ndarray],
+                  default: bool | float) -> np.ndarray:
+        """Evaluate a lookup for integer cells on the tile maps (with cells in tile map coordinates)."""
+        result = np.full(r.shape, default)
+        for tile, selection in self._tiles_of(r, c):
+            row0, _, col0, _ = self.grid.tile_bounds(tile)
+            result[selection] = lookup(self.tiles[tile], r[selection] - row0, c[selection] - col0, selection)
+        return result
+
+    def _tiles_of(self, r: np.ndarray, c: np.ndarray) -> list[tuple[tuple[int, int], np.ndarray]]:
+        """Group integer cells by the tiles in use they belong to."""
+        tile_size = self.grid.tile_size
+        num_cols = self.grid.tile_shape[1]
+        keys = (r // tile_size) * num_cols + c // tile_size
+        groups = []
+        for key in np.unique(keys):
+            tile = divmod(int(key), num_cols)
+            if tile in self.tiles:
+                groups.append((tile, keys == key))
+        return groups
+
+
+def _nearby(obstacles: list[Obstacle], bbox: tuple[float, float, float, float]) -> list[Obstacle]:
+    return [
+        obstacle for obstacle in obstacles
+        if min(p.x for p in obstacle.outline) <= bbox[0] + bbox[2] and max(p.x for p in obstacle.outline) >= bbox[0] and
+        min(p.y for p in obstacle.outline) <= bbox[1] + bbox[3] and max(p.y for p in obstacle.outline) >= bbox[1]
+    ]
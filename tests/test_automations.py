@@ -32,6 +32,17 @@ async def test_driving_a_spline(driver: Driver, automator: Automator, robot: Rob
     assert_pose(dx, 1, deg=0, deg_tolerance=5)
 
 
+async def test_control_interval(driver: Driver, automator: Automator, robot: Robot):
+    driver.parameters.control_interval = 0.05
+    automator.start(driver.drive_spline(Spline.from_poses(Pose(x=0, y=0, yaw=0), Pose(x=2, y=0, yaw=0))))
+    await forward(x=2)
+    assert_pose(2, 0, deg=0)
+    stats = driver.loop_stats
+    assert stats.num_iterations == pytest.approx(2 / driver.parameters.linear_speed_limit / 0.05, rel=0.2)
+    assert stats.jitter < 0.05
+    assert 0 < stats.mean_compute_time <= stats.max_compute_time
+
+
 async def test_aborting_a_drive(driver: Driver, automator: Automator, robot: Robot):
     assert_pose(0, 0, deg=0)
     automator.start(driver.drive_spline(Spline.from_poses(Pose(x=0), Pose(x=2))))
@@ -1,6 +1,11 @@
+import pickle
+
+import numpy as np
 import pytest
 
-from rosys.geometry import Line, LineSegment, Point, Pose, PoseStep, Rectangle
+from rosys import persistence
+from rosys.driving import PathSegment
+from rosys.geometry import Line, LineSegment, Point, Pose, PoseStep, Rectangle, Spline, SplineBatch
 from rosys.testing import approx
 
 
@@ -73,3 +78,47 @@ def test_rectangle_contains_point():
     assert not rectangle.contains(out2)
     assert rectangle.contains(in1)
     assert rectangle.contains(in2)
+
+
+def test_spline_batch():
+    rng = np.random.default_rng(0)
+    starts = rng.uniform(-5, 5, (100, 3))
+    ends = rng.uniform(-5, 5, (100, 3))
+    backward = rng.random(100) < 0.5
+    splines = [Spline.from_poses(Pose(x=s[0], y=s[1], yaw=s[2]), Pose(x=e[0], y=e[1], yaw=e[2]), backward=b)
+               for s, e, b in zip(starts, ends, backward, strict=True)]
+    batch = SplineBatch.from_poses(starts, ends, backward=backward)
+    assert np.allclose(batch.points, SplineBatch.from_splines(splines).points)
+
+    t = rng.random((100, 5))
+    assert np.allclose(batch.x(t), [s.x(t_) for s, t_ in zip(splines, t, strict=True)])
+    assert np.allclose(batch.yaw(t[:, 0]), [s.yaw(t_) for s, t_ in zip(splines, t[:, 0], strict=True)])
+    assert np.allclose(batch.curvature(0.5), [s.curvature(0.5) for s in splines])
+    assert np.allclose(batch.max_curvature(), [s.max_curvature() for s in splines])
+    assert np.array_equal(batch.healthy(), [abs(s.max_curvature()) < 10 for s in splines])
+    assert np.allclose(batch.closest_point(1.0, 2.0), [s.closest_point(1.0, 2.0) for s in splines])
+    assert np.allclose(batch.estimated_length(), [s.estimated_length() for s in splines])
+
+    path = batch[:3].to_path()
+    assert [segment.backward for segment in path] == backward[:3].tolist()
+    assert np.array_equal(SplineBatch.from_path(path).points, batch.points[:3])
+    assert np.array_equal(SplineBatch.from_path([PathSegment(spline=splines[0])]).backward, [False])
+
+
+def test_spline_arc_length():
+    spline = Spline.from_poses(Pose(x=0, y=0, yaw=0), Pose(x=4, y=0, yaw=0))
+    assert spline.arc_length(1.0) == pytest.approx(4.0)
+    assert spline.arc_length(np.array([0.0, 1.0])) == pytest.approx([0.0, 4.0])
+    assert spline.arc_length(spline.parameter_at(1.5)) == pytest.approx(1.5)
+    assert spline.parameter_at(10.0) == 1.0
+
+    data = persistence.to_dict(PathSegment(spline=spline))
+    assert '_arc_length_table' not in data['spline']
+    assert persistence.from_dict(PathSegment, data).spline == spline
+    assert pickle.loads(pickle.dumps(spline))._arc_length_table is None  # pylint: disable=protected-access
+
+    rng = np.random.default_rng(0)
+    spline = Spline.from_poses(Pose(x=0, y=0, yaw=0), Pose(x=3, y=2, yaw=1.0))
+    for x, y in rng.uniform(-1, 4, (100, 2)):
+        t = spline.closest_point(x, y)
+        assert spline.closest_point(x, y, t_start=t + rng.uniform(-0.05, 0.05)) == pytest.approx(t, abs=1e-6)
@@ -1,6 +1,6 @@
 import numpy as np
 
-from rosys.driving import Odometer
+from rosys.driving import Odometer, PoseHistory
 from rosys.event import Event
 from rosys.geometry import Pose, Velocity
 from rosys.testing import approx
@@ -34,6 +34,43 @@ async def test_odometer():
     assert odometer.get_pose(8.5) == Pose(x=8.5, time=8.5)
 
 
+async def test_arc_integration():
+    odometer = Odometer(DummyVelocityProvider())
+    odometer.handle_velocities([Velocity(linear=1.0, angular=1.0, time=t) for t in np.linspace(0, np.pi, 5)])
+    approx(odometer.prediction, Pose(x=0.0, y=2.0, yaw=np.pi, time=np.pi))
+
+    velocities = [Velocity(linear=np.sin(t), angular=np.cos(t), time=t) for t in np.linspace(0, 10, 100)]
+    batch_odometer = Odometer(DummyVelocityProvider())
+    batch_odometer.handle_velocities(velocities)
+    single_odometer = Odometer(DummyVelocityProvider())
+    for velocity in velocities:
+        single_odometer.handle_velocities([velocity])
+    assert np.allclose(batch_odometer.history.rows, single_odometer.history.rows)
+
+
+def test_pose_history():
+    history = PoseHistory(capacity=3)
+    for t in range(10):
+        history.append(t, t, 0, 0)
+    assert len(history) == 3
+    assert history[0] == Pose(x=7.0, time=7.0)
+    assert history[-2:] == [Pose(x=8.0, time=8.0), Pose(x=9.0, time=9.0)]
+    history.prune(7.5)
+    assert history.times.tolist() == [8.0, 9.0]
+
+
+async def test_get_poses():
+    odometer = Odometer(DummyVelocityProvider())
+    for t in range(11):
+        odometer.handle_velocities([Velocity(linear=1.0, angular=0.0, time=t)])
+    odometer.handle_detection(Pose(x=5.5, time=5.0))
+    times = np.array([-1.0, 2.5, 8.5, 12.0])
+    poses = odometer.get_poses(times)
+    assert poses.tolist() == [[p.time, p.x, p.y, p.yaw] for p in (odometer.get_pose(t) for t in times)]
+    local_poses = odometer.get_poses(times, local=True)
+    assert local_poses.tolist() == [[p.time, p.x, p.y, p.yaw] for p in (odometer.get_pose(t, local=True) for t in times)]
+
+
 def test_odometry_frame():
     local_pose = Pose(x=2.0, y=-0.5, yaw=np.deg2rad(45), time=1)
     detection = Pose(x=1.5, y=4.0, yaw=np.deg2rad(135), time=2)
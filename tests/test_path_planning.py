@@ -1,16 +1,30 @@
 import asyncio
+import math
 import time
 import uuid
+from multiprocessing import Pipe
+from pathlib import Path
 
 import numpy as np
 import pytest
+from matplotlib.path import Path as MplPath
 
 from rosys.automation import Automator
 from rosys.driving import Driver
 from rosys.geometry import Point, Pose, Prism, Spline
 from rosys.hardware import Robot
-from rosys.pathplanning import Obstacle, PathPlanner
+from rosys.pathplanning import Area, Obstacle, PathPlanner, benchmark
+from rosys.pathplanning.binary_renderer import BinaryRenderer
+from rosys.pathplanning.delaunay_graph import DelaunayGraph
 from rosys.pathplanning.delaunay_planner import DelaunayPlanner
+from rosys.pathplanning.distance_map import DistanceMap
+from rosys.pathplanning.grid import Grid
+from rosys.pathplanning.map_cache import MapCache
+from rosys.pathplanning.obstacle_map import ObstacleMap
+from rosys.pathplanning.planner_process import PlannerProcess, PlannerTestCommand, PlannerWorldCommand
+from rosys.pathplanning.robot_renderer import RobotRenderer
+from rosys.pathplanning.shared_obstacle_map import SharedObstacleMap
+from rosys.pathplanning.tiled_obstacle_map import DISTANCE_MARGIN, TiledObstacleMap
 from rosys.testing import assert_point, forward
 
 
@@ -51,11 +65,35 @@ async def test_not_finding_a_path(path_planner: PathPlanner) -> None:
     await forward(1.0)
     obstacle = create_obstacle(x=2, y=0)
     path_planner.obstacles[obstacle.id] = obstacle
-    with pytest.raises(TimeoutError):
-        await path_planner.search(start=Pose(), goal=Pose(x=1, y=0), timeout=0.1)
     with pytest.raises(RuntimeError):
         await path_planner.search(start=Pose(), goal=Pose(x=2, y=0))
 
+    for x in range(15):
+        for y in range(15):
+            obstacle = create_obstacle(x=4 * x + 2, y=4 * y + 2)
+            path_planner.obstacles[obstacle.id] = obstacle
+    with pytest.raises(TimeoutError):
+        await path_planner.search(start=Pose(), goal=Pose(x=60, y=60), timeout=0.1)
+
+
+async def test_search_many(path_planner: PathPlanner) -> None:
+    await forward(1.0)
+    obstacle = create_obstacle(x=2, y=0)
+    path_planner.obstacles[obstacle.id] = obstacle
+
+    goals = [Pose(x=4, y=0), Pose(x=2, y=0), Pose(x=1, y=2)]
+    paths = await path_planner.search_many(start=Pose(), goals=goals)
+    assert paths[0] is not None and paths[2] is not None
+    assert_point(paths[0][-1].spline.end, goals[0].point)
+    assert_point(paths[2][-1].spline.end, goals[2].point)
+    assert paths[1] is None, 'the goal is inside the obstacle'
+
+    costs = await path_planner.cost_matrix([Pose(), *goals])
+    assert costs.shape == (4, 4)
+    assert np.all(np.diag(costs) == 0)
+    assert costs[0, 1] > 4, 'the path has to avoid the obstacle'
+    assert np.isinf(costs[0, 2])
+
 
 async def test_test_spline(path_planner: PathPlanner) -> None:
     await forward(1.0)
@@ -68,6 +106,49 @@ async def test_test_spline(path_planner: PathPlanner) -> None:
     assert await path_planner.test_spline(spline) is True
 
 
+async def test_test_splines(path_planner: PathPlanner) -> None:
+    await forward(1.0)
+
+    obstacle = create_obstacle(x=2, y=1)
+    path_planner.obstacles[obstacle.id] = obstacle
+    splines = [
+        Spline.from_poses(Pose(x=0, y=0), Pose(x=2, y=1)),
+        Spline.from_poses(Pose(x=0, y=0), Pose(x=2, y=-2)),
+        Spline.from_poses(Pose(x=0, y=0), Pose(x=-2, y=1, yaw=math.pi), backward=True),
+    ]
+    assert await path_planner.test_splines(splines, [False, False, True]) == [True, False, False]
+    assert await path_planner.test_splines([]) == []
+
+
+def test_binary_renderer() -> None:
+    rng = np.random.default_rng(0)
+    xx, yy = np.meshgrid(np.arange(50), np.arange(40))
+    for i in range(100):
+        points = rng.uniform(-5, 55, (rng.integers(3, 10), 2))
+        if i % 2:
+            points = np.round(points)  # NOTE: pixel centers on edges and vertices
+        renderer = BinaryRenderer((40, 50))
+        renderer.polygon(points)
+        inside = MplPath(points).contains_points(np.column_stack((xx.ravel(), yy.ravel()))).reshape(xx.shape)
+        assert np.array_equal(renderer.map[:-1, :-1], inside[:-1, :-1])
+
+
+def test_robot_renderer_cache(shape: Prism) -> None:
+    kernel = RobotRenderer(shape.outline).render(0.1, np.pi / 4)
+    assert RobotRenderer(list(shape.outline)).render(0.1, np.pi / 4) is kernel, 'kernels are shared'
+    assert not kernel.flags.writeable
+    assert RobotRenderer(shape.outline).render(0.1, 0.0) is not kernel
+    assert RobotRenderer(shape.outline).render(0.2, np.pi / 4).shape[0] < kernel.shape[0]
+
+
+def test_benchmark() -> None:
+    results = benchmark.run_scenario(benchmark.experiment_scenarios()[2])
+    assert [r.stage for r in results] == ['map', 'graph', 'search', 'test_spline', 'test_splines', 'get_distance']
+    assert all(r.duration > 0 and r.peak_memory >= 0 for r in results)
+    assert 'num_segments' in results[2].info, 'path found'
+    assert results[3].info == results[4].info, 'single and batched spline tests agree'
+
+
 def test_grow_map(shape: Prism) -> None:
     planner = DelaunayPlanner(shape.outline)
     assert planner.obstacle_map is None
@@ -83,6 +164,238 @@ def test_grow_map(shape: Prism) -> None:
     assert planner.obstacle_map.grid.bbox == pytest.approx((-2.4, -2.4, 8.6, 5.8))
 
 
+def test_incremental_obstacle_update(shape: Prism) -> None:
+    planner = DelaunayPlanner(shape.outline)
+    obstacles = [create_obstacle(x=2, y=0), create_obstacle(x=6, y=3, radius=1.0)]
+    points = [Point(x=0, y=0), Point(x=10, y=5)]
+    planner.update_map([], obstacles, points, time.time() + 3.0)
+    tri_points = planner.tri_points
+
+    for new_obstacles in [[*obstacles, create_obstacle(x=4, y=1)], obstacles[1:], []]:
+        planner.update_map([], new_obstacles, points, time.time() + 3.0)
+        assert planner.tri_points is tri_points, 'the graph should not have been rebuilt'
+        assert planner.obstacle_map is not None
+        obstacle_map = ObstacleMap.from_world(shape.outline, [], new_obstacles, planner.obstacle_map.grid)
+        assert np.array_equal(planner.obstacle_map.stack, obstacle_map.stack)
+        assert np.allclose(planner.obstacle_map.dist_stack, obstacle_map.dist_stack)
+
+    planner.update_map([], [create_obstacle(x=5, y=2.5)], points, time.time() + 3.0)
+    path = planner.search(Pose(x=0, y=0), Pose(x=10, y=5))
+    assert not any(planner.obstacle_map.test_spline(segment.spline, segment.backward) for segment in path)
+
+
+def test_parallel_obstacle_map_creation(shape: Prism) -> None:
+    obstacles = [create_obstacle(x=2, y=0), create_obstacle(x=6, y=3, radius=1.0)]
+    grid = Grid.from_points([Point(x=0, y=0), Point(x=10, y=5)], pixel_size=0.1, num_layers=36, padding=1.0)
+    serial_map = ObstacleMap.from_world(shape.outline, [], obstacles, grid)
+    parallel_map = ObstacleMap.from_world(shape.outline, [], obstacles, grid, workers=4)
+    assert np.array_equal(serial_map.stack, parallel_map.stack)
+    assert np.array_equal(serial_map.dist_stack, parallel_map.dist_stack)
+
+
+def test_compact_obstacle_map(shape: Prism) -> None:
+    obstacles = [create_obstacle(x=2, y=0), create_obstacle(x=6, y=3, radius=1.0)]
+    planner = DelaunayPlanner(shape.outline, compact=True)
+    planner.update_map([], obstacles, [Point(x=0, y=0), Point(x=10, y=5)], time.time() + 3.0)
+    planner.update_map([], [*obstacles, create_obstacle(x=4, y=1)], [], time.time() + 3.0)
+    assert planner.obstacle_map is not None
+    compact_map = planner.obstacle_map
+    obstacle_map = ObstacleMap.from_world(shape.outline, [], planner.obstacles, compact_map.grid)
+    assert compact_map.stack.nbytes * 8 == pytest.approx(obstacle_map.stack.nbytes, rel=0.05)
+    assert compact_map.dist_stack.nbytes * 4 == obstacle_map.dist_stack.nbytes
+
+    rng = np.random.default_rng(0)
+    x, y, yaw = rng.uniform(-2, 12, 1000), rng.uniform(-2, 7, 1000), rng.uniform(-np.pi, np.pi, 1000)
+    assert np.array_equal(compact_map.test(x, y, yaw), obstacle_map.test(x, y, yaw))
+    assert np.allclose(compact_map.get_distance(x, y, yaw), obstacle_map.get_distance(x, y, yaw), atol=0.001)
+
+    path = planner.search(Pose(x=0, y=0), Pose(x=10, y=5))
+    assert not any(obstacle_map.test_spline(segment.spline, segment.backward) for segment in path)
+
+
+def test_tiled_obstacle_map(shape: Prism) -> None:
+    areas = [
+        Area(id='a', outline=[Point(x=-2, y=-2), Point(x=12, y=-2), Point(x=12, y=4), Point(x=-2, y=4)]),
+        Area(id='b', outline=[Point(x=300, y=-2), Point(x=314, y=-2), Point(x=314, y=4), Point(x=300, y=4)]),
+    ]
+    obstacles = [create_obstacle(x=5, y=1), create_obstacle(x=305, y=1)]
+    planner = DelaunayPlanner(shape.outline, tile_size=50)
+    planner.update_map(areas, obstacles, [], time.time() + 10.0)
+    tiled_map = planner.obstacle_map
+    assert isinstance(tiled_map, TiledObstacleMap)
+    assert len(tiled_map.tiles) < np.prod(tiled_map.grid.tile_shape) / 4, 'the space between the areas is not used'
+
+    obstacle_map = ObstacleMap.from_world(shape.outline, areas, obstacles, tiled_map.grid)
+    for tile, tile_map in tiled_map.tiles.items():
+        row0, row1, col0, col1 = tiled_map.grid.tile_bounds(tile)
+        assert np.array_equal(tile_map.stack, obstacle_map.stack[row0:row1, col0:col1])
+    rng = np.random.default_rng(0)
+    x, y, yaw = rng.uniform(-5, 320, 100_000), rng.uniform(-5, 7, 100_000), rng.uniform(-np.pi, np.pi, 100_000)
+    assert np.array_equal(tiled_map.test(x, y, yaw), obstacle_map.test(x, y, yaw))
+    assert np.allclose(tiled_map.get_distance(x, y, yaw),
+                       np.minimum(obstacle_map.get_distance(x, y, yaw), DISTANCE_MARGIN))
+
+    new_obstacles = [*obstacles, create_obstacle(x=8, y=1)]
+    planner.update_map(areas, new_obstacles, [], time.time() + 10.0)
+    assert planner.obstacle_map is tiled_map, 'the map should have been updated in place'
+    rebuilt_map = TiledObstacleMap.from_world(shape.outline, areas, new_obstacles, tiled_map.grid)
+    for tile, tile_map in tiled_map.tiles.items():
+        assert np.array_equal(tile_map.stack, rebuilt_map.tiles[tile].stack)
+
+    path = planner.search(Pose(x=301, y=0), Pose(x=312, y=2))
+    assert not any(tiled_map.test_spline(segment.spline, segment.backward) for segment in path)
+
+
+def test_distance_map(shape: Prism) -> None:
+    grid = Grid((60, 80, 36), (0, 0, 16.0, 12.0))
+    wall = [0.0, 6.0, 11.8, 0.2]  # with a gap at x > 12
+    obstacle_map = ObstacleMap.from_list(grid, [wall], RobotRenderer(shape.outline))
+    distance_map = DistanceMap(obstacle_map, Point(x=4.0, y=2.0))
+
+    assert distance_map.interpolate(4.0, 2.0) == pytest.approx(0.0, abs=0.2)
+    assert distance_map.interpolate(8.0, 2.0) == pytest.approx(4.0, abs=0.2)
+    assert distance_map.interpolate(4.0, 6.1) == np.inf, 'obstacles are infinitely far away'
+    assert distance_map.interpolate(4.0, 10.0) > np.hypot(12.0 - 4.0, 6.0 - 2.0) + np.hypot(12.0 - 4.0, 10.0 - 6.0)
+
+    x, y = np.meshgrid(np.linspace(0, 16, 7), np.linspace(0, 12, 5))
+    assert distance_map.interpolate(x, y).shape == x.shape
+    gradient_x, gradient_y = distance_map.gradient(np.array([8.0, 4.0]), np.array([2.0, 4.0]))
+    assert gradient_x[0] > 0 and gradient_y[1] > 0, 'the distance increases away from the target'
+
+
+def test_anytime_search(shape: Prism) -> None:
+    wall = Obstacle(id='wall', outline=[Point(x=3, y=-3), Point(x=3.5, y=-3), Point(x=3.5, y=3), Point(x=3, y=3)])
+    planner = DelaunayPlanner(shape.outline)
+    planner.update_map([], [wall], [Point(x=0, y=-6), Point(x=7, y=6)], time.time() + 3.0)
+    start, goal = Pose(x=1, y=0), Pose(x=6, y=0)
+    assert planner.obstacle_map is not None
+
+    path = planner.search(start, goal)
+    cost = planner.search_history[-1].cost
+
+    first_path = planner.search(start, goal, deadline=time.time() - 1.0)
+    assert len(planner.search_history) == 1, 'the first path is returned when the deadline has already passed'
+    assert not any(planner.obstacle_map.test_spline(segment.spline, segment.backward) for segment in first_path)
+
+    best_path = planner.search(start, goal, deadline=time.time() + 2.0)
+    times = [improvement.time for improvement in planner.search_history]
+    assert times == sorted(times)
+    assert planner.search_history[-1].cost <= cost + 1e-6, 'the anytime search is at least as good as the full search'
+    assert len(best_path) <= len(path)
+    assert not any(planner.obstacle_map.test_spline(segment.spline, segment.backward) for segment in best_path)
+
+
+def test_search_shortens_cheapest_graph_path(shape: Prism) -> None:
+    wall = Obstacle(id='wall', outline=[Point(x=3, y=-3), Point(x=3.5, y=-3), Point(x=3.5, y=3), Point(x=3, y=3)])
+    planner = DelaunayPlanner(shape.outline)
+    planner.update_map([], [wall], [Point(x=0, y=-6), Point(x=7, y=6)], time.time() + 3.0)
+    start, goal = Pose(x=1, y=0), Pose(x=6, y=0)
+
+    path = planner.search(start, goal)
+    cost = planner.cost_matrix([start, goal])[0, 1]
+    assert planner.search_history[0].cost == pytest.approx(cost, rel=0.01), \
+        'the cheapest combination of entry, graph path and exit is shortened'
+    assert planner.search_history[-1].num_segments == len(path)
+    assert planner.search_history[-1].cost <= planner.search_history[0].cost
+
+
+def test_map_cache(shape: Prism, tmp_path: Path) -> None:
+    obstacles = [create_obstacle(x=2, y=0), create_obstacle(x=6, y=3, radius=1.0)]
+    points = [Point(x=0, y=0), Point(x=10, y=5)]
+    planner = DelaunayPlanner(shape.outline, cache=MapCache(tmp_path))
+    planner.update_map([], obstacles, points, time.time() + 3.0)
+    planner.store_cache()
+    assert len(list(tmp_path.iterdir())) == 1
+
+    cached_planner = DelaunayPlanner(shape.outline, cache=MapCache(tmp_path))
+    cached_planner.update_map([], obstacles, points, time.time() + 3.0)
+    assert planner.obstacle_map is not None and cached_planner.obstacle_map is not None
+    assert planner.graph is not None and cached_planner.graph is not None
+    assert np.array_equal(cached_planner.obstacle_map.stack, planner.obstacle_map.stack)
+    assert np.array_equal(cached_planner.obstacle_map.dist_stack, planner.obstacle_map.dist_stack)
+    assert np.array_equal(cached_planner.graph.indices, planner.graph.indices)
+    assert np.array_equal(cached_planner.graph.weights, planner.graph.weights)
+
+    cached_planner.update_map([], obstacles[:1], points, time.time() + 3.0)
+    cached_planner.store_cache()
+    assert len(list(tmp_path.iterdir())) == 1, 'incrementally updated maps should not be stored'
+    reloaded_planner = DelaunayPlanner(shape.outline, cache=MapCache(tmp_path))
+    reloaded_planner.update_map([], obstacles, points, time.time() + 3.0)
+    assert reloaded_planner.obstacle_map is not None
+    assert np.array_equal(reloaded_planner.obstacle_map.stack, planner.obstacle_map.stack), \
+        'updates should not modify the cache'
+
+
+def test_shared_obstacle_map(shape: Prism) -> None:
+    planner = DelaunayPlanner(shape.outline)
+    points = [Point(x=0, y=0), Point(x=10, y=5)]
+    reader = SharedObstacleMap()
+    writer = SharedObstacleMap(reader.name)
+    try:
+        assert reader.read(lambda m: m.get_distance(0, 0, 0)) is None
+        with writer.modifying():
+            planner.update_map([], [create_obstacle(x=2, y=0)], points, time.time() + 3.0)
+            writer.publish(planner.obstacle_map, 'a')
+            assert reader.read(lambda m: m.get_distance(0, 0, 0)) is None, 'the map is being modified'
+        assert planner.obstacle_map is not None
+        assert reader.read(lambda m: float(m.get_distance(0, 0, 0)[0])) == \
+            ('a', float(planner.obstacle_map.get_distance(0, 0, 0)[0]))
+
+        with writer.modifying():
+            planner.update_map([], [create_obstacle(x=1.5, y=0)], points, time.time() + 3.0)
+            writer.publish(planner.obstacle_map, 'b')
+        state, stack = reader.read(lambda m: m.stack.copy()) or ('', None)
+        assert state == 'b'
+        assert np.array_equal(stack, planner.obstacle_map.stack), 'in-place updates should be visible'
+    finally:
+        writer.close()
+        reader.close()
+
+
+def test_world_versions(shape: Prism) -> None:
+    process = PlannerProcess(Pipe()[1], shape.outline)
+    obstacle = create_obstacle(x=2, y=0)
+    spline = Spline.from_poses(Pose(x=0, y=0), Pose(x=4, y=0))
+    process.update_world(PlannerWorldCommand(version=1, obstacles=[obstacle], deadline=math.inf))
+    process.update_map(PlannerTestCommand(version=1, spline=spline, deadline=time.time() + 3.0), [spline.start, spline.end])
+    assert process.planner.obstacle_map is not None
+    assert process.planner.obstacle_map.test_spline(spline)
+    tri_points = process.planner.tri_points
+
+    process.update_world(PlannerWorldCommand(version=2, removed_obstacles=[obstacle.id], deadline=math.inf))
+    process.update_map(PlannerTestCommand(version=2, spline=spline, deadline=time.time() + 3.0), [spline.start, spline.end])
+    assert not process.planner.obstacle_map.test_spline(spline)
+    assert process.planner.tri_points is tri_points, 'the graph should have been updated incrementally'
+
+    obstacle_map = process.planner.obstacle_map
+    with pytest.raises(RuntimeError):
+        process.update_map(PlannerTestCommand(version=1, spline=spline, deadline=time.time() + 3.0), [spline.start])
+    assert process.planner.obstacle_map is obstacle_map, 'an unknown version should not invalidate the map'
+    assert process.map_state == '2'
+
+
+def test_delaunay_graph_search() -> None:
+    # NOTE: 3 groups with 1 pose each, candidates 0->1 (free), 1->2 (free), 2->1 (blocked), 0->2 (free but long)
+    graph = DelaunayGraph(
+        group_offsets=np.array([0, 1, 2, 3]),
+        candidate_sources=np.array([0, 1, 2, 0]),
+        candidate_targets=np.array([1, 2, 1, 2]),
+        candidate_lengths=np.array([1.0, 1.0, np.nan, 5.0]),
+    )
+    assert graph.num_edges == 6
+    edge = graph.edge(2, 1)
+    assert edge is not None and graph.backward[edge]
+    assert graph.search({0: 0.0}, {2: 0.0}) == [0, 1, 2]
+    assert graph.search({0: 0.0, 1: 0.5}, {2: 0.0}) == [1, 2]
+    assert graph.search({2: 0.0}, {0: 0.0}) == [2, 1, 0]
+    assert graph.search_many({0: 0.0}, [{2: 0.0}, {1: 0.5}, {}]) == [[0, 1, 2], [0, 1], None]
+    assert np.allclose(graph.cost_matrix([{0: 0.0}, {2: 1.0}], [{0: 0.0}, {2: 0.0}]),
+                       [[0.0, 2.0], [1.0 + 2 * 1.2, 1.0]])
+
+    graph.update_candidates(np.array([1]), np.array([np.nan]))
+    assert graph.search({0: 0.0}, {2: 0.0}) == [0, 2]
+
+
 async def test_overlapping_commands(path_planner: PathPlanner) -> None:
     await forward(1.0)
 
@@ -96,3 +409,17 @@ async def test_overlapping_commands(path_planner: PathPlanner) -> None:
     path, test = await asyncio.gather(task1, task2)
     assert isinstance(path, list)
     assert isinstance(test, bool)
+
+
+async def test_multiple_planner_processes(shape: Prism, rosys_integration: None) -> None:
+    path_planner = PathPlanner(shape, processes=2)
+    await asyncio.wait_for(forward(1.0), timeout=10.0)
+    # NOTE: spawning the processes can take a while, so wait until both of them respond
+    await asyncio.wait_for(path_planner.grow_map([Point(x=0, y=0)], timeout=30.0), timeout=35.0)
+
+    search = asyncio.create_task(path_planner.search(start=Pose(), goal=Pose(x=10.0, y=1.0)))
+    distance = asyncio.create_task(path_planner.get_obstacle_distance(Pose()))
+    await asyncio.sleep(0)
+    assert [len(responses) for responses in path_planner.responses] == [1, 1]
+    assert isinstance(await asyncio.wait_for(search, timeout=5.0), list)
+    assert await asyncio.wait_for(distance, timeout=5.0) > 0